@@ -0,0 +1,211 @@
+import asyncio
+import logging
+from datetime import date, datetime, timedelta
+
+from config import AGGREGATES_DAYS, AGGREGATES_REFRESH_INTERVAL, WORK_DAY_START, LATE_GRACE_MINUTES
+from db import pool, ALL_DAYS
+from metrics import db_query
+from pairing import refresh_notes
+from schema import (
+    DAILY_ATTENDANCE_ROLLUP, DAILY_ATTENDANCE_DAYS_DELETE, DAILY_ATTENDANCE_DAYS_ROLLUP, DAILY_ATTENDANCE_LOCK_ID,
+    CHECKPOINT_DAILY_ATTENDANCE, WATERMARK_OVERLAP,
+)
+
+logger = logging.getLogger(__name__)
+
+# Advisory-блокировка пересчёта: при нескольких экземплярах бота считает один
+AGGREGATES_LOCK_ID = 7_310_003
+
+CHECKPOINT_DEPARTMENT_DAILY = "department_daily_stats"
+
+# Дни сводки, затронутые операциями после отметки: операция относится
+# к последней смене пользователя, начатой не позже неё
+TOUCHED_DAYS = """
+    SELECT o.user_id, sh.started_at::date, MAX(o.created_at), MIN(o.created_at)::date
+    FROM operations o
+    LEFT JOIN LATERAL (
+        SELECT started_at
+        FROM shifts
+        WHERE user_id = o.user_id AND started_at <= o.created_at
+        ORDER BY started_at DESC
+        LIMIT 1
+    ) sh ON TRUE
+    WHERE o.created_at > %s
+    GROUP BY o.user_id, sh.started_at::date
+"""
+
+# Показатели отделов за дни days по сводкам daily_attendance (roll_up
+# выполняется перед пересчётом). Смена относится к дню своего начала; у открытой
+# смены время работы и текущий перерыв считаются по shifts до текущего момента.
+# Опоздание — первая смена сотрудника за день началась позже начала рабочего
+# дня с допустимым опозданием (late_after). Дни только с замечаниями
+# (shift_count = 0) не учитываются.
+DEPARTMENT_DAILY_REFRESH = """
+    INSERT INTO department_daily_stats
+        (day, department, employees, shifts, worked_seconds, break_seconds, late_starts)
+    SELECT d.day, COALESCE(u.department, ''), COUNT(*), SUM(d.shift_count),
+        SUM(d.worked_seconds + COALESCE(o.worked_seconds, 0)), SUM(d.break_seconds + COALESCE(o.break_seconds, 0)),
+        COUNT(*) FILTER (WHERE d.first_start > d.day + %(late_after)s)
+    FROM daily_attendance d
+    JOIN users u ON u.id = d.user_id
+    LEFT JOIN LATERAL (
+        SELECT SUM(GREATEST(EXTRACT(EPOCH FROM LOCALTIMESTAMP - s.started_at) - s.break_seconds - s.current_break,
+                            0)) AS worked_seconds,
+            SUM(s.current_break) AS break_seconds
+        FROM (
+            SELECT started_at, break_seconds,
+                COALESCE(EXTRACT(EPOCH FROM LOCALTIMESTAMP - break_started_at), 0) AS current_break
+            FROM shifts
+            WHERE user_id = d.user_id AND started_at >= d.day AND started_at < d.day + 1 AND ended_at IS NULL
+        ) s
+    ) o ON d.last_end IS NULL
+    WHERE d.day = ANY(%(days)s::date[]) AND d.shift_count > 0
+    GROUP BY d.day, COALESCE(u.department, '')
+"""
+
+
+async def save_checkpoint(conn, name: str, checkpoint):
+    await conn.execute("""
+        INSERT INTO aggregate_checkpoints (name, checkpoint, refreshed_at)
+        VALUES (%s, %s, LOCALTIMESTAMP)
+        ON CONFLICT (name) DO UPDATE
+        SET checkpoint = EXCLUDED.checkpoint, refreshed_at = EXCLUDED.refreshed_at
+    """, (name, checkpoint))
+
+
+class AttendanceAggregates:
+    """
+    Сводные таблицы, которые пересчитываются каждые interval секунд.
+
+    daily_attendance — дневные сводки сотрудников (schema.py, миграция 10),
+    по ним строятся отчёты. Учитываются только операции новее отметки
+    в aggregate_checkpoints: пересчитываются дни смен, к которым они
+    относятся, и замечания (pairing.refresh_notes) с этих дней. Правки журнала в админке пересобирают затронутые смены
+    пользователя (db.apply_operation_edits), и там же пересчитываются
+    сводки их дней.
+
+    department_daily_stats — показатели для панели в админке по сводкам
+    daily_attendance: по отделам и дням — сотрудники, смены, отработанное
+    время, перерывы и опоздания за последние days дней. Пересчитываются сегодня и вчера (открытые и ночные
+    смены) и дни, отмеченные в report_watermarks после прошлого пересчёта
+    (правки в админке, пересборка смен). Отметка ALL_DAYS (изменён
+    пользователь, например отдел) пересчитывает всё окно.
+    """
+
+    def __init__(self, days: int, interval: int, work_day_start: str, late_grace_minutes: int):
+        self.days = days
+        self.interval = interval
+        start = datetime.strptime(work_day_start, "%H:%M")
+        self.late_after = timedelta(hours=start.hour, minutes=start.minute + late_grace_minutes)
+        self._processed = set()
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._loop())
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.roll_up()
+                await self.refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Не удалось пересчитать сводные показатели")
+            await asyncio.sleep(self.interval)
+
+    @db_query
+    async def roll_up(self, wait: bool = False) -> bool:
+        """
+        Учитывает в daily_attendance операции новее отметки. С wait=True ждёт
+        пересчёт в другом экземпляре (перед построением отчёта), иначе
+        возвращает False, если пересчёт уже идёт.
+        """
+        async with pool.connection() as conn:
+            if wait:
+                await conn.execute("SELECT pg_advisory_xact_lock(%s)", (DAILY_ATTENDANCE_LOCK_ID,))
+            else:
+                cur = await conn.execute("SELECT pg_try_advisory_xact_lock(%s)", (DAILY_ATTENDANCE_LOCK_ID,))
+                if not (await cur.fetchone())[0]:
+                    return False
+            cur = await conn.execute("SELECT checkpoint FROM aggregate_checkpoints WHERE name = %s",
+                                     (CHECKPOINT_DAILY_ATTENDANCE,))
+            stored = await cur.fetchone()
+            if stored is None:
+                # Сводки ещё не считались (например, таблица очищена): всё заново
+                await conn.execute("DELETE FROM daily_attendance")
+                await conn.execute(DAILY_ATTENDANCE_ROLLUP, {"user_id": None})
+                cur = await conn.execute("SELECT id FROM users")
+                await refresh_notes(conn, {user_id: (date.min, None) for user_id, in await cur.fetchall()})
+                cur = await conn.execute("SELECT MAX(created_at) FROM operations")
+                checkpoint = (await cur.fetchone())[0]
+            else:
+                checkpoint = stored[0]
+                cur = await conn.execute(TOUCHED_DAYS, (
+                    checkpoint - WATERMARK_OVERLAP if checkpoint else datetime.min,))
+                touched = await cur.fetchall()
+                pairs = sorted({(user_id, day) for user_id, day, _, _ in touched if day is not None})
+                if pairs:
+                    params = {"user_ids": [user_id for user_id, _ in pairs], "days": [day for _, day in pairs]}
+                    await conn.execute(DAILY_ATTENDANCE_DAYS_DELETE, params)
+                    await conn.execute(DAILY_ATTENDANCE_DAYS_ROLLUP, params)
+                if touched:
+                    # Замечания пересчитываются с первого затронутого дня сотрудника: новая
+                    # операция меняет нарушения только в своё время и позже
+                    notes_from = {}
+                    for user_id, day, _, first_day in touched:
+                        notes_from[user_id] = min(notes_from.get(user_id, first_day), day or first_day, first_day)
+                    await refresh_notes(conn, {user_id: (day, None) for user_id, day in notes_from.items()})
+                    checkpoint = max(checkpoint or datetime.min, max(created_at for _, _, created_at, _ in touched))
+            await save_checkpoint(conn, CHECKPOINT_DAILY_ATTENDANCE, checkpoint)
+        return True
+
+    @db_query
+    async def refresh(self) -> bool:
+        """Пересчитывает изменившиеся дни; False, если пересчёт уже идёт в другом экземпляре."""
+        async with pool.connection() as conn:
+            cur = await conn.execute("SELECT pg_try_advisory_xact_lock(%s)", (AGGREGATES_LOCK_ID,))
+            if not (await cur.fetchone())[0]:
+                return False
+            cur = await conn.execute("SELECT CURRENT_DATE")
+            today = (await cur.fetchone())[0]
+            window_start = today - timedelta(days=self.days - 1)
+
+            cur = await conn.execute("SELECT checkpoint FROM aggregate_checkpoints WHERE name = %s",
+                                     (CHECKPOINT_DEPARTMENT_DAILY,))
+            stored = await cur.fetchone()
+            checkpoint = stored[0] if stored else None
+            cur = await conn.execute("""
+                SELECT day, changed_at
+                FROM report_watermarks
+                WHERE %s::timestamp IS NULL OR changed_at > %s::timestamp - %s
+            """, (checkpoint, checkpoint, WATERMARK_OVERLAP))
+            watermarks = await cur.fetchall()
+            changed = [watermark for watermark in watermarks if watermark not in self._processed]
+
+            if stored is None or any(day == ALL_DAYS for day, _ in changed):
+                days = {window_start + timedelta(days=i) for i in range(self.days)}
+            else:
+                days = {day for day, _ in changed if window_start <= day <= today}
+                days.update((today, today - timedelta(days=1)))
+            if changed:
+                checkpoint = max(checkpoint or datetime.min, max(changed_at for _, changed_at in changed))
+
+            days = sorted(days)
+            await conn.execute("DELETE FROM department_daily_stats WHERE day < %s OR day = ANY(%s)",
+                               (window_start, days))
+            await conn.execute(DEPARTMENT_DAILY_REFRESH, {"days": days, "late_after": self.late_after})
+            await save_checkpoint(conn, CHECKPOINT_DEPARTMENT_DAILY, checkpoint)
+        self._processed = set(watermarks)
+        logger.debug("Сводные показатели пересчитаны за %s дн.", len(days))
+        return True
+
+
+attendance_aggregates = AttendanceAggregates(
+    AGGREGATES_DAYS, AGGREGATES_REFRESH_INTERVAL, WORK_DAY_START, LATE_GRACE_MINUTES,
+)
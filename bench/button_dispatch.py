@@ -0,0 +1,116 @@
+"""
+Стоимость выбора обработчика для кнопок меню: прежняя цепочка фильтров
+`lambda msg: msg.text == BUTTON_...` против ButtonRouter. Обработчики пустые,
+БД и сеть не используются (FSM в памяти), измеряется только диспетчеризация
+aiogram от feed_update до вызова обработчика.
+
+Запуск из корня репозитория:
+    python -m bench.button_dispatch --updates 20000
+"""
+import argparse
+import asyncio
+import json
+import time
+from datetime import datetime
+
+from aiogram import Bot, Dispatcher, types
+from aiogram.filters import Command
+from aiogram.fsm.state import State, StatesGroup
+
+from button_router import ButtonRouter
+from config import (
+    BUTTON_WORK_TIME, BUTTON_DAY_OFF, BUTTON_START_SHIFT, BUTTON_START_BREAK,
+    BUTTON_END_SHIFT, BUTTON_END_BREAK, BUTTON_GET_REPORT,
+)
+
+# Кнопки в порядке регистрации обработчиков в bot.py
+BUTTONS = [
+    BUTTON_DAY_OFF, BUTTON_START_SHIFT, BUTTON_START_BREAK, BUTTON_END_BREAK,
+    BUTTON_END_SHIFT, BUTTON_GET_REPORT, BUTTON_WORK_TIME,
+]
+
+
+class ReportStates(StatesGroup):
+    WAITING_FOR_DATE_FROM = State()
+    WAITING_FOR_DATE_TO = State()
+    WAITING_FOR_FORMAT = State()
+
+
+async def noop(message: types.Message):
+    pass
+
+
+def register_common(dp: Dispatcher):
+    dp.message.register(noop, Command("start"))
+    dp.message.register(noop, Command("get"))
+    for state in ReportStates.__all_states__:
+        dp.message.register(noop, state)
+
+
+def legacy_dispatcher() -> Dispatcher:
+    dp = Dispatcher()
+    # Порядок как в bot.py до ButtonRouter: фильтры проверяются один за другим
+    dp.message.register(noop, lambda msg, text=BUTTONS[0]: msg.text == text)
+    register_common(dp)
+    dp.message.register(noop, lambda msg, text=BUTTONS[1]: msg.text == text)
+    dp.message.register(noop, lambda msg: msg.photo)
+    for text in BUTTONS[2:]:
+        dp.message.register(noop, lambda msg, text=text: msg.text == text)
+    return dp
+
+
+def router_dispatcher() -> Dispatcher:
+    dp = Dispatcher()
+    buttons = ButtonRouter()
+    buttons.attach(dp)
+    register_common(dp)
+    for i, text in enumerate(BUTTONS):
+        # У каждой кнопки свой обработчик, как в bot.py
+        async def handler(message: types.Message):
+            pass
+        handler.__name__ = f"button_{i}"
+        buttons.message(text)(handler)
+    buttons.message(content_type="photo")(noop)
+    return dp
+
+
+def make_update(update_id: int, text: str) -> types.Update:
+    return types.Update(
+        update_id=update_id,
+        message=types.Message(
+            message_id=update_id,
+            date=datetime.now(),
+            chat=types.Chat(id=1, type="private"),
+            from_user=types.User(id=1, is_bot=False, first_name="Bench"),
+            text=text,
+        ),
+    )
+
+
+async def measure(dp: Dispatcher, bot: Bot, text: str, updates: int) -> float:
+    batch = [make_update(i, text) for i in range(updates)]
+    started = time.perf_counter()
+    for update in batch:
+        await dp.feed_update(bot, update)
+    return (time.perf_counter() - started) / updates * 1e6
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--updates", type=int, default=20000)
+    args = parser.parse_args()
+
+    bot = Bot(token="123456:bench")
+    dispatchers = {"legacy": legacy_dispatcher(), "router": router_dispatcher()}
+    cases = {"first_button": BUTTONS[0], "last_button": BUTTONS[-1], "other_text": "произвольный текст"}
+    result = {}
+    for name, dp in dispatchers.items():
+        # Прогрев: разрешение типов обновлений, кэши aiogram
+        await measure(dp, bot, BUTTONS[0], 100)
+        result[name] = {case: round(await measure(dp, bot, text, args.updates), 2) for case, text in cases.items()}
+    await bot.session.close()
+    print(json.dumps({"us_per_update": result}, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
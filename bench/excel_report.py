@@ -0,0 +1,100 @@
+"""
+Сравнение прежней генерации Excel-отчёта (обычный Workbook, стили на каждую
+ячейку) с потоковой ExcelReportWriter на синтетических данных без БД.
+
+Запуск из корня репозитория:
+    python -m bench.excel_report --shifts 10000 100000
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from openpyxl import Workbook
+from openpyxl.styles import Alignment, Font
+
+from reports import REPORT_HEADER, ReportDay, ExcelReportWriter, format_shift_row
+
+SHIFTS_PER_USER = 100
+
+
+def synthetic_rows(shifts: int):
+    base = datetime(2025, 1, 1, 9, 0)
+    for i in range(shifts):
+        user_id = i // SHIFTS_PER_USER + 1
+        start = base + timedelta(days=i % SHIFTS_PER_USER)
+        shift = ReportDay(start.date(), start, start + timedelta(hours=9), timedelta(minutes=47, seconds=13),
+                          timedelta(hours=8, minutes=12, seconds=47), None)
+        yield user_id, f"Сотрудник {user_id}", shift
+
+
+def legacy_excel(rows, path: str):
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Отчёт"
+
+    header_font = Font(bold=True)
+    center_alignment = Alignment(horizontal="center")
+
+    last_user_id = None
+    for user_id, full_name, shift in rows:
+        if user_id != last_user_id:
+            if last_user_id is not None:
+                ws.append([])
+            ws.append([full_name])
+            ws.merge_cells(start_row=ws.max_row, start_column=1, end_row=ws.max_row, end_column=len(REPORT_HEADER))
+            ws.cell(row=ws.max_row, column=1).font = header_font
+            ws.cell(row=ws.max_row, column=1).alignment = center_alignment
+
+            ws.append(REPORT_HEADER)
+            for col in range(1, len(REPORT_HEADER) + 1):
+                ws.cell(row=ws.max_row, column=col).font = header_font
+                ws.cell(row=ws.max_row, column=col).alignment = center_alignment
+            last_user_id = user_id
+        ws.append(format_shift_row(shift))
+    ws.append([])
+    wb.save(path)
+
+
+def streaming_excel(rows, path: str):
+    writer = ExcelReportWriter(path)
+    writer.write_rows(rows)
+    writer.save()
+
+
+def measure(func, shifts: int):
+    fd, path = tempfile.mkstemp(suffix=".xlsx")
+    os.close(fd)
+    try:
+        # Время и память меряются отдельными прогонами: tracemalloc сильно замедляет код
+        started = time.perf_counter()
+        func(synthetic_rows(shifts), path)
+        wall_time = time.perf_counter() - started
+
+        tracemalloc.start()
+        func(synthetic_rows(shifts), path)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return {"wall_time_s": round(wall_time, 3), "peak_memory_mb": round(peak / 2 ** 20, 2),
+                "file_size_kb": os.path.getsize(path) // 1024}
+    finally:
+        os.remove(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--shifts", type=int, nargs="+", default=[10_000, 100_000])
+    args = parser.parse_args()
+
+    results = []
+    for shifts in args.shifts:
+        for name, func in (("legacy", legacy_excel), ("write_only", streaming_excel)):
+            results.append({"implementation": name, "shifts": shifts, **measure(func, shifts)})
+            print(json.dumps(results[-1], ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
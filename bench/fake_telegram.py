@@ -0,0 +1,249 @@
+"""
+Локальная замена Bot API для нагрузочных проверок без сети. Поддерживает
+getUpdates (long polling) и доставку на webhook, sendMessage, editMessageText,
+editMessageReplyMarkup, answerCallbackQuery, sendDocument, getFile и скачивание
+файлов (фото — одна и та же картинка photo_size байт с разным хвостом после
+конца JPEG, так что у каждого file_id своё содержимое); остальные методы
+отвечают успехом. Ответы бота складываются в очередь чата (responses),
+по ним генератор нагрузки (bench/load_test.py) считает задержки.
+
+Если заданы chat_limit/global_limit, сообщения сверх этого числа за последнюю
+секунду (в один чат или всего) отклоняются ответом 429 с retry_after, как
+при flood control в Telegram.
+
+Бот направляется на заглушку переменной TELEGRAM_API_URL.
+"""
+import asyncio
+import io
+import json
+import logging
+import time
+from collections import Counter, defaultdict, deque
+from itertools import count
+
+from aiohttp import ClientSession, web
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+BOT_USER = {"id": 123456, "is_bot": True, "first_name": "Bench bot", "username": "bench_bot"}
+
+
+def sample_photo(width: int = 1280, height: int = 960) -> bytes:
+    """JPEG для ответов на скачивание фото (шум, чтобы размер был как у настоящего фото)."""
+    if Image is None:
+        # Без Pillow — заголовок JPEG и случайные байты: фото сохраняется, копия не строится
+        return b"\xff\xd8\xff\xe0" + bytes(range(256)) * 1024 + b"\xff\xd9"
+    buffer = io.BytesIO()
+    Image.effect_noise((width, height), 64).convert("RGB").save(buffer, "JPEG", quality=85)
+    return buffer.getvalue()
+
+
+# Методы, на которые действуют ограничения частоты сообщений
+LIMITED_METHODS = {"sendMessage", "editMessageText", "editMessageReplyMarkup", "sendDocument"}
+
+
+class FakeTelegram:
+    def __init__(self, chat_limit: int = 0, global_limit: int = 0):
+        self.chat_limit = chat_limit
+        self.global_limit = global_limit
+        self.flood_errors = 0
+        self._chat_sends = defaultdict(deque)
+        self._global_sends = deque()
+        self.api_calls = Counter()
+        self.photo = sample_photo()
+        self.responses = defaultdict(asyncio.Queue)
+        self.delivered = 0
+        self._pending = deque()
+        self._has_updates = asyncio.Event()
+        self._update_ids = count(1)
+        self._message_ids = count(1)
+        self._callback_ids = count(1)
+        self._callback_chats = {}
+        self._webhook = None
+        self._session = None
+        self._deliveries = set()
+        self._runner = None
+
+    # --- обновления от "пользователей" ---
+
+    def _user(self, chat_id: int) -> dict:
+        return {"id": chat_id, "is_bot": False, "first_name": f"Employee {chat_id}", "language_code": "ru"}
+
+    def message_update(self, chat_id: int, text: str = None, photo: bool = False) -> dict:
+        message = {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": self._user(chat_id),
+        }
+        if photo:
+            file_id = f"photo_{message['message_id']}"
+            message["photo"] = [{"file_id": file_id, "file_unique_id": file_id, "width": 1280, "height": 960}]
+        else:
+            message["text"] = text
+        return {"update_id": next(self._update_ids), "message": message}
+
+    def callback_update(self, chat_id: int, message: dict, data: str) -> dict:
+        callback_id = str(next(self._callback_ids))
+        self._callback_chats[callback_id] = chat_id
+        return {
+            "update_id": next(self._update_ids),
+            "callback_query": {
+                "id": callback_id,
+                "from": self._user(chat_id),
+                "chat_instance": str(chat_id),
+                "message": message,
+                "data": data,
+            },
+        }
+
+    def push(self, update: dict):
+        self.delivered += 1
+        if self._webhook:
+            task = asyncio.create_task(self._deliver(update))
+            self._deliveries.add(task)
+            task.add_done_callback(self._deliveries.discard)
+        else:
+            self._pending.append(update)
+            self._has_updates.set()
+
+    async def _deliver(self, update: dict):
+        url, secret = self._webhook
+        headers = {"X-Telegram-Bot-Api-Secret-Token": secret} if secret else {}
+        try:
+            async with self._session.post(url, json=update, headers=headers) as resp:
+                if resp.status != 200:
+                    logger.warning("Webhook ответил %s", resp.status)
+        except Exception:
+            logger.exception("Не удалось доставить обновление на webhook")
+
+    # --- методы Bot API ---
+
+    async def _get_updates(self, params: dict):
+        offset = int(params.get("offset") or 0)
+        limit = int(params.get("limit") or 100)
+        timeout = float(params.get("timeout") or 0)
+        while self._pending and self._pending[0]["update_id"] < offset:
+            self._pending.popleft()
+        if not self._pending and timeout:
+            self._has_updates.clear()
+            try:
+                await asyncio.wait_for(self._has_updates.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return [self._pending[i] for i in range(min(limit, len(self._pending)))]
+
+    def _message(self, chat_id: int, params: dict, **extra) -> dict:
+        message = {
+            "message_id": int(params.get("message_id") or next(self._message_ids)),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": BOT_USER,
+            **extra,
+        }
+        if "text" in params:
+            message["text"] = params["text"]
+        markup = params.get("reply_markup")
+        # В Message возвращается только inline-клавиатура
+        if markup and "inline_keyboard" in markup:
+            message["reply_markup"] = markup
+        return message
+
+    async def _call(self, method: str, params: dict):
+        if method == "getUpdates":
+            return await self._get_updates(params)
+        if method == "getMe":
+            return BOT_USER
+        if method == "setWebhook":
+            self._webhook = (params["url"], params.get("secret_token"))
+            return True
+        if method == "deleteWebhook":
+            self._webhook = None
+            return True
+        if method == "getFile":
+            file_id = params["file_id"]
+            return {"file_id": file_id, "file_unique_id": file_id, "file_size": len(self.photo) + len(file_id),
+                    "file_path": f"photos/{file_id}.jpg"}
+
+        if method == "answerCallbackQuery":
+            chat_id = self._callback_chats.pop(params["callback_query_id"], None)
+            result = True
+        elif method in ("sendMessage", "editMessageText", "editMessageReplyMarkup"):
+            chat_id = int(params["chat_id"])
+            result = self._message(chat_id, params)
+        elif method == "sendDocument":
+            chat_id = int(params["chat_id"])
+            document = params.get("document")
+            size = len(document.file.read()) if hasattr(document, "file") else 0
+            result = self._message(chat_id, params, document={
+                "file_id": f"doc_{self.api_calls[method]}", "file_unique_id": f"doc_{self.api_calls[method]}",
+                "file_size": size,
+            })
+        else:
+            return True
+
+        if chat_id is not None:
+            self.responses[chat_id].put_nowait({"time": time.perf_counter(), "method": method, "result": result})
+        return result
+
+    def _flooded(self, chat_id: int) -> bool:
+        now = time.monotonic()
+        checks = []
+        if self.chat_limit:
+            checks.append((self._chat_sends[chat_id], self.chat_limit))
+        if self.global_limit:
+            checks.append((self._global_sends, self.global_limit))
+        for sends, limit in checks:
+            while sends and sends[0] <= now - 1:
+                sends.popleft()
+            if len(sends) >= limit:
+                return True
+        for sends, _ in checks:
+            sends.append(now)
+        return False
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        self.api_calls[method] += 1
+        if request.content_type == "application/json":
+            params = await request.json()
+        else:
+            params = dict(await request.post())
+        if method in LIMITED_METHODS and self._flooded(int(params["chat_id"])):
+            self.flood_errors += 1
+            return web.json_response({
+                "ok": False,
+                "error_code": 429,
+                "description": "Too Many Requests: retry after 1",
+                "parameters": {"retry_after": 1},
+            }, status=429)
+        if isinstance(params.get("reply_markup"), str):
+            params["reply_markup"] = json.loads(params["reply_markup"])
+        return web.json_response({"ok": True, "result": await self._call(method, params)})
+
+    async def _download(self, request: web.Request) -> web.Response:
+        self.api_calls["download"] += 1
+        file_id = request.match_info["path"].rsplit("/", 1)[-1].removesuffix(".jpg")
+        return web.Response(body=self.photo + file_id.encode(), content_type="image/jpeg")
+
+    async def start(self, host: str, port: int):
+        self._session = ClientSession()
+        app = web.Application(client_max_size=50 * 2 ** 20)
+        app.router.add_route("*", "/bot{token}/{method}", self._handle)
+        app.router.add_get("/file/bot{token}/{path:.+}", self._download)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+
+    async def stop(self):
+        if self._deliveries:
+            await asyncio.gather(*self._deliveries, return_exceptions=True)
+        if self._runner:
+            await self._runner.cleanup()
+        if self._session:
+            await self._session.close()
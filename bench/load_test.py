@@ -0,0 +1,157 @@
+"""
+Сквозная нагрузка на бота через локальную заглушку Bot API (bench/fake_telegram.py):
+сотрудники приходят на смену в течение --rush секунд и проходят обычный
+день — начало смены, фото, "Время работы", перерыв с подтверждением
+завершения, завершение смены с подтверждением — с паузами на раздумье
+(экспоненциальные, в среднем --think секунд).
+
+Для каждого действия считается задержка до первого ответа бота и до
+последнего из ожидаемых (например, подтверждение перерыва — это
+answerCallbackQuery, editMessageText и sendMessage), результат — JSON.
+
+Сначала запускается генератор, затем бот (polling или webhook):
+    python -m bench.load_test --employees 2000 --rush 30
+    TELEGRAM_API_URL=http://localhost:8081 python bot.py
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from collections import defaultdict
+
+from bench.fake_telegram import FakeTelegram
+from config import (
+    BUTTON_START_SHIFT, BUTTON_START_BREAK, BUTTON_END_BREAK, BUTTON_END_SHIFT, BUTTON_WORK_TIME,
+    CALLBACK_CONFIRM_END_SHIFT, CALLBACK_CONFIRM_END_BREAK,
+)
+
+FIRST_CHAT_ID = 500_000
+
+# Задержки по действиям: первый ответ, все ожидаемые ответы; число таймаутов
+first_latency = defaultdict(list)
+full_latency = defaultdict(list)
+timeouts = defaultdict(int)
+
+
+class Employee:
+    def __init__(self, telegram: FakeTelegram, chat_id: int, args):
+        self.telegram = telegram
+        self.chat_id = chat_id
+        self.args = args
+        self.responses = telegram.responses[chat_id]
+
+    async def think(self):
+        await asyncio.sleep(random.expovariate(1 / self.args.think))
+
+    async def _send(self, action: str, update: dict, expect: int) -> list:
+        # Ответы на предыдущие действия, пришедшие после таймаута, не учитываются
+        while not self.responses.empty():
+            self.responses.get_nowait()
+        started = time.perf_counter()
+        self.telegram.push(update)
+        received = []
+        try:
+            while len(received) < expect:
+                received.append(await asyncio.wait_for(self.responses.get(), self.args.timeout))
+        except asyncio.TimeoutError:
+            timeouts[action] += 1
+            return received
+        first_latency[action].append(received[0]["time"] - started)
+        full_latency[action].append(received[-1]["time"] - started)
+        return received
+
+    async def press(self, action: str, text: str = None, photo: bool = False) -> list:
+        return await self._send(action, self.telegram.message_update(self.chat_id, text, photo), expect=1)
+
+    async def confirm(self, action: str, responses: list, data: str):
+        message = responses[-1]["result"] if responses else None
+        if not message or "reply_markup" not in message:
+            return
+        await self._send(action, self.telegram.callback_update(self.chat_id, message, data), expect=3)
+
+    async def work_day(self):
+        await asyncio.sleep(random.uniform(0, self.args.rush))
+        await self.press("start_shift", BUTTON_START_SHIFT)
+        if random.random() < self.args.photo_share:
+            await self.think()
+            await self.press("photo", photo=True)
+        await self.think()
+        await self.press("work_time", BUTTON_WORK_TIME)
+        await self.think()
+        await self.press("start_break", BUTTON_START_BREAK)
+        await self.think()
+        await self.confirm("confirm_end_break", await self.press("end_break", BUTTON_END_BREAK),
+                           CALLBACK_CONFIRM_END_BREAK)
+        await self.think()
+        await self.confirm("confirm_end_shift", await self.press("end_shift", BUTTON_END_SHIFT),
+                           CALLBACK_CONFIRM_END_SHIFT)
+
+
+def summary(values: list) -> dict:
+    values = sorted(values)
+    if not values:
+        return {}
+
+    def pct(q):
+        return round(values[min(len(values) - 1, int(len(values) * q))] * 1000, 2)
+
+    return {"p50_ms": pct(0.5), "p99_ms": pct(0.99), "max_ms": round(values[-1] * 1000, 2)}
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--employees", type=int, default=1000)
+    parser.add_argument("--rush", type=float, default=30.0, help="за сколько секунд приходят все сотрудники")
+    parser.add_argument("--think", type=float, default=2.0, help="средняя пауза между действиями, сек.")
+    parser.add_argument("--photo-share", type=float, default=0.7, help="доля сотрудников, присылающих фото")
+    parser.add_argument("--timeout", type=float, default=30.0, help="ожидание ответа бота, сек.")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--chat-limit", type=int, default=0, help="сообщений в секунду на чат до ответа 429")
+    parser.add_argument("--global-limit", type=int, default=0, help="сообщений в секунду всего до ответа 429")
+    parser.add_argument("--wait-bot", type=float, default=60.0, help="сколько ждать подключения бота, сек.")
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    telegram = FakeTelegram(chat_limit=args.chat_limit, global_limit=args.global_limit)
+    await telegram.start(args.host, args.port)
+    try:
+        # Бот подключился, когда запросил getUpdates или зарегистрировал webhook
+        deadline = time.monotonic() + args.wait_bot
+        while not (telegram.api_calls["getUpdates"] or telegram.api_calls["setWebhook"]):
+            if time.monotonic() > deadline:
+                raise SystemExit("Бот не подключился к заглушке Bot API")
+            await asyncio.sleep(0.1)
+
+        employees = [Employee(telegram, FIRST_CHAT_ID + i, args) for i in range(args.employees)]
+        started = time.perf_counter()
+        await asyncio.gather(*(employee.work_day() for employee in employees))
+        elapsed = time.perf_counter() - started
+    finally:
+        await telegram.stop()
+
+    result = {
+        "employees": args.employees,
+        "rush_s": args.rush,
+        "duration_s": round(elapsed, 2),
+        "updates": telegram.delivered,
+        "updates_per_second": round(telegram.delivered / elapsed, 1),
+        "actions": {
+            action: {
+                "count": len(first_latency[action]),
+                "timeouts": timeouts[action],
+                "first_response": summary(first_latency[action]),
+                "all_responses": summary(full_latency[action]),
+            }
+            for action in sorted(set(first_latency) | set(timeouts))
+        },
+        "api_calls": dict(telegram.api_calls),
+        "flood_errors": telegram.flood_errors,
+    }
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
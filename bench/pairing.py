@@ -0,0 +1,165 @@
+"""
+Сравнение поиска нарушений последовательности операций по строкам
+(состояние смены и перерыва в переменных, строка за строкой) с векторным
+поиском pairing.find_anomalies на синтетических данных без БД; число нарушений
+каждого вида сверяется. Векторный разбор в боте только этот: замечания
+отчёта бот пишет в дневные сводки (pairing.refresh_notes), а смены, перерывы
+и открытые смены считает SQL (SHIFTS_REBUILD, SHIFT_UPDATES, daily_attendance),
+поэтому векторного подбора смен здесь нет.
+
+Данные: у каждого сотрудника каждый день смена с фото и перерывом, у части
+сотрудников последняя смена открыта (на перерыве), примерно в каждом
+пятидесятом дне — нарушения всех видов.
+
+Запуск из корня репозитория:
+    python -m bench.pairing --events 100000 1000000
+"""
+import argparse
+import json
+import time
+import tracemalloc
+
+import numpy as np
+
+from pairing import (
+    OperationArrays, find_anomalies, parse_copy, to_datetime, COPY_ROW, ANOMALY_KINDS, ANOMALY_DOUBLE_START,
+    ANOMALY_END_WITHOUT_START, ANOMALY_BREAK_OUTSIDE_SHIFT, ANOMALY_BREAK_END_WITHOUT_START,
+    CODE_START_SHIFT, CODE_END_SHIFT, CODE_START_BREAK, CODE_END_BREAK, CODE_PHOTO,
+)
+from schema import OPERATION_PARAMS
+
+DAYS_PER_USER = 100
+US_PER_MINUTE = 60_000_000
+START = 10 * 365 * 24 * 60 * US_PER_MINUTE
+
+OPERATION_NAMES = {
+    CODE_START_SHIFT: OPERATION_PARAMS["start_shift"],
+    CODE_END_SHIFT: OPERATION_PARAMS["end_shift"],
+    CODE_START_BREAK: OPERATION_PARAMS["start_break"],
+    CODE_END_BREAK: OPERATION_PARAMS["end_break"],
+    CODE_PHOTO: OPERATION_PARAMS["photo_received"],
+}
+
+# Операции дня: код и смещение от начала дня, мин.
+DAY = [(CODE_START_SHIFT, 9 * 60), (CODE_PHOTO, 9 * 60 + 5), (CODE_START_BREAK, 13 * 60),
+       (CODE_END_BREAK, 13 * 60 + 45), (CODE_END_SHIFT, 18 * 60)]
+
+
+def synthetic_operations(events: int, seed: int = 42) -> OperationArrays:
+    rng = np.random.default_rng(seed)
+    days = events // len(DAY)
+    user_id = np.arange(days) // DAYS_PER_USER + 1
+    day_start = START + (np.arange(days) % DAYS_PER_USER) * 24 * 60 * US_PER_MINUTE
+    jitter = rng.integers(0, 30 * US_PER_MINUTE, days)
+    codes = np.tile([code for code, _ in DAY], days)
+    times = (day_start + jitter)[:, None] + np.array([offset for _, offset in DAY]) * US_PER_MINUTE
+    users = np.repeat(user_id, len(DAY))
+    times = times.ravel()
+
+    # Последняя смена каждого третьего сотрудника открыта: без end_break и end_shift
+    last_day = np.r_[user_id[1:] != user_id[:-1], True] & (user_id % 3 == 0)
+    keep = ~(np.repeat(last_day, len(DAY)) & np.isin(codes, (CODE_END_BREAK, CODE_END_SHIFT)))
+
+    # Нарушения: повторное начало смены, конец перерыва без начала (утром),
+    # конец перерыва и конец смены после конца смены
+    broken = rng.random(days) < 0.02
+    extra = [(CODE_START_SHIFT, jitter[broken] + 9 * 60 * US_PER_MINUTE + 30 * US_PER_MINUTE),
+             (CODE_END_BREAK, jitter[broken] + 10 * 60 * US_PER_MINUTE),
+             (CODE_END_BREAK, np.full(broken.sum(), 20 * 60 * US_PER_MINUTE)),
+             (CODE_END_SHIFT, np.full(broken.sum(), 20 * 60 * US_PER_MINUTE + 30 * US_PER_MINUTE))]
+    extra_users = np.tile(user_id[broken], len(extra))
+    extra_codes = np.repeat([code for code, _ in extra], broken.sum())
+    extra_times = np.concatenate([day_start[broken] + offset for _, offset in extra])
+    return OperationArrays.sorted(np.r_[users[keep], extra_users], np.r_[codes[keep], extra_codes],
+                                  np.r_[times[keep], extra_times])
+
+
+def copy_data(ops: OperationArrays) -> bytes:
+    """Те же операции в виде двоичного COPY, как его присылает PostgreSQL."""
+    rows = np.zeros(len(ops.user_id), COPY_ROW)
+    rows["fields"] = 3
+    rows["user_id_size"], rows["code_size"], rows["created_at_size"] = 4, 2, 8
+    rows["user_id"], rows["code"], rows["created_at"] = ops.user_id, ops.code, ops.created_at
+    return b"PGCOPY\n\xff\r\n\x00" + bytes(8) + rows.tobytes() + b"\xff\xff"
+
+
+def operation_rows(ops: OperationArrays) -> list:
+    """Строки, как их отдаёт курсор: (user_id, operation, created_at)."""
+    return [(user_id, OPERATION_NAMES[code], to_datetime(created_at))
+            for user_id, code, created_at in zip(ops.user_id.tolist(), ops.code.tolist(), ops.created_at.tolist())]
+
+
+def find_rows(rows) -> dict:
+    """Прежний способ: проход по строкам с состоянием смены и перерыва."""
+    anomalies = dict.fromkeys(ANOMALY_KINDS, 0)
+    user = None
+    in_shift = break_started = False
+    for user_id, operation, _ in rows:
+        if user_id != user:
+            user, in_shift, break_started = user_id, False, False
+        if operation == OPERATION_PARAMS["start_shift"]:
+            if in_shift:
+                anomalies[ANOMALY_KINDS[ANOMALY_DOUBLE_START]] += 1
+            in_shift, break_started = True, False
+        elif operation == OPERATION_PARAMS["end_shift"]:
+            if not in_shift:
+                anomalies[ANOMALY_KINDS[ANOMALY_END_WITHOUT_START]] += 1
+            in_shift, break_started = False, False
+        elif operation in (OPERATION_PARAMS["start_break"], OPERATION_PARAMS["end_break"]):
+            if not in_shift:
+                anomalies[ANOMALY_KINDS[ANOMALY_BREAK_OUTSIDE_SHIFT]] += 1
+            elif operation == OPERATION_PARAMS["end_break"] and not break_started:
+                anomalies[ANOMALY_KINDS[ANOMALY_BREAK_END_WITHOUT_START]] += 1
+            break_started = operation == OPERATION_PARAMS["start_break"]
+    return anomalies
+
+
+def find_vectorized(ops: OperationArrays) -> dict:
+    kinds = np.bincount(find_anomalies(ops).kind, minlength=len(ANOMALY_KINDS))
+    return dict(zip(ANOMALY_KINDS, kinds.tolist()))
+
+
+def measure(prepare, func, source):
+    """
+    prepare — получение входных данных (строки с объектами на каждое значение
+    или разбор двоичного COPY), func — сам поиск нарушений.
+    """
+    # Время и память меряются отдельными прогонами: tracemalloc сильно замедляет код
+    started = time.perf_counter()
+    data = prepare(source)
+    prepared = time.perf_counter()
+    summary = func(data)
+    finished = time.perf_counter()
+
+    del data
+    tracemalloc.start()
+    func(prepare(source))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return summary, {"prepare_s": round(prepared - started, 3), "search_s": round(finished - prepared, 3),
+                     "peak_memory_mb": round(peak / 2 ** 20, 2)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, nargs="+", default=[100_000, 1_000_000])
+    args = parser.parse_args()
+
+    failed = False
+    for events in args.events:
+        ops = synthetic_operations(events)
+        source = copy_data(ops)
+        summaries = {}
+        for name, prepare, func in (("per_row", lambda data: operation_rows(parse_copy(data)), find_rows),
+                                    ("vectorized", parse_copy, find_vectorized)):
+            summaries[name], result = measure(prepare, func, source)
+            print(json.dumps({"implementation": name, "events": len(ops.user_id), **result, **summaries[name]},
+                             ensure_ascii=False))
+        if summaries["per_row"] != summaries["vectorized"]:
+            failed = True
+            print(f"Итоги не совпадают для {events} операций")
+    raise SystemExit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
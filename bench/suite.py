@@ -0,0 +1,235 @@
+"""
+Набор замеров бота на синтетических данных в отдельной локальной БД.
+
+Для каждого размера (пользователей x дней) база пересоздаётся и заполняется:
+у каждого сотрудника каждый день смена с фото и перерывом, у половины
+сотрудников открыта сегодняшняя смена, часть дат календаря занята
+выходными. Затем замеряются генерация отчётов, проверки состояния
+и построение календаря выходных. Кэши в памяти сбрасываются перед каждым
+вызовом, чтобы мерить путь до БД.
+
+Результат — JSON (время, число запросов к БД, пиковая память по tracemalloc
+в отдельном прогоне), его удобно сохранять и сравнивать между коммитами.
+
+Запуск из корня репозитория (сервер и учётные данные берутся из .env,
+база --dbname создаётся при необходимости и полностью перезаписывается):
+    python -m bench.suite --sizes 100x30 500x90 --output bench.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+
+def parse_size(value: str):
+    users, days = value.lower().split("x")
+    return int(users), int(days)
+
+
+parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+parser.add_argument("--sizes", type=parse_size, nargs="+", default=[(100, 30), (500, 90)],
+                    help="размеры данных: <пользователей>x<дней>")
+parser.add_argument("--dbname", default="bot_bench", help="отдельная БД для замеров")
+parser.add_argument("--repeat", type=int, default=5, help="повторов каждого замера")
+parser.add_argument("--samples", type=int, default=50, help="пользователей для замеров по одному пользователю")
+parser.add_argument("--output", help="файл для JSON (по умолчанию stdout)")
+
+# Модули бота читают настройки при импорте: подменяем БД, включаем счётчики
+# запросов (metrics.InstrumentedConnection) и задаём токен, если его нет.
+args = parser.parse_args()
+os.environ["DB_NAME"] = args.dbname
+os.environ["METRICS_ENABLED"] = "true"
+os.environ["OPERATION_BATCH_ENABLED"] = "false"
+if not os.getenv("TOKEN"):
+    os.environ["TOKEN"] = "123456:bench"
+
+import psycopg  # noqa: E402
+from psycopg.conninfo import make_conninfo  # noqa: E402
+
+import db  # noqa: E402
+import metrics  # noqa: E402
+from aggregates import attendance_aggregates  # noqa: E402
+from bot import bot, build_day_off_inline_keyboard  # noqa: E402
+from partitions import operation_partitions  # noqa: E402
+from config import MIN_DATE_OFFSET, MAX_DATE_OFFSET  # noqa: E402
+from reports import generate_report_csv, generate_report_excel  # noqa: E402
+from schema import SHIFTS_REBUILD, SHIFTS_REBUILD_ALL, OPERATION_PARAMS  # noqa: E402
+
+SEED_OPERATIONS = """
+    WITH days AS (
+        SELECT u.id AS user_id,
+            (CURRENT_DATE - %(days)s + d) + TIME '09:00' + random() * INTERVAL '60 minutes' AS started
+        FROM users u
+        CROSS JOIN generate_series(0, %(days)s - 1) AS d
+    )
+    INSERT INTO operations (user_id, operation, created_at)
+    SELECT user_id, op, started + offset_
+    FROM days
+    CROSS JOIN LATERAL (VALUES
+        (%(start_shift)s, INTERVAL '0'),
+        (%(photo_received)s, INTERVAL '5 minutes'),
+        (%(start_break)s, INTERVAL '4 hours'),
+        (%(end_break)s, INTERVAL '4 hours' + random() * INTERVAL '60 minutes'),
+        (%(end_shift)s, INTERVAL '9 hours')
+    ) AS v(op, offset_)
+"""
+
+# Сегодняшняя открытая смена у каждого второго сотрудника
+SEED_OPEN_SHIFTS = """
+    INSERT INTO operations (user_id, operation, created_at)
+    SELECT id, %(start_shift)s, LOCALTIMESTAMP - INTERVAL '1 hour'
+    FROM users
+    WHERE id %% 2 = 0
+"""
+
+# Выходные: каждый пятый сотрудник пытается занять случайную дату в окне
+# календаря (дата достаётся одному)
+SEED_WEEKENDS = """
+    INSERT INTO weekends (user_id, date)
+    SELECT id, CURRENT_DATE + %(min_offset)s + floor(random() * (%(max_offset)s - %(min_offset)s + 1))::integer
+    FROM users
+    WHERE id %% 5 = 0
+    ON CONFLICT (date) DO NOTHING
+"""
+
+
+def create_database():
+    conninfo = make_conninfo(db.CONNINFO, dbname="postgres")
+    with psycopg.connect(conninfo, autocommit=True) as conn:
+        exists = conn.execute("SELECT 1 FROM pg_database WHERE datname = %s", (args.dbname,)).fetchone()
+        if not exists:
+            conn.execute(f'CREATE DATABASE "{args.dbname}"')
+
+
+async def seed(users: int, days: int) -> dict:
+    params = {**OPERATION_PARAMS, "days": days, "min_offset": MIN_DATE_OFFSET, "max_offset": MAX_DATE_OFFSET}
+    async with db.pool.connection() as conn:
+        await conn.execute("SELECT setseed(0.42)")
+        await conn.execute("TRUNCATE users, operations, weekends, shifts, report_watermarks, fsm_states, photos,"
+                           " daily_attendance, department_daily_stats, aggregate_checkpoints, report_jobs,"
+                           " operation_edits RESTART IDENTITY")
+        await conn.execute("""
+            INSERT INTO users (full_name, telegram_id, department)
+            SELECT 'Сотрудник ' || g, 'bench_' || g, 'Отдел ' || g %% 10
+            FROM generate_series(1, %s) AS g
+        """, (users,))
+        await conn.execute(SEED_OPERATIONS, params)
+        await conn.execute(SEED_OPEN_SHIFTS, params)
+        await conn.execute(SEED_WEEKENDS, params)
+        await conn.execute(SHIFTS_REBUILD, SHIFTS_REBUILD_ALL)
+    # Прошлые месяцы попали в operations_default, для них создаются секции, как при обслуживании в боте
+    await operation_partitions.create_partitions()
+    # Без отметки в aggregate_checkpoints дневные сводки строятся заново целиком
+    await attendance_aggregates.roll_up()
+    async with db.pool.connection() as conn:
+        await conn.execute("ANALYZE")
+        cur = await conn.execute("""
+            SELECT (SELECT count(*) FROM operations), (SELECT count(*) FROM shifts),
+                (SELECT count(*) FROM daily_attendance)
+        """)
+        operations, shifts, attendance_days = await cur.fetchone()
+    return {"users": users, "days": days, "operations": operations, "shifts": shifts,
+            "attendance_days": attendance_days}
+
+
+def clear_caches():
+    for cache in (db.user_cache, db.state_cache, db.booked_dates_cache, db.fsm_cache):
+        cache.clear()
+
+
+def query_count() -> int:
+    return int(sum(metrics.db_queries.values.values()))
+
+
+async def measure(func, calls) -> dict:
+    """Замеряет func(*call) для каждого набора аргументов из calls; времена — на один вызов."""
+    timings = []
+    for _ in range(args.repeat):
+        started = time.perf_counter()
+        for call in calls:
+            clear_caches()
+            await func(*call)
+        timings.append((time.perf_counter() - started) / len(calls))
+
+    # Запросы и память — в отдельном прогоне: tracemalloc сильно замедляет код
+    queries_before = query_count()
+    tracemalloc.start()
+    for call in calls:
+        clear_caches()
+        await func(*call)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    timings.sort()
+    return {
+        "wall_ms_median": round(timings[len(timings) // 2] * 1000, 3),
+        "wall_ms_min": round(timings[0] * 1000, 3),
+        "queries_per_call": round((query_count() - queries_before) / len(calls), 2),
+        "peak_memory_kb": peak // 1024,
+    }
+
+
+async def report_csv(date_from, date_to):
+    with await generate_report_csv(date_from, date_to):
+        pass
+
+
+async def report_excel(date_from, date_to):
+    os.remove(await generate_report_excel(date_from, date_to))
+
+
+async def break_duration(user_id):
+    started_at, ended_at = await db.get_last_shift_times(user_id)
+    await db.calculate_break_duration(user_id, started_at, ended_at)
+
+
+async def run_size(users: int, days: int) -> dict:
+    info = await seed(users, days)
+    period = [(date.today() - timedelta(days=days), date.today())]
+    sample_users = [(user_id,) for user_id in range(1, users + 1, max(1, users // args.samples))]
+    page_start = date.today() + timedelta(days=MIN_DATE_OFFSET)
+
+    info["results"] = {
+        "generate_report_csv": await measure(report_csv, period),
+        "generate_report_excel": await measure(report_excel, period),
+        "is_shift_active": await measure(db.is_shift_active, sample_users),
+        "calculate_break_duration": await measure(break_duration, sample_users),
+        "get_month_worked_time": await measure(db.get_month_worked_time, sample_users),
+        "build_day_off_inline_keyboard": await measure(
+            build_day_off_inline_keyboard, [(user_id, page_start) for user_id, in sample_users]),
+    }
+    return info
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def main():
+    create_database()
+    await db.init_db()
+    try:
+        sizes = [await run_size(users, days) for users, days in args.sizes]
+    finally:
+        await db.close_db()
+        await bot.session.close()
+
+    result = json.dumps({"commit": git_commit(), "repeat": args.repeat, "sizes": sizes},
+                        ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(result + "\n")
+    else:
+        print(result)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,137 @@
+"""
+Проверка режима webhook без Telegram: скрипт поднимает заглушку Bot API,
+которая на любой метод отвечает успехом, и отправляет на webhook бота
+синтетические обновления с заголовком секрета, как это делает Telegram.
+
+Бот запускается отдельно и смотрит на заглушку:
+    BOT_MODE=webhook WEBHOOK_URL=http://localhost:8080 WEBHOOK_SECRET=test \\
+        TELEGRAM_API_URL=http://localhost:8081 python bot.py
+
+Заглушку нужно поднять раньше бота (он регистрирует webhook при запуске):
+    python -m bench.webhook_updates --secret test --count 1000 --wait-bot
+
+Результат (коды ответов, задержки, число вызовов Bot API по методам) — JSON.
+"""
+import argparse
+import asyncio
+import json
+import time
+from collections import Counter
+from itertools import count
+
+from aiohttp import ClientSession, web
+
+from config import BUTTON_WORK_TIME, BUTTON_START_SHIFT, BUTTON_END_SHIFT
+
+TEXTS = ["/start", BUTTON_WORK_TIME, BUTTON_START_SHIFT, BUTTON_END_SHIFT]
+
+api_calls = Counter()
+webhook_registered = asyncio.Event()
+message_ids = count(1)
+
+
+async def fake_api(request: web.Request) -> web.Response:
+    method = request.match_info["method"]
+    api_calls[method] += 1
+    if method == "setWebhook":
+        webhook_registered.set()
+    if method.startswith(("send", "edit")):
+        data = await request.post()
+        result = {
+            "message_id": next(message_ids),
+            "date": int(time.time()),
+            "chat": {"id": int(data.get("chat_id", 0)), "type": "private"},
+        }
+    else:
+        result = True
+    return web.json_response({"ok": True, "result": result})
+
+
+def make_update(update_id: int, user_id: int, text: str) -> dict:
+    user = {"id": user_id, "is_bot": False, "first_name": f"User {user_id}"}
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": user,
+            "text": text,
+        },
+    }
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))] if values else None
+
+
+async def send_updates(args) -> dict:
+    statuses = Counter()
+    latencies = []
+    queue = asyncio.Queue()
+    for i in range(args.count):
+        queue.put_nowait(make_update(i + 1, 100_000 + i % args.users, TEXTS[i // args.users % len(TEXTS)]))
+
+    async with ClientSession() as session:
+        # Запрос с неверным секретом бот обязан отклонить
+        async with session.post(args.url, json=make_update(0, 1, "/start"),
+                                headers={"X-Telegram-Bot-Api-Secret-Token": "wrong"}) as resp:
+            wrong_secret_status = resp.status
+
+        async def worker():
+            while not queue.empty():
+                update = queue.get_nowait()
+                started = time.perf_counter()
+                async with session.post(args.url, json=update,
+                                        headers={"X-Telegram-Bot-Api-Secret-Token": args.secret}) as resp:
+                    await resp.read()
+                    statuses[resp.status] += 1
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return {
+        "wrong_secret_status": wrong_secret_status,
+        "statuses": dict(statuses),
+        "updates_per_second": round(args.count / elapsed, 1),
+        "latency_ms": {
+            "p50": round(percentile(latencies, 0.5) * 1000, 2),
+            "p99": round(percentile(latencies, 0.99) * 1000, 2),
+        },
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://localhost:8080/webhook")
+    parser.add_argument("--secret", required=True)
+    parser.add_argument("--api-port", type=int, default=8081)
+    parser.add_argument("--count", type=int, default=1000)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--wait-bot", action="store_true", help="дождаться setWebhook от бота")
+    parser.add_argument("--drain", type=float, default=2.0, help="сколько ждать ответов бота, сек.")
+    args = parser.parse_args()
+
+    app = web.Application()
+    app.router.add_route("*", "/bot{token}/{method}", fake_api)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "localhost", args.api_port).start()
+    try:
+        if args.wait_bot:
+            await webhook_registered.wait()
+        result = await send_updates(args)
+        # Бот обрабатывает обновления в фоне и отвечает через заглушку
+        await asyncio.sleep(args.drain)
+        result["api_calls"] = dict(api_calls)
+    finally:
+        await runner.cleanup()
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,73 @@
+from typing import Callable, Optional
+
+from aiogram import Dispatcher, types
+from aiogram.dispatcher.event.handler import CallableObject
+
+
+class ButtonRouter:
+    """
+    Маршрутизация нажатий кнопок по словарям вместо цепочки фильтров
+    `lambda msg: msg.text == BUTTON_...`, которые aiogram проверяет по одному
+    в порядке регистрации. Сообщения выбираются по тексту кнопки (или по типу
+    содержимого, например фото), callback-запросы — по data целиком или по
+    префиксу до ":". Диспетчеру достаётся по одному обработчику на сообщения
+    и на callback-запросы, остальные обработчики (команды, состояния FSM)
+    проверяются, только если кнопка не подошла.
+
+    Маршрут (route) — имя обработчика и сам обработчик; по имени время
+    и ошибки обработчиков кнопок учитывает HandlerMetricsMiddleware (metrics.py).
+    """
+
+    def __init__(self):
+        self.texts = {}
+        self.content_types = {}
+        self.callbacks = {}
+        self.callback_prefixes = {}
+
+    def _add(self, table: dict, key: str, handler: Callable):
+        if key in table:
+            raise ValueError(f"Кнопка {key!r} уже назначена обработчику {table[key][0]}")
+        table[key] = (handler.__name__, CallableObject(handler))
+
+    def message(self, *texts: str, content_type: Optional[str] = None):
+        """Регистрирует обработчик сообщений с текстом кнопки texts или типом content_type."""
+        def decorator(handler):
+            for text in texts:
+                self._add(self.texts, text, handler)
+            if content_type:
+                self._add(self.content_types, content_type, handler)
+            return handler
+        return decorator
+
+    def callback(self, *data: str, prefix: Optional[str] = None):
+        """Регистрирует обработчик callback-запросов с data из списка или вида "<prefix>:...". """
+        def decorator(handler):
+            for value in data:
+                self._add(self.callbacks, value, handler)
+            if prefix:
+                self._add(self.callback_prefixes, prefix, handler)
+            return handler
+        return decorator
+
+    def _match_message(self, message: types.Message):
+        route = self.texts.get(message.text) if message.text else self.content_types.get(message.content_type)
+        return {"route": route} if route else False
+
+    def _match_callback(self, callback_query: types.CallbackQuery):
+        data = callback_query.data or ""
+        route = self.callbacks.get(data)
+        if route is None and ":" in data:
+            route = self.callback_prefixes.get(data.partition(":")[0])
+        return {"route": route} if route else False
+
+    async def _dispatch(self, event, route, **kwargs):
+        _, handler = route
+        return await handler.call(event, **kwargs)
+
+    def attach(self, dp: Dispatcher):
+        """
+        Подключает маршрутизатор к диспетчеру. Вызывается до регистрации
+        остальных обработчиков: кнопки, как и прежде, имеют приоритет над ними.
+        """
+        dp.message.register(self._dispatch, self._match_message)
+        dp.callback_query.register(self._dispatch, self._match_callback)
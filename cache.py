@@ -0,0 +1,57 @@
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class LRUCache:
+    """
+    Небольшой кэш в памяти процесса: хранит не больше maxsize записей,
+    вытесняя давно не использованные, и (если задан ttl) забывает записи
+    старше ttl секунд.
+
+    version увеличивается при каждой инвалидации. Загрузчик запоминает его
+    перед чтением из БД и передаёт в set(): если за время чтения данные
+    успели измениться, устаревшее значение в кэш не попадёт.
+    """
+
+    def __init__(self, maxsize: int, ttl: float = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.version = 0
+        self._data = OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        item = self._data.get(key, _MISSING)
+        if item is _MISSING:
+            return default
+        value, expires_at = item
+        if expires_at is not None and expires_at < time.monotonic():
+            del self._data[key]
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key, value, version: int = None):
+        if version is not None and version != self.version:
+            return
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        self._data[key] = (value, expires_at)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        item = self._data.pop(key, _MISSING)
+        return default if item is _MISSING else item[0]
+
+    def invalidate(self, key):
+        self.version += 1
+        self._data.pop(key, None)
+
+    def clear(self):
+        self.version += 1
+        self._data.clear()
@@ -0,0 +1,169 @@
+import os
+import tempfile
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Конфигурация подключения к базе данных
+DB_HOST = os.getenv("DB_HOST")
+DB_NAME = os.getenv("DB_NAME")
+DB_USER = os.getenv("DB_USER")
+DB_PASSWORD = os.getenv("DB_PASSWORD")
+
+# Размер пула соединений с базой данных
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", 1))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", 10))
+
+# Кэш состояния смен и перерывов: число пользователей и время жизни записи, сек.
+STATE_CACHE_SIZE = int(os.getenv("STATE_CACHE_SIZE", 10000))
+STATE_CACHE_TTL = int(os.getenv("STATE_CACHE_TTL", 300))
+
+# Кэш профилей пользователей (id, права администратора, отдел, напоминание)
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", 10000))
+USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", 600))
+
+# Групповая запись операций: операции от параллельных обработчиков копятся
+# до OPERATION_BATCH_INTERVAL_MS миллисекунд (или OPERATION_BATCH_MAX_SIZE
+# штук) и фиксируются одной транзакцией
+OPERATION_BATCH_ENABLED = os.getenv("OPERATION_BATCH_ENABLED", "false").lower() == "true"
+OPERATION_BATCH_INTERVAL = int(os.getenv("OPERATION_BATCH_INTERVAL_MS", 5)) / 1000
+OPERATION_BATCH_MAX_SIZE = int(os.getenv("OPERATION_BATCH_MAX_SIZE", 100))
+
+# Состояния диалогов (FSM) хранятся в БД: через FSM_STATE_TTL секунд без
+# изменений состояние считается заброшенным и удаляется. Чтения идут
+# через кэш в памяти процесса (размер и время жизни записи, сек.)
+FSM_STATE_TTL = int(os.getenv("FSM_STATE_TTL", 24 * 60 * 60))
+FSM_CACHE_SIZE = int(os.getenv("FSM_CACHE_SIZE", 10000))
+FSM_CACHE_TTL = int(os.getenv("FSM_CACHE_TTL", 60))
+
+# Токен бота
+TOKEN = os.getenv("TOKEN")
+
+# Адрес Bot API, если нужен не api.telegram.org (локальный сервер Bot API
+# или заглушка для нагрузочных проверок, см. bench/webhook_updates.py)
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL")
+
+# Ограничения исходящих сообщений (лимиты Telegram): сообщений в секунду
+# и допустимый всплеск для бота в целом и для одного чата, число повторов
+# после ответа 429 "Too Many Requests"
+OUTBOUND_GLOBAL_RATE = float(os.getenv("OUTBOUND_GLOBAL_RATE", 30))
+OUTBOUND_GLOBAL_BURST = float(os.getenv("OUTBOUND_GLOBAL_BURST", 30))
+OUTBOUND_CHAT_RATE = float(os.getenv("OUTBOUND_CHAT_RATE", 1))
+OUTBOUND_CHAT_BURST = float(os.getenv("OUTBOUND_CHAT_BURST", 3))
+OUTBOUND_MAX_RETRIES = int(os.getenv("OUTBOUND_MAX_RETRIES", 3))
+
+# Способ получения обновлений: "polling" (long polling) или "webhook".
+# В режиме webhook бот поднимает HTTP-сервер на WEBHOOK_HOST:WEBHOOK_PORT
+# и регистрирует в Telegram адрес WEBHOOK_URL + WEBHOOK_PATH; запросы
+# без заголовка с WEBHOOK_SECRET отклоняются. Если за балансировщиком
+# работает несколько экземпляров, WEBHOOK_DELETE_ON_SHUTDOWN выключают,
+# чтобы остановка одного не снимала webhook у остальных.
+BOT_MODE = os.getenv("BOT_MODE", "polling").lower()
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "").rstrip("/")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", 8080))
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+WEBHOOK_DELETE_ON_SHUTDOWN = os.getenv("WEBHOOK_DELETE_ON_SHUTDOWN", "true").lower() == "true"
+
+# Метрики в формате Prometheus: при METRICS_ENABLED бот отдаёт их
+# по адресу http://METRICS_HOST:METRICS_PORT/metrics. Без него обработчики
+# и запросы к БД не оборачиваются замерами
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "false").lower() == "true"
+METRICS_HOST = os.getenv("METRICS_HOST", "0.0.0.0")
+METRICS_PORT = int(os.getenv("METRICS_PORT", 9100))
+
+# Логирование
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+
+# Параметры расчёта дат
+MIN_DATE_OFFSET = int(os.getenv("MIN_DATE_OFFSET", 2))
+MAX_DATE_OFFSET = int(os.getenv("MAX_DATE_OFFSET", 30))
+
+# Параметры выгрузки отчётов: размер пачки строк серверного курсора,
+# объём временного файла, после которого он сбрасывается на диск,
+# и число одновременно формируемых Excel-отчётов
+REPORT_BATCH_SIZE = int(os.getenv("REPORT_BATCH_SIZE", 1000))
+REPORT_SPOOL_MAX_SIZE = int(os.getenv("REPORT_SPOOL_MAX_SIZE", 1024 * 1024))
+REPORT_EXCEL_WORKERS = int(os.getenv("REPORT_EXCEL_WORKERS", 2))
+
+# Очередь заданий на отчёты: сколько отчётов формируется одновременно всего
+# (во всех экземплярах бота вместе) и у одного администратора, сколько его заданий может ждать в очереди,
+# попыток на задание, период обновления сообщения о ходе, сек., и период
+# проверки заданий в БД, сек.
+REPORT_JOB_WORKERS = int(os.getenv("REPORT_JOB_WORKERS", 2))
+REPORT_JOB_ADMIN_WORKERS = int(os.getenv("REPORT_JOB_ADMIN_WORKERS", 1))
+REPORT_JOB_ADMIN_MAX_PENDING = int(os.getenv("REPORT_JOB_ADMIN_MAX_PENDING", 5))
+REPORT_JOB_MAX_ATTEMPTS = int(os.getenv("REPORT_JOB_MAX_ATTEMPTS", 3))
+REPORT_JOB_PROGRESS_INTERVAL = int(os.getenv("REPORT_JOB_PROGRESS_INTERVAL", 3))
+REPORT_JOB_POLL_INTERVAL = int(os.getenv("REPORT_JOB_POLL_INTERVAL", 5))
+
+# Кэш готовых отчётов за прошедшие периоды: каталог и предельный объём, байт
+REPORT_CACHE_DIR = os.getenv("REPORT_CACHE_DIR", os.path.join(tempfile.gettempdir(), "bot_report_cache"))
+REPORT_CACHE_MAX_SIZE = int(os.getenv("REPORT_CACHE_MAX_SIZE", 200 * 1024 * 1024))
+
+# Журнал operations секционирован по месяцам: секции создаются заранее на
+# OPERATIONS_PARTITIONS_AHEAD месяцев вперёд. Если задан OPERATIONS_RETENTION_MONTHS,
+# месяцы старше этого числа полных месяцев выгружаются в OPERATIONS_ARCHIVE_DIR
+# (CSV с gzip) и удаляются из БД; 0 — хранить всё. Период обслуживания, сек.
+OPERATIONS_PARTITIONS_AHEAD = int(os.getenv("OPERATIONS_PARTITIONS_AHEAD", 3))
+OPERATIONS_RETENTION_MONTHS = int(os.getenv("OPERATIONS_RETENTION_MONTHS", 0))
+OPERATIONS_ARCHIVE_DIR = os.getenv(
+    "OPERATIONS_ARCHIVE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "archive"))
+OPERATIONS_MAINTENANCE_INTERVAL = int(os.getenv("OPERATIONS_MAINTENANCE_INTERVAL", 6 * 60 * 60))
+
+# Сводные показатели отделов по дням для панели в админке: сколько последних
+# дней хранить и пересчитывать, период обновления, сек., начало рабочего дня
+# (ЧЧ:ММ) и допустимое опоздание, мин. — более позднее начало смены считается опозданием
+AGGREGATES_DAYS = int(os.getenv("AGGREGATES_DAYS", 56))
+AGGREGATES_REFRESH_INTERVAL = int(os.getenv("AGGREGATES_REFRESH_INTERVAL", 60))
+WORK_DAY_START = os.getenv("WORK_DAY_START", "09:00")
+LATE_GRACE_MINUTES = int(os.getenv("LATE_GRACE_MINUTES", 0))
+
+# Фото рабочих мест: каталог хранения (файлы по sha256 содержимого и
+# уменьшенные копии в thumbs/), число одновременных загрузок, длина очереди
+# заданий в памяти (остальные ждут в БД), размер уменьшенной копии, пикс.,
+# и число процессов для её построения, попыток загрузки и период, сек.,
+# проверки заданий, оставшихся в БД
+PHOTO_DIR = os.getenv("PHOTO_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "photos"))
+PHOTO_WORKERS = int(os.getenv("PHOTO_WORKERS", 4))
+PHOTO_QUEUE_SIZE = int(os.getenv("PHOTO_QUEUE_SIZE", 200))
+PHOTO_THUMBNAIL_SIZE = int(os.getenv("PHOTO_THUMBNAIL_SIZE", 320))
+PHOTO_THUMBNAIL_PROCESSES = int(os.getenv("PHOTO_THUMBNAIL_PROCESSES", 2))
+PHOTO_MAX_ATTEMPTS = int(os.getenv("PHOTO_MAX_ATTEMPTS", 5))
+PHOTO_RESCAN_INTERVAL = int(os.getenv("PHOTO_RESCAN_INTERVAL", 60))
+
+# Параметры клавиатуры
+PAGE_SIZE = int(os.getenv("PAGE_SIZE", 5))
+
+# Тексты сообщений и кнопок
+TEXT_WELCOME = os.getenv("TEXT_WELCOME", "Привет! Выбери действие:")
+TEXT_MENU = os.getenv("TEXT_MENU", "Главное меню")
+TEXT_ADMIN_REQUIRED = os.getenv("TEXT_ADMIN_REQUIRED", "Требуются права администратора")
+TEXT_INVALID_DATE_FORMAT = os.getenv("TEXT_INVALID_DATE_FORMAT", "Неверный формат даты. Используйте ДД.ММ.ГГГГ")
+TEXT_INVALID_PERIOD = os.getenv("TEXT_INVALID_PERIOD", "Некорректный временной период")
+BUTTON_WORK_TIME = os.getenv("BUTTON_WORK_TIME", "Время работы")
+BUTTON_DAY_OFF = os.getenv("BUTTON_DAY_OFF", "Поставить выходной")
+BUTTON_START_SHIFT = os.getenv("BUTTON_START_SHIFT", "Начать смену")
+BUTTON_START_BREAK = os.getenv("BUTTON_START_BREAK", "Начать перерыв")
+BUTTON_END_SHIFT = os.getenv("BUTTON_END_SHIFT", "Закончить смену")
+BUTTON_END_BREAK = os.getenv("BUTTON_END_BREAK", "Закончить перерыв")
+BUTTON_GET_REPORT = os.getenv("BUTTON_GET_REPORT", "Сформировать отчет")
+
+# Callback данные для inline кнопок
+CALLBACK_CONFIRM_END_SHIFT = os.getenv("CALLBACK_CONFIRM_END_SHIFT", "confirm_end_shift")
+CALLBACK_CANCEL_END_SHIFT = os.getenv("CALLBACK_CANCEL_END_SHIFT", "cancel_end_shift")
+CALLBACK_CONFIRM_END_BREAK = os.getenv("CALLBACK_CONFIRM_END_BREAK", "confirm_end_break")
+CALLBACK_CANCEL_END_BREAK = os.getenv("CALLBACK_CANCEL_END_BREAK", "cancel_end_break")
+CALLBACK_CANCEL_REPORT = os.getenv("CALLBACK_CANCEL_REPORT", "cancel_report")
+
+# Операционные команды
+OPERATION_START_SHIFT = os.getenv("OPERATION_START_SHIFT", "start_shift")
+OPERATION_END_SHIFT = os.getenv("OPERATION_END_SHIFT", "end_shift")
+OPERATION_START_BREAK = os.getenv("OPERATION_START_BREAK", "start_break")
+OPERATION_END_BREAK = os.getenv("OPERATION_END_BREAK", "end_break")
+OPERATION_PHOTO_RECEIVED = os.getenv("OPERATION_PHOTO_RECEIVED", "photo_received")
+
+# Регулярное выражение для проверки даты
+DATE_REGEX = os.getenv("DATE_REGEX", r"\d{2}\.\d{2}\.\d{4}")
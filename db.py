@@ -0,0 +1,640 @@
+import asyncio
+import logging
+import uuid
+from datetime import datetime, timedelta, date
+from typing import NamedTuple, Optional
+
+from psycopg import AsyncConnection
+from psycopg.conninfo import make_conninfo
+from psycopg_pool import AsyncConnectionPool
+
+from cache import LRUCache
+from metrics import db_query, InstrumentedConnection
+from pairing import refresh_notes
+from schema import (
+    apply_migrations, SHIFTS_REBUILD, OPERATION_PARAMS, OPERATION_EDIT_WINDOWS, DAILY_ATTENDANCE_DAYS_DELETE,
+    DAILY_ATTENDANCE_DAYS_ROLLUP, DAILY_ATTENDANCE_LOCK_ID, CHECKPOINT_DAILY_ATTENDANCE, WATERMARK_OVERLAP,
+)
+from config import (
+    DB_HOST, DB_NAME, DB_USER, DB_PASSWORD, DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE,
+    STATE_CACHE_SIZE, STATE_CACHE_TTL, USER_CACHE_SIZE, USER_CACHE_TTL, FSM_CACHE_SIZE, FSM_CACHE_TTL,
+    OPERATION_START_SHIFT, OPERATION_END_SHIFT, OPERATION_START_BREAK, OPERATION_END_BREAK,
+    OPERATION_PHOTO_RECEIVED, OPERATION_BATCH_ENABLED, OPERATION_BATCH_INTERVAL, OPERATION_BATCH_MAX_SIZE,
+    METRICS_ENABLED,
+)
+
+logger = logging.getLogger(__name__)
+
+CONNINFO = make_conninfo(host=DB_HOST, dbname=DB_NAME, user=DB_USER, password=DB_PASSWORD)
+
+# Канал LISTEN/NOTIFY, через который админка сообщает боту об изменённых данных.
+# Формат сообщения: "<таблица>:<ключ>", например "operations:42".
+INVALIDATION_CHANNEL = "bot_cache"
+
+# Идентификатор этого экземпляра бота. Если экземпляров несколько (webhook
+# за балансировщиком), каждый сообщает остальным о своих записях в тот же
+# канал с ключом "<ключ>@<INSTANCE_ID>", а собственные сообщения пропускает.
+INSTANCE_ID = uuid.uuid4().hex[:12]
+
+# Пул асинхронных соединений. Каждый запрос берёт из пула своё соединение
+# на время одной транзакции, поэтому обработчики не блокируют цикл событий
+# и не делят между собой один курсор.
+pool = AsyncConnectionPool(
+    conninfo=CONNINFO,
+    min_size=DB_POOL_MIN_SIZE,
+    max_size=DB_POOL_MAX_SIZE,
+    connection_class=InstrumentedConnection if METRICS_ENABLED else AsyncConnection,
+    open=False,
+)
+
+class WrittenOperation(NamedTuple):
+    id: int
+    created_at: datetime
+
+
+class UserProfile(NamedTuple):
+    id: int
+    is_admin: bool
+    department: Optional[str]
+    reminder: Optional[str]
+
+
+# Кэш профилей: telegram_id -> UserProfile. Каждый обработчик начинается
+# с определения пользователя, поэтому в обычном случае это обходится без запросов.
+user_cache = LRUCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+
+# Кэш состояния пользователей: user_id -> {операция: время последней такой операции
+# с начала последней смены}.
+# Заполняется лениво одним запросом и обновляется при каждой записи в insert_operation,
+# так что проверки "идёт ли смена/перерыв" обычно обходятся без запросов к БД.
+state_cache = LRUCache(maxsize=STATE_CACHE_SIZE, ttl=STATE_CACHE_TTL)
+
+# Занятые даты выходных: (первая, последняя дата окна календаря) -> множество дат.
+# Окно целиком читается одним запросом и сбрасывается при записи выходного.
+booked_dates_cache = LRUCache(maxsize=4, ttl=STATE_CACHE_TTL)
+
+# Состояния FSM: ключ хранилища -> FSMRecord (см. fsm_storage.py). Обработчик
+# обычно читает состояние несколько раз за одно обновление, а у большинства
+# пользователей его нет вовсе — оба случая обслуживаются без запросов.
+fsm_cache = LRUCache(maxsize=FSM_CACHE_SIZE, ttl=FSM_CACHE_TTL)
+
+_listener_task = None
+
+
+def schedule_operation_edits():
+    # Журнал operations — первичный источник, затронутые смены пересобираются по нему
+    task = asyncio.create_task(apply_operation_edits())
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+def on_operations_changed(key: str):
+    state_cache.invalidate(int(key))
+    schedule_operation_edits()
+
+
+_background_tasks = set()
+
+# Обработчики сообщений об изменениях из админки по имени таблицы
+invalidation_handlers = {
+    # telegram_id пользователя может поменяться в админке, поэтому сбрасываются все профили
+    "users": lambda key: user_cache.clear(),
+    "operations": on_operations_changed,
+    "weekends": lambda key: booked_dates_cache.clear(),
+    # Операцию записал другой экземпляр бота: смены он уже обновил сам
+    "state": lambda key: state_cache.invalidate(int(key)),
+    "fsm": fsm_cache.invalidate,
+}
+
+
+async def notify_peers(conn, table: str, key):
+    """Сообщает другим экземплярам бота об изменении; уходит при фиксации транзакции conn."""
+    await conn.execute(
+        "SELECT pg_notify(%s, %s)",
+        (INVALIDATION_CHANNEL, f"{table}:{key}@{INSTANCE_ID}"),
+    )
+
+
+async def listen_invalidations():
+    while True:
+        try:
+            async with await AsyncConnection.connect(CONNINFO, autocommit=True) as conn:
+                await conn.execute(f"LISTEN {INVALIDATION_CHANNEL}")
+                # Правки из админки, сделанные до подключения (бот не работал
+                # или соединение было потеряно), ждут в operation_edits
+                schedule_operation_edits()
+                async for notify in conn.notifies():
+                    table, _, key = notify.payload.partition(":")
+                    key, _, origin = key.partition("@")
+                    if origin == INSTANCE_ID:
+                        continue
+                    handler = invalidation_handlers.get(table)
+                    if handler:
+                        handler(key)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Соединение LISTEN %s потеряно, переподключение", INVALIDATION_CHANNEL)
+            # Пока слушатель не работал, сообщения могли потеряться
+            user_cache.clear()
+            state_cache.clear()
+            booked_dates_cache.clear()
+            fsm_cache.clear()
+            await asyncio.sleep(5)
+
+
+async def init_db():
+    global _listener_task
+    await pool.open(wait=True)
+    async with pool.connection() as conn:
+        await apply_migrations(conn)
+    _listener_task = asyncio.create_task(listen_invalidations())
+    logger.info("Пул соединений открыт (min=%s, max=%s)", DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE)
+
+
+async def close_db():
+    if operation_writer:
+        await operation_writer.close()
+    if _listener_task:
+        _listener_task.cancel()
+    await pool.close()
+
+
+@db_query
+async def get_user_profile(telegram_id: str) -> UserProfile:
+    profile = user_cache.get(telegram_id)
+    if profile is None:
+        version = user_cache.version
+        # Новый пользователь вставляется, существующий читается вторым запросом:
+        # DO NOTHING не пишет новую версию строки на каждый промах кэша
+        async with pool.connection() as conn:
+            cur = await conn.execute("""
+                INSERT INTO users (telegram_id) VALUES (%s)
+                ON CONFLICT (telegram_id) DO NOTHING
+                RETURNING id, COALESCE(is_admin, FALSE), department, reminder
+            """, (telegram_id,))
+            row = await cur.fetchone()
+            if row:
+                # Новый сотрудник появляется во всех отчётах
+                await mark_report_days_changed(conn, [ALL_DAYS])
+            else:
+                cur = await conn.execute("""
+                    SELECT id, COALESCE(is_admin, FALSE), department, reminder
+                    FROM users
+                    WHERE telegram_id = %s
+                """, (telegram_id,))
+                row = await cur.fetchone()
+            profile = UserProfile(*row)
+        user_cache.set(telegram_id, profile, version)
+    return profile
+
+
+async def get_or_create_user(telegram_id: str) -> int:
+    return (await get_user_profile(telegram_id)).id
+
+
+# Горячие запросы вынесены в константы: их планы проверяет tests/test_query_plans.py.
+
+# Последняя операция каждого типа отдельным поиском по индексу, только
+# начиная с последней смены (shifts): более старые месячные секции
+# operations отсекаются при выполнении и не читаются
+USER_STATE_QUERY = """
+    SELECT o.operation, last.created_at
+    FROM unnest(%(operations)s::varchar[]) AS o(operation)
+    CROSS JOIN LATERAL (
+        SELECT created_at
+        FROM operations
+        WHERE user_id = %(user_id)s
+            AND operation = o.operation
+            AND created_at >= (
+                SELECT COALESCE(MAX(started_at), '-infinity') FROM shifts WHERE user_id = %(user_id)s
+            )
+        ORDER BY created_at DESC
+        LIMIT 1
+    ) last
+"""
+
+BREAK_OPERATIONS_QUERY = """
+    SELECT operation, created_at
+    FROM operations
+    WHERE user_id = %s
+        AND operation IN (%s, %s)
+        AND created_at BETWEEN %s AND %s
+    ORDER BY created_at
+"""
+
+LAST_SHIFT_QUERY = """
+    SELECT started_at, ended_at
+    FROM shifts
+    WHERE user_id = %s
+    ORDER BY started_at DESC
+    LIMIT 1
+"""
+
+# Отработано за текущий месяц: дни из сводок daily_attendance, кроме дней,
+# которые сводка могла ещё не учесть (aggregates.py пересчитывает её раз в
+# несколько минут), — по ним смены читаются из shifts. Это дни открытых смен
+# и смен, завершённых после отметки пересчёта (с запасом WATERMARK_OVERLAP);
+# открытая смена и перерыв считаются до текущего момента.
+MONTH_WORKED_TIME_QUERY = """
+    WITH live AS (
+        SELECT DISTINCT started_at::date AS day
+        FROM shifts
+        WHERE user_id = %(user_id)s AND started_at >= date_trunc('month', CURRENT_DATE)
+            AND (ended_at > (
+                SELECT checkpoint - %(overlap)s FROM aggregate_checkpoints WHERE name = %(checkpoint)s
+            )) IS NOT FALSE
+    )
+    SELECT COALESCE((
+        SELECT SUM(worked_seconds)
+        FROM daily_attendance
+        WHERE user_id = %(user_id)s AND day >= date_trunc('month', CURRENT_DATE)
+            AND day NOT IN (SELECT day FROM live)
+    ), 0) + COALESCE((
+        SELECT SUM(GREATEST(
+            EXTRACT(EPOCH FROM COALESCE(ended_at, LOCALTIMESTAMP) - started_at) - break_seconds
+            - CASE WHEN ended_at IS NULL AND break_started_at IS NOT NULL
+                THEN EXTRACT(EPOCH FROM LOCALTIMESTAMP - break_started_at) ELSE 0 END,
+            0))
+        FROM shifts
+        WHERE user_id = %(user_id)s AND started_at >= date_trunc('month', CURRENT_DATE)
+            AND started_at::date IN (SELECT day FROM live)
+    ), 0)
+"""
+
+BOOKED_DATES_QUERY = "SELECT DISTINCT date FROM weekends WHERE date BETWEEN %s AND %s"
+
+# Занятость проверяет уникальный индекс weekends_date_key: из двух
+# одновременных записей на одну дату вставится только одна
+BOOK_DAY_OFF_QUERY = """
+    INSERT INTO weekends (user_id, date) VALUES (%s, %s)
+    ON CONFLICT (date) DO NOTHING
+    RETURNING date
+"""
+
+
+@db_query
+async def get_user_state(user_id: int) -> dict:
+    state = state_cache.get(user_id)
+    if state is None:
+        version = state_cache.version
+        async with pool.connection() as conn:
+            cur = await conn.execute(
+                USER_STATE_QUERY, {"operations": list(OPERATION_PARAMS.values()), "user_id": user_id},
+            )
+            state = dict(await cur.fetchall())
+        state_cache.set(user_id, state, version)
+    return state
+
+
+# Изменения таблицы shifts для каждой операции. Выполняются в той же транзакции,
+# что и запись в журнал operations, и затрагивают только открытые смены пользователя.
+# RETURNING отдаёт дни изменённых смен для отметки в report_watermarks.
+SHIFT_UPDATES = {
+    OPERATION_START_SHIFT: """
+        INSERT INTO shifts (user_id, started_at) VALUES (%(user_id)s, %(created_at)s)
+        RETURNING started_at::date
+    """,
+    OPERATION_END_SHIFT: """
+        UPDATE shifts SET ended_at = %(created_at)s, break_started_at = NULL
+        WHERE user_id = %(user_id)s AND ended_at IS NULL
+        RETURNING started_at::date
+    """,
+    OPERATION_START_BREAK: """
+        UPDATE shifts SET break_started_at = %(created_at)s
+        WHERE user_id = %(user_id)s AND ended_at IS NULL
+        RETURNING started_at::date
+    """,
+    OPERATION_END_BREAK: """
+        UPDATE shifts
+        SET break_seconds = break_seconds + EXTRACT(EPOCH FROM %(created_at)s - break_started_at),
+            break_started_at = NULL
+        WHERE user_id = %(user_id)s AND ended_at IS NULL AND break_started_at IS NOT NULL
+        RETURNING started_at::date
+    """,
+    OPERATION_PHOTO_RECEIVED: """
+        UPDATE shifts SET has_photo = TRUE
+        WHERE user_id = %(user_id)s AND ended_at IS NULL
+        RETURNING started_at::date
+    """,
+}
+
+
+@db_query
+async def write_operations(operations: list) -> list:
+    """
+    Записывает операции [(user_id, operation), ...] одной транзакцией: один
+    многострочный INSERT, затем обновления смен. Возвращает WrittenOperation
+    (id и время) каждой операции в порядке входного списка.
+    """
+    # clock_timestamp() вычисляется для каждой строки VALUES по порядку, поэтому
+    # операции одного пользователя из одной пачки не получают одинаковое время
+    values = ", ".join(["(%s, %s, clock_timestamp()::timestamp)"] * len(operations))
+    params = [value for row in operations for value in row]
+    async with pool.connection() as conn:
+        cur = await conn.execute(
+            f"INSERT INTO operations (user_id, operation, created_at) VALUES {values} RETURNING id, created_at",
+            params,
+        )
+        written = [WrittenOperation(*row) for row in await cur.fetchall()]
+        created = [operation.created_at for operation in written]
+
+        cursors = []
+        async with conn.pipeline():
+            for (user_id, operation), created_at in zip(operations, created):
+                if operation in SHIFT_UPDATES:
+                    cur = await conn.execute(SHIFT_UPDATES[operation], {"user_id": user_id, "created_at": created_at})
+                    cursors.append((cur, created_at))
+            for user_id in {user_id for user_id, _ in operations}:
+                await notify_peers(conn, "state", user_id)
+        # Смены, начатые в прошлые дни (ночные), меняют уже закрытые периоды отчётов.
+        # Сегодняшний день не отмечается: отчёты, захватывающие его, не кэшируются.
+        past_days = set()
+        for cur, created_at in cursors:
+            past_days.update(row[0] for row in await cur.fetchall() if row[0] < created_at.date())
+        if past_days:
+            await mark_report_days_changed(conn, past_days)
+
+    # Запись в кэш сразу после фиксации транзакции; состояние, прочитанное
+    # параллельно до этой записи, в кэш уже не попадёт
+    state_cache.version += 1
+    for (user_id, operation), created_at in zip(operations, created):
+        state = state_cache.get(user_id)
+        if state is not None:
+            last_time = state.get(operation)
+            if last_time is None or last_time < created_at:
+                if operation == OPERATION_START_SHIFT:
+                    # Состояние считается с начала последней смены (USER_STATE_QUERY):
+                    # перерыв, не завершённый в прежней смене, к новой не относится
+                    state.clear()
+                state[operation] = created_at
+    return written
+
+
+class OperationWriter:
+    """
+    Групповая фиксация операций. Вызовы insert() из параллельных обработчиков
+    копятся до flush_interval секунд (или до max_batch штук) и записываются
+    одной транзакцией через write_operations, то есть одним fsync на пачку.
+    Каждый вызывающий получает свою операцию (WrittenOperation) только после
+    фиксации транзакции, так что пользователю не ответят раньше, чем запись сохранена.
+    """
+
+    def __init__(self, flush_interval: float, max_batch: int):
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self._pending = []
+        self._timer = None
+        self._writes = set()
+
+    async def insert(self, user_id: int, operation: str) -> WrittenOperation:
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((user_id, operation, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.flush_interval, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, []
+        task = asyncio.create_task(self._write(batch))
+        self._writes.add(task)
+        task.add_done_callback(self._writes.discard)
+
+    async def _write(self, batch):
+        try:
+            written = await write_operations([(user_id, operation) for user_id, operation, _ in batch])
+        except Exception as e:
+            # Пачка пишется одной транзакцией: при ошибке не записан никто
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+        else:
+            for (_, _, future), operation in zip(batch, written):
+                if not future.done():
+                    future.set_result(operation)
+
+    async def close(self):
+        """Дописывает накопленные операции; вызывается до закрытия пула."""
+        self._flush()
+        if self._writes:
+            await asyncio.gather(*self._writes, return_exceptions=True)
+
+
+operation_writer = OperationWriter(OPERATION_BATCH_INTERVAL, OPERATION_BATCH_MAX_SIZE) if OPERATION_BATCH_ENABLED else None
+
+
+async def write_operation(user_id: int, operation: str) -> WrittenOperation:
+    """Записывает операцию и возвращает её id и время (после фиксации в БД)."""
+    if operation_writer:
+        return await operation_writer.insert(user_id, operation)
+    (written,) = await write_operations([(user_id, operation)])
+    return written
+
+
+async def insert_operation(user_id: int, operation: str) -> datetime:
+    """Записывает операцию и возвращает её время (после фиксации в БД)."""
+    return (await write_operation(user_id, operation)).created_at
+
+
+async def get_last_operation_time(user_id: int, operation: str):
+    return (await get_user_state(user_id)).get(operation)
+
+
+async def _is_interval_open(user_id: int, start_operation: str, end_operation: str) -> bool:
+    # Интервал открыт, если после последнего начала не было ни одного завершения
+    state = await get_user_state(user_id)
+    start_time = state.get(start_operation)
+    if not start_time:
+        return False
+    end_time = state.get(end_operation)
+    return end_time is None or end_time <= start_time
+
+
+async def is_shift_active(user_id: int) -> bool:
+    return await _is_interval_open(user_id, OPERATION_START_SHIFT, OPERATION_END_SHIFT)
+
+
+async def is_break_active(user_id: int) -> bool:
+    return await _is_interval_open(user_id, OPERATION_START_BREAK, OPERATION_END_BREAK)
+
+
+@db_query
+async def calculate_break_duration(user_id: int, shift_start: datetime, shift_end: datetime) -> timedelta:
+    total_break = timedelta()
+    async with pool.connection() as conn:
+        cur = await conn.execute(BREAK_OPERATIONS_QUERY, (
+            user_id, OPERATION_START_BREAK, OPERATION_END_BREAK, shift_start, shift_end or datetime.now(),
+        ))
+        rows = await cur.fetchall()
+
+    start_break = None
+    for op_type, op_time in rows:
+        if op_type == OPERATION_START_BREAK:
+            start_break = op_time
+        elif op_type == OPERATION_END_BREAK and start_break:
+            total_break += op_time - start_break
+            start_break = None
+    return total_break
+
+
+@db_query
+async def get_last_shift_times(user_id: int):
+    async with pool.connection() as conn:
+        cur = await conn.execute(LAST_SHIFT_QUERY, (user_id,))
+        row = await cur.fetchone()
+        return (row[0], row[1]) if row else (None, None)
+
+
+@db_query
+async def get_month_worked_time(user_id: int) -> timedelta:
+    """Отработано за текущий месяц (см. MONTH_WORKED_TIME_QUERY)."""
+    async with pool.connection() as conn:
+        cur = await conn.execute(MONTH_WORKED_TIME_QUERY, {
+            "user_id": user_id, "checkpoint": CHECKPOINT_DAILY_ATTENDANCE, "overlap": WATERMARK_OVERLAP,
+        })
+        return timedelta(seconds=int((await cur.fetchone())[0]))
+
+
+def merge_windows(windows):
+    """
+    Объединяет пересекающиеся интервалы (user_id, начало, конец) одного
+    пользователя; начало None — без нижней границы.
+    """
+    merged = []
+    for user_id, started_from, started_to in sorted(windows, key=lambda w: (w[0], w[1] or datetime.min)):
+        if merged and merged[-1][0] == user_id and (started_from or datetime.min) <= merged[-1][2]:
+            merged[-1][2] = max(merged[-1][2], started_to)
+        else:
+            merged.append([user_id, started_from, started_to])
+    return merged
+
+
+@db_query
+async def apply_operation_edits():
+    """
+    Разбирает правки операций из админки (operation_edits): пересобирает только
+    смены, которые правка может изменить (OPERATION_EDIT_WINDOWS), дневные
+    сводки и замечания их дней и отметки кэша отчётов за эти дни. Правки удаляются в той же
+    транзакции, поэтому каждую разбирает один экземпляр бота, и при ошибке они
+    остаются до следующей попытки.
+    """
+    async with pool.connection() as conn:
+        cur = await conn.execute("DELETE FROM operation_edits RETURNING user_id, created_at")
+        edits = await cur.fetchall()
+        if not edits:
+            return
+        cur = await conn.execute(OPERATION_EDIT_WINDOWS, {
+            "user_ids": [user_id for user_id, _ in edits],
+            "created_at": [created_at for _, created_at in edits],
+            "start_shift": OPERATION_START_SHIFT,
+            "end_shift": OPERATION_END_SHIFT,
+        })
+        windows = await cur.fetchall()
+        # Смены архивированных месяцев (operations_archives) пересобрать уже не из чего, они сохраняются
+        cur = await conn.execute("SELECT MAX(range_to) FROM operations_archives")
+        archived_to = (await cur.fetchone())[0]
+
+        user_days = set()
+        for user_id, started_from, started_to in merge_windows([window[:3] for window in windows]):
+            if archived_to and (started_from is None or started_from < archived_to):
+                started_from = archived_to
+            params = {**OPERATION_PARAMS, "user_id": user_id, "started_from": started_from, "started_to": started_to}
+            cur = await conn.execute("""
+                DELETE FROM shifts
+                WHERE user_id = %(user_id)s
+                    AND started_at BETWEEN COALESCE(%(started_from)s::timestamp, '-infinity') AND %(started_to)s
+                RETURNING started_at::date
+            """, params)
+            user_days.update((user_id, row[0]) for row in await cur.fetchall())
+            cur = await conn.execute(SHIFTS_REBUILD + " RETURNING started_at::date", params)
+            user_days.update((user_id, row[0]) for row in await cur.fetchall())
+
+        # Замечания — с дня правки до первого после неё начала или конца смены
+        # (None — до последней операции) и за дни пересобранных смен
+        notes_windows = {}
+        for user_id, _, created_at, next_shift_at in windows:
+            day_to = next_shift_at.date() if next_shift_at else None
+            if user_id in notes_windows:
+                day_from, previous_to = notes_windows[user_id]
+                day_to = max(day_to, previous_to) if day_to and previous_to else None
+                notes_windows[user_id] = (min(day_from, created_at.date()), day_to)
+            else:
+                notes_windows[user_id] = (created_at.date(), day_to)
+        for user_id, day in user_days:
+            day_from, day_to = notes_windows[user_id]
+            notes_windows[user_id] = (min(day_from, day), max(day_to, day) if day_to else None)
+
+        # Дневные сводки пересчитываются только за дни пересобранных смен
+        await conn.execute("SELECT pg_advisory_xact_lock(%s)", (DAILY_ATTENDANCE_LOCK_ID,))
+        if user_days:
+            params = {"user_ids": [user_id for user_id, _ in sorted(user_days)],
+                      "days": [day for _, day in sorted(user_days)]}
+            await conn.execute(DAILY_ATTENDANCE_DAYS_DELETE, params)
+            await conn.execute(DAILY_ATTENDANCE_DAYS_ROLLUP, params)
+        user_days.update(await refresh_notes(conn, notes_windows))
+        if user_days:
+            await mark_report_days_changed(conn, {day for _, day in user_days})
+
+
+# Отметка "данные за день изменились" для кэша отчётов. День ALL_DAYS
+# отмечает изменения, касающиеся всех периодов (например, новый сотрудник).
+ALL_DAYS = date.min
+
+
+async def mark_report_days_changed(conn, days):
+    await conn.execute("""
+        INSERT INTO report_watermarks (day, changed_at)
+        SELECT day, clock_timestamp()::timestamp FROM unnest(%s::date[]) AS day
+        ON CONFLICT (day) DO UPDATE SET changed_at = EXCLUDED.changed_at
+    """, (sorted(days),))
+
+
+@db_query
+async def get_report_watermark(date_from: date, date_to: date):
+    async with pool.connection() as conn:
+        cur = await conn.execute("""
+            SELECT MAX(changed_at)
+            FROM report_watermarks
+            WHERE day BETWEEN %s AND %s OR day = %s
+        """, (date_from, date_to, ALL_DAYS))
+        return (await cur.fetchone())[0]
+
+
+@db_query
+async def get_db_time() -> datetime:
+    async with pool.connection() as conn:
+        cur = await conn.execute("SELECT LOCALTIMESTAMP")
+        return (await cur.fetchone())[0]
+
+
+@db_query
+async def get_booked_dates(date_from: date, date_to: date) -> set:
+    key = (date_from, date_to)
+    booked = booked_dates_cache.get(key)
+    if booked is None:
+        version = booked_dates_cache.version
+        async with pool.connection() as conn:
+            cur = await conn.execute(BOOKED_DATES_QUERY, (date_from, date_to))
+            booked = {row[0] for row in await cur.fetchall()}
+        booked_dates_cache.set(key, booked, version)
+    return booked
+
+
+@db_query
+async def book_day_off(user_id: int, day: date) -> bool:
+    """Ставит выходной, если день ещё свободен. Возвращает False, если день занят."""
+    async with pool.connection() as conn:
+        cur = await conn.execute(BOOK_DAY_OFF_QUERY, (user_id, day))
+        booked = await cur.fetchone() is not None
+        if booked:
+            await notify_peers(conn, "weekends", day.isoformat())
+    if booked:
+        booked_dates_cache.clear()
+    return booked
@@ -0,0 +1,152 @@
+import asyncio
+import copy
+import json
+import logging
+from datetime import date, datetime, timedelta
+from typing import Any, Mapping, NamedTuple, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+
+from db import pool, fsm_cache, notify_peers
+from metrics import db_query
+
+logger = logging.getLogger(__name__)
+
+# Как часто удалять заброшенные состояния, сек.
+CLEANUP_INTERVAL = 60 * 60
+
+
+class FSMRecord(NamedTuple):
+    state: Optional[str]
+    data: dict
+
+
+EMPTY_RECORD = FSMRecord(None, {})
+
+
+def _encode(value):
+    # Даты в данных диалогов (период отчёта, страница календаря) сохраняются
+    # с пометкой типа, чтобы обработчики получали обратно date, а не строку
+    if isinstance(value, datetime):
+        return {"$datetime": value.isoformat()}
+    if isinstance(value, date):
+        return {"$date": value.isoformat()}
+    raise TypeError(f"Тип {type(value).__name__} не сохраняется в состоянии FSM")
+
+
+def _decode(obj: dict):
+    if len(obj) == 1:
+        if "$datetime" in obj:
+            return datetime.fromisoformat(obj["$datetime"])
+        if "$date" in obj:
+            return date.fromisoformat(obj["$date"])
+    return obj
+
+
+def dumps_data(data: Mapping[str, Any]) -> str:
+    return json.dumps(data, default=_encode, ensure_ascii=False)
+
+
+def loads_data(raw: str) -> dict:
+    return json.loads(raw, object_hook=_decode)
+
+
+class PostgresStorage(BaseStorage):
+    """
+    Хранилище FSM в таблице fsm_states: состояние диалогов переживает
+    перезапуск и общее для всех экземпляров бота. Чтения идут через fsm_cache,
+    записи сразу попадают в БД, а остальные экземпляры сбрасывают свою копию
+    по уведомлению "fsm:<ключ>". Состояние, не менявшееся дольше state_ttl
+    секунд, считается отсутствующим и удаляется фоновой задачей.
+    """
+
+    def __init__(self, state_ttl: int, key_builder: Optional[KeyBuilder] = None):
+        self.state_ttl = timedelta(seconds=state_ttl)
+        self.key_builder = key_builder or DefaultKeyBuilder(with_destiny=True)
+        self._cleanup_task = None
+
+    def start(self):
+        """Запускает удаление заброшенных состояний; вызывается после открытия пула."""
+        self._cleanup_task = asyncio.create_task(self._cleanup_loop())
+
+    async def close(self) -> None:
+        if self._cleanup_task:
+            self._cleanup_task.cancel()
+            self._cleanup_task = None
+
+    async def _cleanup_loop(self):
+        while True:
+            try:
+                async with pool.connection() as conn:
+                    cur = await conn.execute(
+                        "DELETE FROM fsm_states WHERE updated_at < LOCALTIMESTAMP - %s",
+                        (self.state_ttl,),
+                    )
+                if cur.rowcount:
+                    logger.info("Удалено заброшенных состояний FSM: %s", cur.rowcount)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Не удалось удалить заброшенные состояния FSM")
+            await asyncio.sleep(CLEANUP_INTERVAL)
+
+    @db_query
+    async def _load(self, key: str) -> FSMRecord:
+        record = fsm_cache.get(key)
+        if record is None:
+            version = fsm_cache.version
+            async with pool.connection() as conn:
+                cur = await conn.execute("""
+                    SELECT state, data::text
+                    FROM fsm_states
+                    WHERE key = %s AND updated_at >= LOCALTIMESTAMP - %s
+                """, (key, self.state_ttl))
+                row = await cur.fetchone()
+            record = FSMRecord(row[0], loads_data(row[1])) if row else EMPTY_RECORD
+            fsm_cache.set(key, record, version)
+        return record
+
+    @db_query
+    async def _save(self, key: str, column: str, value):
+        # Состояние и данные пишутся отдельными столбцами, чтобы параллельные
+        # set_state и set_data с разных экземпляров не затирали друг друга
+        async with pool.connection() as conn:
+            cur = await conn.execute(f"""
+                INSERT INTO fsm_states (key, {column}, updated_at)
+                VALUES (%s, %s, LOCALTIMESTAMP)
+                ON CONFLICT (key) DO UPDATE
+                    SET {column} = EXCLUDED.{column}, updated_at = EXCLUDED.updated_at
+                RETURNING state, data::text
+            """, (key, value))
+            state, raw_data = await cur.fetchone()
+            record = FSMRecord(state, loads_data(raw_data))
+            if record == EMPTY_RECORD:
+                await conn.execute("DELETE FROM fsm_states WHERE key = %s", (key,))
+            await notify_peers(conn, "fsm", key)
+        fsm_cache.version += 1
+        fsm_cache.set(key, record)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        storage_key = self.key_builder.build(key)
+        state = state.state if isinstance(state, State) else state
+        current = await self._load(storage_key)
+        if state is None and current == EMPTY_RECORD:
+            return
+        await self._save(storage_key, "state", state)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        record = await self._load(self.key_builder.build(key))
+        return record.state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        storage_key = self.key_builder.build(key)
+        current = await self._load(storage_key)
+        if not data and current == EMPTY_RECORD:
+            return
+        await self._save(storage_key, "data", dumps_data(data))
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        record = await self._load(self.key_builder.build(key))
+        # Копия: вызывающий код (например, update_data) меняет словарь на месте
+        return copy.deepcopy(record.data)
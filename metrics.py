@@ -0,0 +1,302 @@
+import asyncio
+import functools
+import logging
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiohttp import web
+from psycopg import AsyncConnection, AsyncCursor, AsyncServerCursor
+
+from config import METRICS_ENABLED, METRICS_HOST, METRICS_PORT
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм: время, сек., и размер отчёта, байт
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = tuple(1024 * 4 ** i for i in range(10))
+
+# Период замера задержки цикла событий, сек.
+LOOP_LAG_INTERVAL = 0.5
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Metric:
+    """Метрика с метками в текстовом формате Prometheus; значения по кортежу значений меток."""
+
+    type = None
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.values = {}
+        registry.append(self)
+
+    def _labels(self, labelvalues) -> str:
+        if not labelvalues:
+            return ""
+        pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, labelvalues))
+        return "{" + pairs + "}"
+
+    def render(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.type}"
+        for labelvalues, value in self.values.items():
+            yield f"{self.name}{self._labels(labelvalues)} {value}"
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, *labelvalues, amount: float = 1):
+        self.values[labelvalues] = self.values.get(labelvalues, 0) + amount
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def set(self, value: float, *labelvalues):
+        self.values[labelvalues] = value
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=DURATION_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = buckets
+
+    def observe(self, value: float, *labelvalues):
+        series = self.values.get(labelvalues)
+        if series is None:
+            # [счётчики корзин..., сумма, количество]
+            series = self.values[labelvalues] = [0] * len(self.buckets) + [0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[i] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.type}"
+        for labelvalues, series in self.values.items():
+            labels = self._labels(labelvalues)
+            inner = labels[1:-1] + "," if labels else ""
+            for bound, count in zip(self.buckets, series):
+                yield f'{self.name}_bucket{{{inner}le="{bound}"}} {count}'
+            yield f'{self.name}_bucket{{{inner}le="+Inf"}} {series[-1]}'
+            yield f"{self.name}_sum{labels} {series[-2]}"
+            yield f"{self.name}_count{labels} {series[-1]}"
+
+
+registry = []
+
+updates_total = Counter("bot_updates_total", "Полученные обновления по типу", ("type",))
+update_duration = Histogram("bot_update_duration_seconds", "Обработка обновления целиком", ("type",))
+handler_duration = Histogram("bot_handler_duration_seconds", "Время обработчика", ("handler",))
+handler_errors = Counter("bot_handler_errors_total", "Исключения в обработчиках", ("handler",))
+db_queries = Counter("bot_db_queries_total", "Запросы к БД", ("query",))
+db_query_duration = Histogram("bot_db_query_duration_seconds", "Время запроса к БД", ("query",))
+db_query_errors = Counter("bot_db_query_errors_total", "Ошибки запросов к БД", ("query",))
+report_requests = Counter("bot_report_requests_total", "Запрошенные отчёты", ("format", "source"))
+report_duration = Histogram("bot_report_duration_seconds", "Построение отчёта", ("format",))
+report_size = Histogram("bot_report_size_bytes", "Размер построенного отчёта", ("format",), SIZE_BUCKETS)
+telegram_duration = Histogram("bot_telegram_request_duration_seconds", "Запросы к Bot API", ("method",))
+telegram_errors = Counter("bot_telegram_request_errors_total", "Ошибки запросов к Bot API", ("method", "error"))
+photos_total = Counter("bot_photos_total", "Загрузки фото по результату", ("result",))
+report_jobs_total = Counter("bot_report_jobs_total", "Задания на отчёты по результату", ("result",))
+loop_lag = Gauge("bot_event_loop_lag_seconds", "Запаздывание цикла событий")
+
+
+def render() -> str:
+    lines = []
+    for metric in registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# Имя запроса к БД для меток: функция db.py, внутри которой выполняется запрос
+current_query = ContextVar("current_query", default="other")
+
+
+def db_query(func):
+    """Помечает запросы внутри функции её именем. Без METRICS_ENABLED функция не оборачивается."""
+    if not METRICS_ENABLED:
+        return func
+    name = func.__qualname__
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        token = current_query.set(name)
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            current_query.reset(token)
+    return wrapper
+
+
+async def _timed_execute(execute, name: str):
+    started = time.perf_counter()
+    try:
+        return await execute()
+    except Exception:
+        db_query_errors.inc(name)
+        raise
+    finally:
+        db_queries.inc(name)
+        db_query_duration.observe(time.perf_counter() - started, name)
+
+
+class InstrumentedCursor(AsyncCursor):
+    async def execute(self, query, params=None, **kwargs):
+        return await _timed_execute(lambda: super(InstrumentedCursor, self).execute(query, params, **kwargs),
+                                    current_query.get())
+
+    @asynccontextmanager
+    async def copy(self, statement, params=None, **kwargs):
+        # COPY замеряется целиком, вместе с передачей данных внутри блока
+        name = current_query.get()
+        started = time.perf_counter()
+        try:
+            async with super().copy(statement, params, **kwargs) as copy:
+                yield copy
+        except Exception:
+            db_query_errors.inc(name)
+            raise
+        finally:
+            db_queries.inc(name)
+            db_query_duration.observe(time.perf_counter() - started, name)
+
+
+class InstrumentedServerCursor(AsyncServerCursor):
+    # Именованный курсор (отчёты) помечается своим именем
+    async def execute(self, query, params=None, **kwargs):
+        return await _timed_execute(lambda: super(InstrumentedServerCursor, self).execute(query, params, **kwargs),
+                                    self.name)
+
+
+class InstrumentedConnection(AsyncConnection):
+    """Соединение пула, замеряющее каждый запрос; используется только при METRICS_ENABLED."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cursor_factory = InstrumentedCursor
+        self.server_cursor_factory = InstrumentedServerCursor
+
+
+class UpdateMetricsMiddleware(BaseMiddleware):
+    """Внешний middleware диспетчера: число и время обработки обновлений по типу."""
+
+    async def __call__(self, handler: Callable[[Any, Dict[str, Any]], Awaitable[Any]], event, data: Dict[str, Any]):
+        update_type = event.event_type
+        updates_total.inc(update_type)
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            update_duration.observe(time.perf_counter() - started, update_type)
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Внутренний middleware: время конкретного обработчика из bot.py."""
+
+    async def __call__(self, handler: Callable[[Any, Dict[str, Any]], Awaitable[Any]], event, data: Dict[str, Any]):
+        # Для кнопок диспетчер вызывает ButtonRouter, настоящий обработчик — в route
+        route = data.get("route")
+        name = route[0] if route else data["handler"].callback.__name__
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            handler_errors.inc(name)
+            raise
+        finally:
+            handler_duration.observe(time.perf_counter() - started, name)
+
+
+class TelegramMetricsMiddleware(BaseRequestMiddleware):
+    """Middleware сессии бота: время и ошибки исходящих запросов к Bot API."""
+
+    async def __call__(self, make_request, bot, method):
+        name = type(method).__name__
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception as e:
+            telegram_errors.inc(name, type(e).__name__)
+            raise
+        finally:
+            telegram_duration.observe(time.perf_counter() - started, name)
+
+
+def observe_report(format_choice: str, seconds: float, size: int):
+    if METRICS_ENABLED:
+        report_duration.observe(seconds, format_choice)
+        report_size.observe(size, format_choice)
+
+
+def count_report_request(format_choice: str, source: str):
+    if METRICS_ENABLED:
+        report_requests.inc(format_choice, source)
+
+
+def count_photo(result: str):
+    if METRICS_ENABLED:
+        photos_total.inc(result)
+
+
+def count_report_job(result: str):
+    if METRICS_ENABLED:
+        report_jobs_total.inc(result)
+
+
+async def _measure_loop_lag():
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(LOOP_LAG_INTERVAL)
+        loop_lag.set(max(0.0, time.perf_counter() - started - LOOP_LAG_INTERVAL))
+
+
+async def _metrics_handler(request: web.Request) -> web.Response:
+    return web.Response(text=render(), content_type="text/plain", charset="utf-8",
+                        headers={"X-Content-Type-Options": "nosniff"})
+
+
+class MetricsServer:
+    """HTTP-сервер /metrics на METRICS_HOST:METRICS_PORT и замер задержки цикла событий."""
+
+    def __init__(self):
+        self._runner = None
+        self._lag_task = None
+
+    def instrument(self, dp, bot):
+        dp.update.outer_middleware(UpdateMetricsMiddleware())
+        dp.message.middleware(HandlerMetricsMiddleware())
+        dp.callback_query.middleware(HandlerMetricsMiddleware())
+        bot.session.middleware(TelegramMetricsMiddleware())
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/metrics", _metrics_handler)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, METRICS_HOST, METRICS_PORT).start()
+        self._lag_task = asyncio.create_task(_measure_loop_lag())
+        logger.info("Метрики доступны на %s:%s/metrics", METRICS_HOST, METRICS_PORT)
+
+    async def stop(self):
+        if self._lag_task:
+            self._lag_task.cancel()
+        if self._runner:
+            await self._runner.cleanup()
+
+
+metrics_server = MetricsServer()
@@ -0,0 +1,187 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import SendChatAction
+
+logger = logging.getLogger(__name__)
+
+# Приоритеты исходящих сообщений: ответы пользователю уходят раньше массовых рассылок
+PRIORITY_REPLY = 0
+PRIORITY_BULK = 1
+
+send_priority = ContextVar("send_priority", default=PRIORITY_REPLY)
+
+# Методы с chat_id, на которые ограничения частоты сообщений не распространяются
+UNLIMITED_METHODS = (SendChatAction,)
+
+# Как часто удалять ограничители чатов, которые давно ничего не отправляли
+CHAT_CLEANUP_EVERY = 1000
+
+
+@contextmanager
+def bulk_sends():
+    """
+    Запросы к Bot API внутри блока отправляются с низким приоритетом (рассылки,
+    отчёты report_jobs). Задачи, созданные в блоке, наследуют приоритет.
+    """
+    token = send_priority.set(PRIORITY_BULK)
+    try:
+        yield
+    finally:
+        send_priority.reset(token)
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_take(self) -> bool:
+        now = time.monotonic()
+        self._refill(now)
+        if now < self.blocked_until or self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+    def give_back(self):
+        self.tokens = min(self.capacity, self.tokens + 1)
+
+    def time_until_token(self) -> float:
+        now = time.monotonic()
+        self._refill(now)
+        return max(self.blocked_until - now, (1 - self.tokens) / self.rate, 0.0)
+
+    def block(self, seconds: float):
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+    @property
+    def idle(self) -> bool:
+        self._refill(time.monotonic())
+        return self.tokens >= self.capacity and time.monotonic() >= self.blocked_until
+
+
+class PriorityLimiter:
+    """
+    Ограничитель частоты на токенах: acquire() ждёт свободный токен, а при
+    очереди ожидающих токены раздаются по приоритету, в пределах одного
+    приоритета — по порядку прихода.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.bucket = TokenBucket(rate, capacity)
+        self._waiters = []
+        self._seq = itertools.count()
+        self._wakeup = None
+
+    @property
+    def idle(self) -> bool:
+        return not self._waiters and self.bucket.idle
+
+    async def acquire(self, priority: int):
+        if not self._waiters and self.bucket.try_take():
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        self._schedule()
+        await future
+
+    def pause(self, seconds: float):
+        self.bucket.block(seconds)
+        if self._wakeup:
+            self._wakeup.cancel()
+            self._wakeup = None
+        self._schedule()
+
+    def _schedule(self):
+        if self._wakeup is None and self._waiters:
+            self._wakeup = asyncio.get_running_loop().call_later(self.bucket.time_until_token(), self._release)
+
+    def _release(self):
+        self._wakeup = None
+        while self._waiters:
+            if self._waiters[0][2].done():
+                # Ожидавший отменён (например, обработчик прерван)
+                heapq.heappop(self._waiters)
+                continue
+            if not self.bucket.try_take():
+                break
+            heapq.heappop(self._waiters)[2].set_result(None)
+        self._schedule()
+
+
+class OutboundScheduler(BaseRequestMiddleware):
+    """
+    Middleware сессии бота для исходящих сообщений. Каждый запрос с chat_id
+    берёт токен ограничителя своего чата и общего ограничителя бота (лимиты
+    Telegram: около одного сообщения в секунду в чат и 30 в секунду всего),
+    ответы пользователям обходят в очереди массовые рассылки (bulk_sends).
+    На 429 "Too Many Requests" чат приостанавливается на retry_after секунд,
+    и запрос повторяется до max_retries раз.
+
+    Запросы без chat_id (getUpdates, answerCallbackQuery и т.п.) не ограничиваются
+    и не повторяются, но 429 на них — ограничение бота целиком: на retry_after
+    секунд приостанавливается общий ограничитель, то есть все сообщения в чаты.
+    """
+
+    def __init__(self, global_rate: float, global_burst: float, chat_rate: float, chat_burst: float,
+                 max_retries: int):
+        self.global_limiter = PriorityLimiter(global_rate, global_burst)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.chats = {}
+        self._acquired = 0
+
+    def _chat_limiter(self, chat_id) -> PriorityLimiter:
+        limiter = self.chats.get(chat_id)
+        if limiter is None:
+            limiter = self.chats[chat_id] = PriorityLimiter(self.chat_rate, self.chat_burst)
+        self._acquired += 1
+        if self._acquired % CHAT_CLEANUP_EVERY == 0:
+            for idle_chat in [chat for chat, chat_limiter in self.chats.items() if chat_limiter.idle]:
+                if idle_chat != chat_id:
+                    del self.chats[idle_chat]
+        return limiter
+
+    async def __call__(self, make_request, bot, method):
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is None:
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                logger.warning("Flood control бота на %s: отправка приостановлена на %s с",
+                               type(method).__name__, e.retry_after)
+                self.global_limiter.pause(e.retry_after)
+                raise
+        if isinstance(method, UNLIMITED_METHODS):
+            return await make_request(bot, method)
+
+        priority = send_priority.get()
+        chat_limiter = self._chat_limiter(chat_id)
+        for attempt in range(self.max_retries + 1):
+            await chat_limiter.acquire(priority)
+            await self.global_limiter.acquire(priority)
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                if attempt == self.max_retries:
+                    raise
+                logger.warning("Flood control для чата %s: повтор %s через %s с",
+                               chat_id, type(method).__name__, e.retry_after)
+                chat_limiter.pause(e.retry_after)
@@ -0,0 +1,231 @@
+from datetime import datetime, timedelta
+from typing import NamedTuple
+
+import numpy as np
+
+from schema import OPERATION_PARAMS
+
+# Коды операций в массивах (остальные операции — CODE_OTHER)
+CODE_OTHER = 0
+CODE_START_SHIFT = 1
+CODE_END_SHIFT = 2
+CODE_START_BREAK = 3
+CODE_END_BREAK = 4
+CODE_PHOTO = 5
+
+# Нарушения последовательности операций: код в массиве — индекс в ANOMALY_KINDS
+ANOMALY_DOUBLE_START = 0
+ANOMALY_END_WITHOUT_START = 1
+ANOMALY_BREAK_OUTSIDE_SHIFT = 2
+ANOMALY_BREAK_END_WITHOUT_START = 3
+ANOMALY_KINDS = (
+    "повторное начало смены",
+    "конец смены без начала",
+    "перерыв вне смены",
+    "конец перерыва без начала",
+)
+
+# Время в массивах — микросекунды от 2000-01-01, как в двоичном COPY PostgreSQL
+EPOCH = datetime(2000, 1, 1)
+US_PER_DAY = 86_400_000_000
+
+# Сотрудников на один COPY при пересчёте замечаний: в памяти операции только
+# этих сотрудников, а не весь журнал (полный пересчёт сводок)
+NOTES_BATCH_USERS = 1000
+
+# Строка двоичного COPY: число полей, затем длина и значение каждого поля
+COPY_HEADER_SIZE = 19
+COPY_ROW = np.dtype([
+    ("fields", ">i2"),
+    ("user_id_size", ">i4"), ("user_id", ">i4"),
+    ("code_size", ">i4"), ("code", ">i2"),
+    ("created_at_size", ">i4"), ("created_at", ">i8"),
+])
+
+# Операции сотрудников user_ids с дня days_from по день days_to включительно
+# (NULL — по последнюю операцию). Чтение начинается раньше days_from, с начала
+# смены, не завершённой к этому дню (последняя смена в shifts, начатая раньше):
+# без неё операции этой смены дали бы ложные нарушения, как бы давно она ни началась.
+LOAD_OPERATIONS = """
+    COPY (
+        SELECT o.user_id,
+            (CASE o.operation
+                WHEN %(start_shift)s THEN 1
+                WHEN %(end_shift)s THEN 2
+                WHEN %(start_break)s THEN 3
+                WHEN %(end_break)s THEN 4
+                WHEN %(photo_received)s THEN 5
+                ELSE 0
+            END)::smallint,
+            o.created_at
+        FROM unnest(%(user_ids)s::integer[], %(days_from)s::date[], %(days_to)s::date[])
+            AS t(user_id, day_from, day_to)
+        LEFT JOIN LATERAL (
+            SELECT started_at, ended_at
+            FROM shifts
+            WHERE user_id = t.user_id AND started_at < t.day_from
+            ORDER BY started_at DESC
+            LIMIT 1
+        ) s ON s.ended_at IS NULL OR s.ended_at >= t.day_from
+        JOIN operations o ON o.user_id = t.user_id
+            AND o.created_at >= LEAST(s.started_at, t.day_from)
+            AND o.created_at < COALESCE(t.day_to + 1, 'infinity')
+    ) TO STDOUT (FORMAT BINARY)
+"""
+
+# Замечания в тех же окнах снимаются: строки, где кроме замечаний ничего нет
+# (shift_count = 0), удаляются, у остальных notes обнуляется. Возвращает дни,
+# где замечания были
+CLEAR_NOTES = """
+    WITH windows AS (
+        SELECT * FROM unnest(%(user_ids)s::integer[], %(days_from)s::date[], %(days_to)s::date[])
+            AS t(user_id, day_from, day_to)
+    ), cleared AS (
+        DELETE FROM daily_attendance d
+        USING windows t
+        WHERE d.user_id = t.user_id AND d.day BETWEEN t.day_from AND COALESCE(t.day_to, 'infinity')
+            AND d.shift_count = 0
+        RETURNING d.user_id, d.day
+    ), updated AS (
+        UPDATE daily_attendance d
+        SET notes = NULL
+        FROM windows t
+        WHERE d.user_id = t.user_id AND d.day BETWEEN t.day_from AND COALESCE(t.day_to, 'infinity')
+            AND d.shift_count > 0 AND d.notes IS NOT NULL
+        RETURNING d.user_id, d.day
+    )
+    SELECT * FROM cleared UNION ALL SELECT * FROM updated
+"""
+
+# День только с замечаниями (например, перерыв вне смены) — строка без смен
+SAVE_NOTES = """
+    INSERT INTO daily_attendance (user_id, day, notes, worked_seconds, break_seconds, shift_count)
+    SELECT user_id, day, notes, 0, 0, 0
+    FROM unnest(%(user_ids)s::integer[], %(days)s::date[], %(notes)s::text[]) AS t(user_id, day, notes)
+    ON CONFLICT (user_id, day) DO UPDATE SET notes = EXCLUDED.notes
+"""
+
+
+class OperationArrays(NamedTuple):
+    """Операции по столбцам, упорядоченные по пользователю и времени."""
+    user_id: np.ndarray
+    code: np.ndarray
+    created_at: np.ndarray
+
+    @classmethod
+    def sorted(cls, user_id, code, created_at) -> "OperationArrays":
+        order = np.lexsort((created_at, user_id))
+        return cls(np.asarray(user_id, np.int32)[order], np.asarray(code, np.int8)[order],
+                   np.asarray(created_at, np.int64)[order])
+
+
+class AnomalyArrays(NamedTuple):
+    user_id: np.ndarray
+    created_at: np.ndarray
+    kind: np.ndarray
+
+
+def to_datetime(value: int) -> datetime:
+    return EPOCH + timedelta(microseconds=int(value))
+
+
+def to_us(value: datetime) -> int:
+    return (value - EPOCH) // timedelta(microseconds=1)
+
+
+def parse_copy(data: bytes) -> OperationArrays:
+    """Разбирает двоичный COPY запроса LOAD_OPERATIONS (строки фиксированной длины)."""
+    offset = COPY_HEADER_SIZE + int.from_bytes(data[15:19], "big")
+    rows = np.frombuffer(data, COPY_ROW, count=(len(data) - offset - 2) // COPY_ROW.itemsize, offset=offset)
+    return OperationArrays.sorted(rows["user_id"], rows["code"], rows["created_at"])
+
+
+async def load_operations(conn, params: dict) -> OperationArrays:
+    """Операции запроса LOAD_OPERATIONS одним двоичным COPY, без объектов на каждую строку."""
+    data = bytearray()
+    async with conn.cursor().copy(LOAD_OPERATIONS, {**OPERATION_PARAMS, **params}) as copy:
+        async for chunk in copy:
+            data += chunk
+    return parse_copy(data)
+
+
+def _previous_index(mask: np.ndarray, user_id: np.ndarray) -> np.ndarray:
+    """Индекс предыдущей строки с mask того же пользователя (строго раньше) или -1."""
+    n = len(mask)
+    previous = np.maximum.accumulate(np.where(mask, np.arange(n), -1))
+    previous = np.r_[-1, previous][:-1]
+    same_user = previous >= 0
+    same_user[same_user] = user_id[previous[same_user]] == user_id[same_user]
+    return np.where(same_user, previous, -1)
+
+
+def find_anomalies(ops: OperationArrays) -> AnomalyArrays:
+    """
+    Нарушения последовательности: начало смены при открытой смене, конец смены
+    без открытой, операции перерыва вне смены и конец перерыва без начала.
+    Перерыв, начатый до последнего начала смены, к ней не относится (как
+    в SHIFTS_REBUILD), поэтому нарушения не зависят от операций раньше этой смены.
+    """
+    shift_ops = (ops.code == CODE_START_SHIFT) | (ops.code == CODE_END_SHIFT)
+    previous_shift_op = _previous_index(shift_ops, ops.user_id)
+    in_shift = previous_shift_op >= 0
+    in_shift[in_shift] = ops.code[previous_shift_op[in_shift]] == CODE_START_SHIFT
+
+    break_ops = (ops.code == CODE_START_BREAK) | (ops.code == CODE_END_BREAK)
+    previous_break_op = _previous_index(break_ops, ops.user_id)
+    break_started = previous_break_op > previous_shift_op
+    break_started[break_started] = ops.code[previous_break_op[break_started]] == CODE_START_BREAK
+
+    kind = np.full(len(ops.code), -1, np.int8)
+    kind[(ops.code == CODE_END_BREAK) & ~break_started] = ANOMALY_BREAK_END_WITHOUT_START
+    kind[break_ops & ~in_shift] = ANOMALY_BREAK_OUTSIDE_SHIFT
+    kind[(ops.code == CODE_END_SHIFT) & ~in_shift] = ANOMALY_END_WITHOUT_START
+    kind[(ops.code == CODE_START_SHIFT) & in_shift] = ANOMALY_DOUBLE_START
+    rows = np.flatnonzero(kind >= 0)
+    return AnomalyArrays(ops.user_id[rows], ops.created_at[rows], kind[rows])
+
+
+def anomaly_notes(anomalies: AnomalyArrays, user_ids: list, days_from: list) -> dict:
+    """
+    Нарушения по дням: (user_id, день) -> текст для столбца "Замечания" отчёта.
+    Учитываются дни сотрудника user_ids[i] начиная с days_from[i] (user_ids
+    упорядочены); более ранние операции читались только ради состояния смены.
+    """
+    first_us = np.array([to_us(datetime.combine(day, datetime.min.time())) for day in days_from], np.int64)
+    counted = anomalies.created_at >= first_us[np.searchsorted(user_ids, anomalies.user_id)]
+    days = anomalies.created_at[counted] // US_PER_DAY
+    found = np.unique(np.stack([anomalies.user_id[counted].astype(np.int64), days,
+                                anomalies.kind[counted].astype(np.int64)], axis=1), axis=0)
+    notes = {}
+    for user_id, day, kind in found.tolist():
+        notes.setdefault((user_id, EPOCH.date() + timedelta(days=day)), []).append(ANOMALY_KINDS[kind])
+    return {key: ", ".join(kinds) for key, kinds in notes.items()}
+
+
+async def refresh_notes(conn, windows: dict) -> set:
+    """
+    Пересчитывает замечания daily_attendance.notes. windows — user_id ->
+    (первый день, последний день или None — по последнюю операцию).
+    Возвращает (user_id, день) с замечаниями до или после пересчёта.
+    """
+    changed = set()
+    windows = sorted(windows.items())
+    for batch_start in range(0, len(windows), NOTES_BATCH_USERS):
+        batch = windows[batch_start:batch_start + NOTES_BATCH_USERS]
+        params = {
+            "user_ids": [user_id for user_id, _ in batch],
+            "days_from": [day_from for _, (day_from, _) in batch],
+            "days_to": [day_to for _, (_, day_to) in batch],
+        }
+        anomalies = find_anomalies(await load_operations(conn, params))
+        notes = anomaly_notes(anomalies, params["user_ids"], params["days_from"])
+        cur = await conn.execute(CLEAR_NOTES, params)
+        changed.update(await cur.fetchall())
+        changed.update(notes)
+        if notes:
+            await conn.execute(SAVE_NOTES, {
+                "user_ids": [user_id for user_id, _ in notes],
+                "days": [day for _, day in notes],
+                "notes": list(notes.values()),
+            })
+    return changed
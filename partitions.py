@@ -0,0 +1,190 @@
+import asyncio
+import gzip
+import logging
+import os
+import re
+from datetime import date
+
+from psycopg import sql
+
+from config import (
+    OPERATIONS_PARTITIONS_AHEAD, OPERATIONS_RETENTION_MONTHS, OPERATIONS_ARCHIVE_DIR,
+    OPERATIONS_MAINTENANCE_INTERVAL,
+)
+from db import pool, get_db_time
+from metrics import db_query
+
+logger = logging.getLogger(__name__)
+
+# Advisory-блокировка обслуживания: если экземпляров бота несколько,
+# секции создаёт и архивирует только один из них
+MAINTENANCE_LOCK_ID = 7_310_002
+
+PARTITION_NAME = re.compile(r"^operations_(\d{4})_(\d{2})$")
+
+# Объём выгрузки, который копится в памяти перед записью в сжатый файл
+ARCHIVE_WRITE_CHUNK = 1024 * 1024
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+class OperationPartitions:
+    """
+    Обслуживание секционированного журнала operations (schema.py, миграция 7).
+    Заранее создаёт месячные секции на months_ahead месяцев вперёд, а строки,
+    попавшие в operations_default, переносит в секции своих месяцев.
+
+    Если задан retention_months, секции месяцев, закончившихся раньше
+    retention_months полных месяцев назад, архивируются: секция отсоединяется
+    от operations (короткая блокировка), выгружается в archive_dir в CSV с gzip
+    и удаляется, а в operations_archives остаётся запись о файле. Отсоединённая,
+    но не выгруженная секция (бот остановлен посередине) выгружается при
+    следующем запуске. Смены (shifts) и отчёты по ним архивация не затрагивает.
+    """
+
+    def __init__(self, months_ahead: int, retention_months: int, archive_dir: str, interval: int):
+        self.months_ahead = months_ahead
+        self.retention_months = retention_months
+        self.archive_dir = archive_dir
+        self.interval = interval
+        self._task = None
+
+    def start(self):
+        """Запускает периодическое обслуживание; вызывается после открытия пула."""
+        self._task = asyncio.create_task(self._loop())
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.run()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Не удалось обслужить секции operations")
+            await asyncio.sleep(self.interval)
+
+    async def run(self):
+        if not await self.create_partitions():
+            return
+        if self.retention_months > 0:
+            today = (await get_db_time()).date()
+            cutoff = add_months(today.replace(day=1), -self.retention_months)
+            for name, attached in await self._expired_partitions(cutoff):
+                if attached and not await self._detach(name):
+                    return
+                if not await self._archive(name):
+                    return
+
+    async def _lock(self, conn) -> bool:
+        cur = await conn.execute("SELECT pg_try_advisory_xact_lock(%s)", (MAINTENANCE_LOCK_ID,))
+        return (await cur.fetchone())[0]
+
+    @db_query
+    async def create_partitions(self) -> bool:
+        """Создаёт недостающие секции; False, если обслуживание уже идёт в другом экземпляре."""
+        async with pool.connection() as conn:
+            if not await self._lock(conn):
+                return False
+            cur = await conn.execute("""
+                SELECT create_operations_partition(month::date)
+                FROM generate_series(
+                    date_trunc('month', LOCALTIMESTAMP),
+                    date_trunc('month', LOCALTIMESTAMP) + %s * INTERVAL '1 month',
+                    INTERVAL '1 month'
+                ) AS month
+            """, (self.months_ahead,))
+            created = sum(row[0] for row in await cur.fetchall())
+            # Строки с временем вне созданных заранее месяцев
+            cur = await conn.execute("""
+                SELECT create_operations_partition(month)
+                FROM (SELECT DISTINCT date_trunc('month', created_at)::date AS month FROM operations_default) AS d
+            """)
+            created += sum(row[0] for row in await cur.fetchall())
+        if created:
+            logger.info("Создано секций operations: %s", created)
+        return True
+
+    @db_query
+    async def _expired_partitions(self, cutoff: date) -> list:
+        """Секции месяцев раньше cutoff: [(имя, присоединена ли к operations), ...]."""
+        async with pool.connection() as conn:
+            cur = await conn.execute("""
+                SELECT relname, relispartition
+                FROM pg_class
+                WHERE relkind = 'r'
+                    AND relnamespace = current_schema()::regnamespace
+                    AND relname ~ '^operations_[0-9]{4}_[0-9]{2}$'
+                ORDER BY relname
+            """)
+            rows = await cur.fetchall()
+        expired = []
+        for name, attached in rows:
+            year, month = PARTITION_NAME.match(name).groups()
+            if date(int(year), int(month), 1) < cutoff:
+                expired.append((name, attached))
+        return expired
+
+    @db_query
+    async def _detach(self, name: str) -> bool:
+        async with pool.connection() as conn:
+            if not await self._lock(conn):
+                return False
+            await conn.execute(sql.SQL("ALTER TABLE operations DETACH PARTITION {}").format(sql.Identifier(name)))
+        logger.info("Секция %s отсоединена для архивации", name)
+        return True
+
+    @db_query
+    async def _archive(self, name: str) -> bool:
+        year, month = (int(part) for part in PARTITION_NAME.match(name).groups())
+        range_from = date(year, month, 1)
+        os.makedirs(self.archive_dir, exist_ok=True)
+        path = os.path.join(self.archive_dir, f"{name}.csv.gz")
+        partial = path + ".part"
+
+        # Выгрузка, запись в operations_archives и удаление секции — одна
+        # транзакция: при сбое секция остаётся и выгружается заново
+        async with pool.connection() as conn:
+            if not await self._lock(conn):
+                return False
+            archive = await asyncio.to_thread(gzip.open, partial, "wb")
+            try:
+                buffer = bytearray()
+                async with conn.cursor() as cur:
+                    query = sql.SQL("""
+                        COPY (SELECT id, user_id, operation, created_at FROM {} ORDER BY created_at)
+                        TO STDOUT WITH (FORMAT csv, HEADER)
+                    """).format(sql.Identifier(name))
+                    async with cur.copy(query) as copy:
+                        async for data in copy:
+                            buffer += data
+                            if len(buffer) >= ARCHIVE_WRITE_CHUNK:
+                                await asyncio.to_thread(archive.write, bytes(buffer))
+                                buffer.clear()
+                    rows = cur.rowcount
+                await asyncio.to_thread(archive.write, bytes(buffer))
+            finally:
+                await asyncio.to_thread(archive.close)
+            os.replace(partial, path)
+
+            await conn.execute("""
+                INSERT INTO operations_archives (partition_name, range_from, range_to, rows, file)
+                VALUES (%s, %s, %s, %s, %s)
+                ON CONFLICT (partition_name) DO UPDATE
+                SET rows = EXCLUDED.rows, file = EXCLUDED.file, archived_at = LOCALTIMESTAMP
+            """, (name, range_from, add_months(range_from, 1), rows, path))
+            await conn.execute(sql.SQL("DROP TABLE {}").format(sql.Identifier(name)))
+        logger.info("Секция %s выгружена в %s (%s строк) и удалена", name, path, rows)
+        return True
+
+
+operation_partitions = OperationPartitions(
+    OPERATIONS_PARTITIONS_AHEAD, OPERATIONS_RETENTION_MONTHS, OPERATIONS_ARCHIVE_DIR, OPERATIONS_MAINTENANCE_INTERVAL,
+)
@@ -0,0 +1,334 @@
+import asyncio
+import hashlib
+import logging
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+from typing import NamedTuple, Optional
+
+from aiogram import Bot
+from aiogram.types import PhotoSize
+
+from config import (
+    PHOTO_DIR, PHOTO_WORKERS, PHOTO_QUEUE_SIZE, PHOTO_THUMBNAIL_SIZE, PHOTO_THUMBNAIL_PROCESSES,
+    PHOTO_MAX_ATTEMPTS, PHOTO_RESCAN_INTERVAL,
+)
+from db import pool, WrittenOperation
+from metrics import db_query, count_photo
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    # Без Pillow фото сохраняются, но уменьшенные копии не строятся
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+STATUS_PENDING = "pending"
+STATUS_STORED = "stored"
+STATUS_FAILED = "failed"
+
+# Размер части при скачивании фото: столько файла одновременно в памяти
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+# Задание, взятое экземпляром бота и не завершённое за это время (экземпляр
+# остановлен аварийно), снова становится доступным для загрузки
+CLAIM_TIMEOUT = timedelta(minutes=10)
+
+
+def photo_path(directory: str, sha256: str) -> str:
+    return os.path.join(directory, sha256[:2], f"{sha256}.jpg")
+
+
+def thumbnail_path(directory: str, sha256: str) -> str:
+    return os.path.join(directory, "thumbs", sha256[:2], f"{sha256}.jpg")
+
+
+def make_thumbnail(source: str, destination: str, size: int):
+    """Строит уменьшенную копию фото; выполняется в процессе из пула."""
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    partial = f"{destination}.{os.getpid()}.part"
+    with Image.open(source) as image:
+        # JPEG сразу декодируется в уменьшенном масштабе, это в разы быстрее полного
+        image.draft("RGB", (size, size))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((size, size))
+        image.convert("RGB").save(partial, "JPEG", quality=80)
+    os.replace(partial, destination)
+
+
+class PhotoJob(NamedTuple):
+    id: int
+    file_id: str
+    file_unique_id: str
+
+
+class StoredFile(NamedTuple):
+    sha256: str
+    size: int
+    has_thumbnail: bool
+
+
+class _HashingFile:
+    """Пишет файл по частям и считает sha256 и размер; write вызывается в пуле потоков."""
+
+    def __init__(self, file):
+        self.file = file
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def write(self, chunk: bytes):
+        self.sha256.update(chunk)
+        self.size += len(chunk)
+        return self.file.write(chunk)
+
+
+class PhotoPipeline:
+    """
+    Фоновая загрузка фото рабочих мест. Обработчик только записывает задание
+    в таблицу photos (submit), а workers задач скачивают самое большое
+    разрешение через Bot API, потоково считая sha256, и кладут файл в
+    directory под именем хэша: одинаковые файлы хранятся один раз, а уже
+    сохранённый file_unique_id не скачивается повторно. Уменьшенные копии
+    строятся в пуле процессов.
+
+    Память ограничена: в очереди не больше queue_size заданий, остальные
+    ждут в БД и забираются периодической проверкой, файлы на диск пишутся
+    кусками. Неудачная загрузка повторяется до max_attempts раз. Задания
+    берутся с отметкой claimed_at, поэтому несколько экземпляров бота с
+    общим каталогом не скачивают одно фото дважды.
+    """
+
+    def __init__(self, directory: str, workers: int, queue_size: int, thumbnail_size: int,
+                 thumbnail_processes: int, max_attempts: int, rescan_interval: int):
+        self.directory = directory
+        self.workers = workers
+        self.queue_size = queue_size
+        self.thumbnail_size = thumbnail_size
+        self.thumbnail_processes = thumbnail_processes
+        self.max_attempts = max_attempts
+        self.rescan_interval = rescan_interval
+        self._bot = None
+        self._queue = None
+        self._tasks = []
+        self._active = set()
+        self._inflight = {}
+        self._executor = None
+
+    def start(self, bot: Bot):
+        self._bot = bot
+        os.makedirs(os.path.join(self.directory, "tmp"), exist_ok=True)
+        self._queue = asyncio.Queue(self.queue_size)
+        if Image is None:
+            logger.warning("Pillow не установлен: уменьшенные копии фото не строятся")
+        else:
+            # spawn, а не fork: к этому моменту в процессе уже работают потоки
+            self._executor = ProcessPoolExecutor(self.thumbnail_processes,
+                                                 mp_context=multiprocessing.get_context("spawn"))
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._rescan()))
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        # Невыполненные задания этого экземпляра сразу доступны остальным и после перезапуска
+        unfinished = set(self._active)
+        while self._queue and not self._queue.empty():
+            unfinished.add(self._queue.get_nowait().id)
+        if unfinished:
+            await self._release(sorted(unfinished))
+        if self._executor:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+
+    @db_query
+    async def submit(self, user_id: int, operation: WrittenOperation, photo: PhotoSize):
+        """Ставит фото операции photo_received сотрудника user_id в очередь на загрузку."""
+        claim = not self._queue.full()
+        async with pool.connection() as conn:
+            cur = await conn.execute("""
+                INSERT INTO photos (user_id, operation_id, operation_created_at, file_id, file_unique_id, claimed_at)
+                VALUES (%s, %s, %s, %s, %s, CASE WHEN %s THEN LOCALTIMESTAMP END)
+                RETURNING id
+            """, (user_id, operation.id, operation.created_at, photo.file_id, photo.file_unique_id, claim))
+            photo_id = (await cur.fetchone())[0]
+        if claim:
+            await self._enqueue([PhotoJob(photo_id, photo.file_id, photo.file_unique_id)])
+
+    async def _enqueue(self, jobs: list):
+        overflow = []
+        for job in jobs:
+            try:
+                self._queue.put_nowait(job)
+            except asyncio.QueueFull:
+                overflow.append(job.id)
+        if overflow:
+            await self._release(overflow)
+
+    @db_query
+    async def _release(self, photo_ids: list):
+        async with pool.connection() as conn:
+            await conn.execute(
+                "UPDATE photos SET claimed_at = NULL WHERE id = ANY(%s) AND status = %s",
+                (photo_ids, STATUS_PENDING),
+            )
+
+    @db_query
+    async def _claim(self, limit: int) -> list:
+        async with pool.connection() as conn:
+            cur = await conn.execute("""
+                UPDATE photos SET claimed_at = LOCALTIMESTAMP
+                WHERE id IN (
+                    SELECT id
+                    FROM photos
+                    WHERE status = %s
+                        AND (claimed_at IS NULL OR claimed_at < LOCALTIMESTAMP - %s)
+                    ORDER BY id
+                    LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING id, file_id, file_unique_id
+            """, (STATUS_PENDING, CLAIM_TIMEOUT, limit))
+            return [PhotoJob(*row) for row in await cur.fetchall()]
+
+    async def _rescan(self):
+        while True:
+            try:
+                free = self._queue.maxsize - self._queue.qsize()
+                if free > 0:
+                    await self._enqueue(await self._claim(free))
+            except Exception:
+                logger.exception("Не удалось получить задания на загрузку фото")
+            await asyncio.sleep(self.rescan_interval)
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            self._active.add(job.id)
+            try:
+                await self._process(job)
+            except Exception:
+                logger.exception("Не удалось сохранить фото %s", job.id)
+                try:
+                    await self._fail(job)
+                except Exception:
+                    logger.exception("Не удалось отметить ошибку загрузки фото %s", job.id)
+            finally:
+                self._active.discard(job.id)
+
+    async def _process(self, job: PhotoJob):
+        result = "duplicate"
+        stored = await self._find_stored(job.file_unique_id)
+        if stored is None:
+            inflight = self._inflight.get(job.file_unique_id)
+            if inflight:
+                # Тот же файл прямо сейчас скачивает другая задача
+                stored = await asyncio.shield(inflight)
+            else:
+                inflight = self._inflight[job.file_unique_id] = asyncio.get_running_loop().create_future()
+                try:
+                    stored = await self._ingest(job)
+                    result = "stored"
+                finally:
+                    del self._inflight[job.file_unique_id]
+                    inflight.set_result(stored)
+            if stored is None:
+                raise RuntimeError(f"Загрузка файла {job.file_unique_id} не удалась")
+        await self._mark_stored(job.id, stored)
+        count_photo(result)
+
+    @db_query
+    async def _find_stored(self, file_unique_id: str) -> Optional[StoredFile]:
+        async with pool.connection() as conn:
+            cur = await conn.execute("""
+                SELECT sha256, size, has_thumbnail
+                FROM photos
+                WHERE file_unique_id = %s AND status = %s
+                LIMIT 1
+            """, (file_unique_id, STATUS_STORED))
+            row = await cur.fetchone()
+        if row is None or not os.path.exists(photo_path(self.directory, row[0])):
+            return None
+        return StoredFile(*row)
+
+    async def _ingest(self, job: PhotoJob) -> StoredFile:
+        file = await self._bot.get_file(job.file_id)
+        fd, partial = tempfile.mkstemp(suffix=".part", dir=os.path.join(self.directory, "tmp"))
+        try:
+            with os.fdopen(fd, "wb") as f:
+                destination = _HashingFile(f)
+                await self._download(file.file_path, destination)
+            sha256 = destination.sha256.hexdigest()
+            path = photo_path(self.directory, sha256)
+            if os.path.exists(path):
+                # Такое содержимое уже сохранено под другим file_unique_id
+                os.remove(partial)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(partial, path)
+        except BaseException:
+            if os.path.exists(partial):
+                os.remove(partial)
+            raise
+        return StoredFile(sha256, destination.size, await self._thumbnail(sha256))
+
+    async def _download(self, file_path: str, destination: _HashingFile):
+        """
+        Скачивает файл Bot API по частям. Запись на диск и sha256 — в пуле
+        потоков: bot.download_file писал бы каждую часть в цикле событий.
+        """
+        session = self._bot.session
+        stream = session.stream_content(url=session.api.file_url(self._bot.token, file_path),
+                                        chunk_size=DOWNLOAD_CHUNK_SIZE, raise_for_status=True)
+        async for chunk in stream:
+            await asyncio.to_thread(destination.write, chunk)
+
+    async def _thumbnail(self, sha256: str) -> bool:
+        if self._executor is None:
+            return False
+        destination = thumbnail_path(self.directory, sha256)
+        if os.path.exists(destination):
+            return True
+        try:
+            await asyncio.get_running_loop().run_in_executor(
+                self._executor, make_thumbnail, photo_path(self.directory, sha256), destination,
+                self.thumbnail_size,
+            )
+        except Exception:
+            # Само фото сохранено; без копии админка показывает ссылку на оригинал
+            logger.exception("Не удалось построить уменьшенную копию %s", sha256)
+            return False
+        return True
+
+    @db_query
+    async def _mark_stored(self, photo_id: int, stored: StoredFile):
+        async with pool.connection() as conn:
+            await conn.execute("""
+                UPDATE photos
+                SET status = %s, sha256 = %s, size = %s, has_thumbnail = %s,
+                    stored_at = LOCALTIMESTAMP, claimed_at = NULL
+                WHERE id = %s
+            """, (STATUS_STORED, stored.sha256, stored.size, stored.has_thumbnail, photo_id))
+
+    @db_query
+    async def _fail(self, job: PhotoJob):
+        async with pool.connection() as conn:
+            cur = await conn.execute("""
+                UPDATE photos
+                SET attempts = attempts + 1, claimed_at = NULL,
+                    status = CASE WHEN attempts + 1 >= %s THEN %s ELSE status END
+                WHERE id = %s
+                RETURNING status
+            """, (self.max_attempts, STATUS_FAILED, job.id))
+            row = await cur.fetchone()
+        count_photo("failed" if row and row[0] == STATUS_FAILED else "retry")
+
+
+photo_pipeline = PhotoPipeline(
+    PHOTO_DIR, PHOTO_WORKERS, PHOTO_QUEUE_SIZE, PHOTO_THUMBNAIL_SIZE, PHOTO_THUMBNAIL_PROCESSES,
+    PHOTO_MAX_ATTEMPTS, PHOTO_RESCAN_INTERVAL,
+)
@@ -0,0 +1,122 @@
+import asyncio
+import logging
+import os
+import shutil
+from collections import OrderedDict
+from datetime import datetime, date
+from typing import BinaryIO, Optional
+
+from config import REPORT_CACHE_DIR, REPORT_CACHE_MAX_SIZE
+from db import get_report_watermark
+
+logger = logging.getLogger(__name__)
+
+BUILT_AT_FORMAT = "%Y%m%d%H%M%S%f"
+
+
+class ReportCache:
+    """
+    Готовые файлы отчётов на локальном диске, ключ — (формат, дата от, дата до).
+    Отчёт считается актуальным, пока ни один день его периода не отмечен
+    в report_watermarks позже момента построения. Суммарный размер файлов
+    ограничен max_size байт, при превышении удаляются давно не запрошенные.
+
+    Время построения зашито в имя файла, поэтому после перезапуска бота
+    кэш восстанавливается сканированием каталога.
+
+    get() отдаёт уже открытый файл: если параллельное задание вытеснит или
+    заменит запись, файл удаляется из каталога, но отправка дочитает его
+    через открытый дескриптор.
+    """
+
+    def __init__(self, directory: str, max_size: int):
+        self.directory = directory
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._size = 0
+
+    def load(self):
+        os.makedirs(self.directory, exist_ok=True)
+        files = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                stem, _ = os.path.splitext(name)
+                fmt, date_from, date_to, built_at = stem.split("_")
+                key = (fmt, date.fromisoformat(date_from), date.fromisoformat(date_to))
+                built_at = datetime.strptime(built_at, BUILT_AT_FORMAT)
+            except ValueError:
+                os.remove(path)
+                continue
+            files.append((os.path.getatime(path), key, path, built_at))
+        for _, key, path, built_at in sorted(files):
+            self._add(key, path, built_at)
+        self._evict()
+        logger.info("Кэш отчётов: %s файлов, %s байт", len(self._entries), self._size)
+
+    def _add(self, key, path, built_at):
+        self._discard(key)
+        size = os.path.getsize(path)
+        self._entries[key] = (path, built_at, size)
+        self._size += size
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry:
+            path, _, size = entry
+            self._size -= size
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _evict(self):
+        while self._size > self.max_size and len(self._entries) > 1:
+            self._discard(next(iter(self._entries)))
+
+    async def get(self, fmt: str, date_from: date, date_to: date) -> Optional[BinaryIO]:
+        """Открытый файл актуального отчёта или None; закрыть его должен вызывающий код."""
+        key = (fmt, date_from, date_to)
+        entry = self._entries.get(key)
+        if not entry:
+            return None
+        path, built_at, _ = entry
+        changed_at = await get_report_watermark(date_from, date_to)
+        if self._entries.get(key) is not entry:
+            # Пока шёл запрос, запись заменили или вытеснили
+            return None
+        if changed_at and changed_at >= built_at:
+            self._discard(key)
+            return None
+        try:
+            file = open(path, "rb")
+        except FileNotFoundError:
+            self._discard(key)
+            return None
+        self._entries.move_to_end(key)
+        return file
+
+    async def put(self, fmt: str, date_from: date, date_to: date, built_at: datetime, file):
+        """Копирует открытый файл отчёта в кэш; копирование идёт в пуле потоков."""
+        extension = "xlsx" if fmt == "excel" else fmt
+        name = f"{fmt}_{date_from.isoformat()}_{date_to.isoformat()}_{built_at.strftime(BUILT_AT_FORMAT)}.{extension}"
+        path = os.path.join(self.directory, name)
+        await asyncio.to_thread(self._write, file, path)
+        self._add((fmt, date_from, date_to), path, built_at)
+        self._evict()
+
+    @staticmethod
+    def _write(file, path: str):
+        # Недописанный файл лежит под другим именем, load() его удалит
+        partial = path + ".part"
+        file.seek(0)
+        with open(partial, "wb") as cached:
+            shutil.copyfileobj(file, cached)
+        os.replace(partial, path)
+
+    def clear(self):
+        for key in list(self._entries):
+            self._discard(key)
+
+
+report_cache = ReportCache(REPORT_CACHE_DIR, REPORT_CACHE_MAX_SIZE)
@@ -0,0 +1,368 @@
+import asyncio
+import logging
+from datetime import date, timedelta
+from typing import NamedTuple, Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+
+from config import (
+    REPORT_JOB_WORKERS, REPORT_JOB_ADMIN_WORKERS, REPORT_JOB_ADMIN_MAX_PENDING, REPORT_JOB_MAX_ATTEMPTS,
+    REPORT_JOB_PROGRESS_INTERVAL, REPORT_JOB_POLL_INTERVAL, CALLBACK_CANCEL_REPORT,
+)
+from db import pool
+from metrics import db_query, count_report_job
+from outbound import bulk_sends
+from reports import report_document
+
+logger = logging.getLogger(__name__)
+
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+STATUS_CANCELLED = "cancelled"
+
+# Advisory-блокировка постановки и выдачи заданий: лимиты на администратора
+# проверяются согласованно во всех экземплярах бота
+REPORT_JOBS_LOCK_ID = 7_310_005
+
+# Выполняемое задание отмечается каждые progress_interval секунд; задание,
+# о котором экземпляр бота не сообщал так долго (остановлен аварийно), снова
+# становится доступным
+CLAIM_TIMEOUT = timedelta(minutes=10)
+
+# Задержка перед повтором неудачного задания; удваивается с каждой попыткой
+RETRY_DELAY = timedelta(seconds=30)
+
+# Завершённые задания хранятся столько, потом удаляются
+FINISHED_JOB_TTL = timedelta(days=7)
+
+JOB_COLUMNS = "id, user_id, chat_id, format, date_from, date_to, message_id"
+
+
+class ReportJob(NamedTuple):
+    id: int
+    user_id: int
+    chat_id: int
+    format: str
+    date_from: date
+    date_to: date
+    message_id: Optional[int]
+
+
+class SubmitResult(NamedTuple):
+    # None — у администратора уже max_pending заданий
+    job_id: Optional[int]
+    # False — такое же задание уже в очереди или выполняется (job_id — его номер)
+    created: bool
+
+
+class ReportProgress:
+    """Ход построения отчёта: вызывается из reports.iter_report_rows с числом сотрудников."""
+
+    def __init__(self, message_id: Optional[int]):
+        self.message_id = message_id
+        self.total = None
+        self.users = 0
+
+    def __call__(self, users: int):
+        self.users = users
+
+
+def cancel_keyboard(job_id: int) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="Отменить", callback_data=f"{CALLBACK_CANCEL_REPORT}:{job_id}")],
+    ])
+
+
+class ReportQueue:
+    """
+    Фоновое построение отчётов. Обработчик только записывает задание в таблицу
+    report_jobs (submit) и сообщение о нём с кнопкой отмены, а отчёт строят
+    задачи экземпляров бота: во всех экземплярах вместе не больше workers
+    одновременно и не больше admin_workers у одного администратора (проверяется
+    при выдаче задания, _claim). Сообщение о задании обновляется по мере
+    чтения сотрудников, готовый файл отправляется в чат.
+
+    Задания берутся с отметкой claimed_at, которая обновляется, пока отчёт
+    строится, поэтому несколько экземпляров бота не строят одно задание
+    дважды, а задания остановленного экземпляра (и после перезапуска) строятся
+    заново. Неудачное построение повторяется до max_attempts раз, не раньше
+    чем через RETRY_DELAY, удвоенную за каждую прошлую попытку. Одинаковые
+    задания разных администраторов в одном экземпляре строятся по очереди:
+    отчёт за прошедший период второй получает из кэша.
+    """
+
+    def __init__(self, workers: int, admin_workers: int, max_pending: int, max_attempts: int,
+                 progress_interval: int, poll_interval: int):
+        self.workers = workers
+        self.admin_workers = admin_workers
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+        self.progress_interval = progress_interval
+        self.poll_interval = poll_interval
+        self._bot = None
+        self._wakeup = None
+        self._dispatcher = None
+        self._running = {}
+        self._inflight = {}
+
+    def start(self, bot: Bot):
+        self._bot = bot
+        self._wakeup = asyncio.Event()
+        self._dispatcher = asyncio.create_task(self._dispatch())
+
+    async def close(self):
+        tasks = [task for task in (self._dispatcher, *self._running.values()) if task]
+        unfinished = sorted(self._running)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._dispatcher = None
+        # Незавершённые задания этого экземпляра сразу доступны остальным и после перезапуска
+        if unfinished:
+            await self._release(unfinished)
+
+    @db_query
+    async def submit(self, user_id: int, chat_id: int, format_choice: str, date_from: date,
+                     date_to: date) -> SubmitResult:
+        """Ставит отчёт в очередь; после отправки сообщения о задании нужно вызвать set_message."""
+        params = {"user_id": user_id, "chat_id": chat_id, "format": format_choice,
+                  "date_from": date_from, "date_to": date_to, "max_pending": self.max_pending}
+        async with pool.connection() as conn:
+            await conn.execute("SELECT pg_advisory_xact_lock(%s)", (REPORT_JOBS_LOCK_ID,))
+            cur = await conn.execute("""
+                SELECT id
+                FROM report_jobs
+                WHERE user_id = %(user_id)s AND format = %(format)s
+                    AND date_from = %(date_from)s AND date_to = %(date_to)s
+                    AND status IN ('queued', 'running')
+            """, params)
+            row = await cur.fetchone()
+            if row:
+                return SubmitResult(row[0], False)
+            cur = await conn.execute("""
+                INSERT INTO report_jobs (user_id, chat_id, format, date_from, date_to)
+                SELECT %(user_id)s, %(chat_id)s, %(format)s, %(date_from)s, %(date_to)s
+                WHERE (
+                    SELECT count(*) FROM report_jobs
+                    WHERE user_id = %(user_id)s AND status IN ('queued', 'running')
+                ) < %(max_pending)s
+                RETURNING id
+            """, params)
+            row = await cur.fetchone()
+        return SubmitResult(row[0] if row else None, row is not None)
+
+    @db_query
+    async def set_message(self, job_id: int, message_id: int):
+        """Запоминает сообщение о задании (для хода и результата) и будит очередь."""
+        async with pool.connection() as conn:
+            await conn.execute("UPDATE report_jobs SET message_id = %s WHERE id = %s", (message_id, job_id))
+        self._wakeup.set()
+
+    @db_query
+    async def cancel(self, job_id: int, user_id: int) -> bool:
+        """Отменяет задание администратора user_id; False, если оно уже завершено."""
+        async with pool.connection() as conn:
+            cur = await conn.execute("""
+                UPDATE report_jobs
+                SET status = %s, finished_at = LOCALTIMESTAMP
+                WHERE id = %s AND user_id = %s AND status IN ('queued', 'running')
+            """, (STATUS_CANCELLED, job_id, user_id))
+            cancelled = cur.rowcount > 0
+        if cancelled:
+            count_report_job("cancelled")
+            # Задание другого экземпляра остановится при следующей отметке хода
+            task = self._running.get(job_id)
+            if task:
+                task.cancel()
+        return cancelled
+
+    async def _dispatch(self):
+        while True:
+            self._wakeup.clear()
+            try:
+                while len(self._running) < self.workers and (job := await self._claim()):
+                    # Задача получает копию контекста: файл и сообщения о ходе
+                    # отправляются с приоритетом рассылок, после ответов пользователям
+                    with bulk_sends():
+                        self._running[job.id] = asyncio.create_task(self._run(job))
+            except Exception:
+                logger.exception("Не удалось получить задания на отчёты")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    @db_query
+    async def _claim(self) -> Optional[ReportJob]:
+        async with pool.connection() as conn:
+            await conn.execute("SELECT pg_advisory_xact_lock(%s)", (REPORT_JOBS_LOCK_ID,))
+            cur = await conn.execute(f"""
+                UPDATE report_jobs SET status = 'running', claimed_at = LOCALTIMESTAMP
+                WHERE id = (
+                    SELECT j.id
+                    FROM report_jobs j
+                    WHERE (j.status = 'queued' AND (j.not_before IS NULL OR j.not_before <= LOCALTIMESTAMP)
+                            OR j.status = 'running' AND j.claimed_at < LOCALTIMESTAMP - %(timeout)s)
+                        AND (
+                            SELECT count(*) FROM report_jobs r
+                            WHERE r.user_id = j.user_id AND r.id <> j.id AND r.status = 'running'
+                                AND r.claimed_at >= LOCALTIMESTAMP - %(timeout)s
+                        ) < %(admin_workers)s
+                        AND (
+                            SELECT count(*) FROM report_jobs r
+                            WHERE r.id <> j.id AND r.status = 'running'
+                                AND r.claimed_at >= LOCALTIMESTAMP - %(timeout)s
+                        ) < %(workers)s
+                    ORDER BY j.id
+                    LIMIT 1
+                )
+                RETURNING {JOB_COLUMNS}
+            """, {"timeout": CLAIM_TIMEOUT, "admin_workers": self.admin_workers, "workers": self.workers})
+            row = await cur.fetchone()
+        return ReportJob(*row) if row else None
+
+    async def _run(self, job: ReportJob):
+        try:
+            progress = ReportProgress(job.message_id)
+            build = asyncio.create_task(self._build(job, progress))
+            watch = asyncio.create_task(self._watch(job, progress))
+            try:
+                await asyncio.wait((build, watch), return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                for task in (build, watch):
+                    task.cancel()
+                await asyncio.gather(build, watch, return_exceptions=True)
+            if build.cancelled():
+                # Задание отменено в другом экземпляре бота
+                return
+            build.result()
+            finished = await self._finish(job.id)
+            if finished is None:
+                # Задание отменено, пока отчёт отправлялся
+                return
+            count_report_job("done")
+            await self._show(job.chat_id, finished[0], "Отчёт отправлен.")
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Не удалось построить отчёт по заданию %s", job.id)
+            try:
+                await self._fail(job)
+            except Exception:
+                logger.exception("Не удалось отметить ошибку задания %s", job.id)
+        finally:
+            self._running.pop(job.id, None)
+            self._wakeup.set()
+
+    async def _build(self, job: ReportJob, progress: ReportProgress):
+        key = (job.format, job.date_from, job.date_to)
+        while inflight := self._inflight.get(key):
+            # Такой же отчёт строится для другого администратора
+            await asyncio.shield(inflight)
+        inflight = self._inflight[key] = asyncio.get_running_loop().create_future()
+        try:
+            progress.total = await self._count_users()
+            async with report_document(job.format, job.date_from, job.date_to, progress) as document:
+                await self._bot.send_document(job.chat_id, document)
+        finally:
+            del self._inflight[key]
+            inflight.set_result(None)
+
+    async def _watch(self, job: ReportJob, progress: ReportProgress):
+        """Отмечает задание и обновляет сообщение о ходе; возвращается, если задание отменено."""
+        shown = None
+        while True:
+            await asyncio.sleep(self.progress_interval)
+            try:
+                if not await self._heartbeat(job.id, progress):
+                    return
+                if progress.total is not None and progress.users != shown:
+                    shown = progress.users
+                    await self._show(job.chat_id, progress.message_id,
+                                     f"Отчёт формируется: {shown} из {progress.total} сотрудников.",
+                                     cancel_keyboard(job.id))
+            except Exception:
+                logger.exception("Не удалось обновить ход задания %s", job.id)
+
+    async def _show(self, chat_id: int, message_id: Optional[int], text: str,
+                    reply_markup: Optional[InlineKeyboardMarkup] = None):
+        if message_id is None:
+            return
+        try:
+            await self._bot.edit_message_text(text=text, chat_id=chat_id, message_id=message_id,
+                                              reply_markup=reply_markup)
+        except TelegramBadRequest as e:
+            # Сообщение удалено пользователем или текст не изменился — отчёт это не останавливает
+            logger.debug("Сообщение о задании не обновлено: %s", e)
+
+    @db_query
+    async def _count_users(self) -> int:
+        async with pool.connection() as conn:
+            cur = await conn.execute("SELECT count(*) FROM users")
+            return (await cur.fetchone())[0]
+
+    @db_query
+    async def _heartbeat(self, job_id: int, progress: ReportProgress) -> bool:
+        async with pool.connection() as conn:
+            cur = await conn.execute("""
+                UPDATE report_jobs SET claimed_at = LOCALTIMESTAMP
+                WHERE id = %s AND status = 'running'
+                RETURNING message_id
+            """, (job_id,))
+            row = await cur.fetchone()
+        if row is None:
+            return False
+        progress.message_id = row[0]
+        return True
+
+    @db_query
+    async def _finish(self, job_id: int) -> Optional[tuple]:
+        """Отмечает задание выполненным: (message_id,) или None, если его уже отменили."""
+        async with pool.connection() as conn:
+            cur = await conn.execute("""
+                UPDATE report_jobs SET status = %s, finished_at = LOCALTIMESTAMP, claimed_at = NULL
+                WHERE id = %s AND status = 'running'
+                RETURNING message_id
+            """, (STATUS_DONE, job_id))
+            row = await cur.fetchone()
+            await conn.execute("DELETE FROM report_jobs WHERE finished_at < LOCALTIMESTAMP - %s",
+                               (FINISHED_JOB_TTL,))
+        return row
+
+    @db_query
+    async def _fail(self, job: ReportJob):
+        async with pool.connection() as conn:
+            cur = await conn.execute("""
+                UPDATE report_jobs
+                SET attempts = attempts + 1, claimed_at = NULL,
+                    status = CASE WHEN attempts + 1 >= %(max_attempts)s THEN %(failed)s ELSE %(queued)s END,
+                    finished_at = CASE WHEN attempts + 1 >= %(max_attempts)s THEN LOCALTIMESTAMP END,
+                    not_before = LOCALTIMESTAMP + %(retry_delay)s * power(2, attempts)
+                WHERE id = %(id)s AND status = 'running'
+                RETURNING status, message_id
+            """, {"max_attempts": self.max_attempts, "failed": STATUS_FAILED, "queued": STATUS_QUEUED,
+                  "retry_delay": RETRY_DELAY, "id": job.id})
+            row = await cur.fetchone()
+        if row and row[0] == STATUS_FAILED:
+            count_report_job("failed")
+            await self._show(job.chat_id, row[1], "Не удалось сформировать отчёт.")
+        else:
+            count_report_job("retry")
+
+    @db_query
+    async def _release(self, job_ids: list):
+        async with pool.connection() as conn:
+            await conn.execute(
+                "UPDATE report_jobs SET status = %s, claimed_at = NULL WHERE id = ANY(%s) AND status = %s",
+                (STATUS_QUEUED, job_ids, STATUS_RUNNING),
+            )
+
+
+report_queue = ReportQueue(
+    REPORT_JOB_WORKERS, REPORT_JOB_ADMIN_WORKERS, REPORT_JOB_ADMIN_MAX_PENDING, REPORT_JOB_MAX_ATTEMPTS,
+    REPORT_JOB_PROGRESS_INTERVAL, REPORT_JOB_POLL_INTERVAL,
+)
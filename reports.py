@@ -0,0 +1,273 @@
+import asyncio
+import csv
+import io
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, date
+from tempfile import SpooledTemporaryFile
+from typing import Callable, NamedTuple, Optional
+
+from aiogram.types import FSInputFile
+from aiogram.types.input_file import InputFile, DEFAULT_CHUNK_SIZE
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Font, NamedStyle
+from openpyxl.utils import get_column_letter
+
+from config import (
+    REPORT_BATCH_SIZE, REPORT_SPOOL_MAX_SIZE, REPORT_EXCEL_WORKERS,
+)
+from aggregates import attendance_aggregates
+from db import pool, get_db_time
+from metrics import observe_report, count_report_request
+from report_cache import report_cache
+
+REPORT_HEADER = ["Дата", "Начало смены", "Конец смены", "Перерывы", "Отработано", "Замечания"]
+EXCEL_HEADER_STYLE = "report_header"
+
+
+class ReportDay(NamedTuple):
+    day: date
+    # Нет у дня, где есть только замечания (например, перерыв вне смены)
+    start: Optional[datetime]
+    end: Optional[datetime]
+    break_duration: timedelta
+    worked: timedelta
+    notes: Optional[str]
+
+
+# Отчёт строится одним запросом по дневным сводкам daily_attendance (одна
+# строка на сотрудника и день, см. aggregates.py), независимо от количества
+# операций; сотрудник без смен за период даёт одну строку с NULL. Замечания
+# хранятся в тех же сводках (pairing.refresh_notes).
+REPORT_QUERY = """
+    SELECT u.id, u.full_name, d.day, d.first_start, d.last_end, d.break_seconds, d.worked_seconds, d.notes
+    FROM users u
+    LEFT JOIN daily_attendance d
+        ON d.user_id = u.id
+        AND d.day BETWEEN %(date_from)s AND %(date_to)s
+    ORDER BY u.id, d.day
+"""
+
+
+async def iter_report_rows(start_date: date, end_date: date, progress: Optional[Callable[[int], None]] = None):
+    """
+    Построчно отдаёт (user_id, full_name, ReportDay | None) из серверного курсора.
+    Пользователь без смен за период отдаётся одной строкой с None. progress
+    вызывается с числом уже прочитанных сотрудников.
+    """
+    users = 0
+    last_user_id = None
+    params = {
+        "date_from": start_date,
+        "date_to": end_date,
+    }
+    async with pool.connection() as conn:
+        async with conn.cursor(name="report_rows") as cur:
+            await cur.execute(REPORT_QUERY, params)
+            while rows := await cur.fetchmany(REPORT_BATCH_SIZE):
+                for user_id, full_name, day, first_start, last_end, break_seconds, worked_seconds, note in rows:
+                    if progress and user_id != last_user_id:
+                        users += 1
+                        last_user_id = user_id
+                        progress(users)
+                    report_day = None
+                    if day:
+                        report_day = ReportDay(day, first_start, last_end, timedelta(seconds=break_seconds or 0),
+                                               timedelta(seconds=worked_seconds or 0), note)
+                    yield user_id, full_name, report_day
+
+
+def format_shift_row(day: ReportDay):
+    total_seconds = int(day.break_duration.total_seconds())
+    minutes, seconds = divmod(total_seconds, 60)
+    worked_minutes = int(day.worked.total_seconds()) // 60
+    if day.start is None:
+        start, end = "—", "—"
+    else:
+        start = day.start.time().strftime("%H:%M")
+        end = day.end.time().strftime("%H:%M") if day.end else 'Не завершена'
+    return [
+        day.day.strftime("%d.%m.%Y"),
+        start,
+        end,
+        f"{minutes}:{seconds:02d}",
+        f"{worked_minutes // 60}:{worked_minutes % 60:02d}",
+        day.notes or "",
+    ]
+
+
+class SpooledInputFile(InputFile):
+    """
+    Отправка в Telegram содержимого открытого файла (временного или из кэша
+    отчётов) кусками, без копии в памяти. Куски с диска читаются в пуле потоков.
+    """
+
+    def __init__(self, file, filename: str, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        super().__init__(filename=filename, chunk_size=chunk_size)
+        self.file = file
+
+    async def read(self, bot):
+        self.file.seek(0)
+        while chunk := await asyncio.to_thread(self.file.read, self.chunk_size):
+            yield chunk
+
+
+# Функция генерации CSV-отчёта. Строки пишутся во временный файл пачками по мере
+# чтения из курсора, поэтому расход памяти не зависит от длины периода.
+async def generate_report_csv(start_date: date, end_date: date,
+                              progress: Optional[Callable[[int], None]] = None) -> SpooledTemporaryFile:
+    started = time.perf_counter()
+    output = SpooledTemporaryFile(max_size=REPORT_SPOOL_MAX_SIZE)
+    buffer = io.StringIO(newline='')
+    writer = csv.writer(buffer, delimiter=';')
+
+    last_user_id = None
+    async for user_id, full_name, shift in iter_report_rows(start_date, end_date, progress):
+        if user_id != last_user_id:
+            if last_user_id is not None:
+                writer.writerow([])
+            writer.writerow([full_name])
+            writer.writerow(REPORT_HEADER)
+            last_user_id = user_id
+        if shift:
+            writer.writerow(format_shift_row(shift))
+        if buffer.tell() >= DEFAULT_CHUNK_SIZE:
+            output.write(buffer.getvalue().encode())
+            buffer.seek(0)
+            buffer.truncate()
+    if last_user_id is not None:
+        writer.writerow([])
+
+    output.write(buffer.getvalue().encode())
+    observe_report("csv", time.perf_counter() - started, output.tell())
+    output.seek(0)
+    return output
+
+
+class ExcelReportWriter:
+    """
+    Потоковая запись отчёта в xlsx в режиме write-only: строки сразу уходят
+    во временный файл openpyxl, а оформление задаётся общими именованными стилями.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.wb = Workbook(write_only=True)
+        self.wb.add_named_style(NamedStyle(
+            name=EXCEL_HEADER_STYLE,
+            font=Font(bold=True),
+            alignment=Alignment(horizontal="center"),
+        ))
+        self.ws = self.wb.create_sheet("Отчёт")
+        self.row = 0
+        self.last_user_id = None
+
+    def _header_cells(self, values):
+        cells = []
+        for value in values:
+            cell = WriteOnlyCell(self.ws, value=value)
+            cell.style = EXCEL_HEADER_STYLE
+            cells.append(cell)
+        return cells
+
+    def _append(self, values):
+        self.ws.append(values)
+        self.row += 1
+
+    def write_rows(self, rows):
+        for user_id, full_name, shift in rows:
+            if user_id != self.last_user_id:
+                if self.last_user_id is not None:
+                    self._append([])
+                self._append(self._header_cells([full_name]))
+                self.ws.merged_cells.add(f"A{self.row}:{get_column_letter(len(REPORT_HEADER))}{self.row}")
+                self._append(self._header_cells(REPORT_HEADER))
+                self.last_user_id = user_id
+            if shift:
+                self._append(format_shift_row(shift))
+
+    def save(self):
+        if self.last_user_id is not None:
+            self._append([])
+        self.wb.save(self.path)
+
+
+# Excel-отчёты собираются в отдельном пуле потоков, чтобы не блокировать цикл
+# событий; семафор ограничивает число одновременно формируемых отчётов.
+excel_executor = ThreadPoolExecutor(max_workers=REPORT_EXCEL_WORKERS, thread_name_prefix="excel-report")
+excel_semaphore = asyncio.Semaphore(REPORT_EXCEL_WORKERS)
+
+
+# Функция генерации Excel-отчёта. Возвращает путь к временному файлу,
+# удалить его после отправки должен вызывающий код.
+async def generate_report_excel(start_date: date, end_date: date,
+                                progress: Optional[Callable[[int], None]] = None) -> str:
+    loop = asyncio.get_running_loop()
+    started = time.perf_counter()
+    async with excel_semaphore:
+        fd, path = tempfile.mkstemp(prefix="report_", suffix=".xlsx")
+        os.close(fd)
+        try:
+            writer = ExcelReportWriter(path)
+            batch = []
+            async for row in iter_report_rows(start_date, end_date, progress):
+                batch.append(row)
+                if len(batch) >= REPORT_BATCH_SIZE:
+                    await loop.run_in_executor(excel_executor, writer.write_rows, batch)
+                    batch = []
+            await loop.run_in_executor(excel_executor, writer.write_rows, batch)
+            await loop.run_in_executor(excel_executor, writer.save)
+        except BaseException:
+            os.remove(path)
+            raise
+    observe_report("excel", time.perf_counter() - started, os.path.getsize(path))
+    return path
+
+
+@asynccontextmanager
+async def report_document(format_choice: str, date_from: date, date_to: date,
+                          progress: Optional[Callable[[int], None]] = None):
+    """
+    Отдаёт файл отчёта для отправки в Telegram. Отчёты за полностью прошедшие
+    периоды берутся из кэша или сохраняются в него, остальные строятся заново
+    и удаляются после отправки. progress получает ход построения (см. iter_report_rows).
+    """
+    extension = "xlsx" if format_choice == "excel" else format_choice
+    filename = f"report_{date_from}_{date_to}.{extension}"
+
+    cached = await report_cache.get(format_choice, date_from, date_to)
+    if cached:
+        count_report_request(format_choice, "cache")
+        with cached:
+            yield SpooledInputFile(cached, filename=filename)
+        return
+    count_report_request(format_choice, "generated")
+
+    # Отчёты, захватывающие сегодняшний день, постоянно меняются и не кэшируются.
+    # Время фиксируется до построения: всё, что изменится позже, отметится свежее.
+    # "Сегодня" — по часам БД (LOCALTIMESTAMP::date = CURRENT_DATE), как и время операций.
+    db_time = await get_db_time()
+    built_at = db_time if date_to < db_time.date() else None
+    # Сводки догоняют операции, записанные до этого момента
+    await attendance_aggregates.roll_up(wait=True)
+
+    # Отправляется собственный временный файл, а не копия в кэше: её может
+    # вытеснить параллельное задание
+    if format_choice == "csv":
+        with await generate_report_csv(date_from, date_to, progress) as report_file:
+            if built_at:
+                await report_cache.put(format_choice, date_from, date_to, built_at, report_file)
+            yield SpooledInputFile(report_file, filename=filename)
+    else:
+        report_path = await generate_report_excel(date_from, date_to, progress)
+        try:
+            if built_at:
+                with open(report_path, "rb") as report_file:
+                    await report_cache.put(format_choice, date_from, date_to, built_at, report_file)
+            yield FSInputFile(report_path, filename=filename)
+        finally:
+            os.remove(report_path)
@@ -0,0 +1,620 @@
+import logging
+from datetime import timedelta
+
+from config import (
+    OPERATION_START_SHIFT, OPERATION_END_SHIFT, OPERATION_START_BREAK, OPERATION_END_BREAK,
+    OPERATION_PHOTO_RECEIVED,
+)
+
+logger = logging.getLogger(__name__)
+
+OPERATION_PARAMS = {
+    "start_shift": OPERATION_START_SHIFT,
+    "end_shift": OPERATION_END_SHIFT,
+    "start_break": OPERATION_START_BREAK,
+    "end_break": OPERATION_END_BREAK,
+    "photo_received": OPERATION_PHOTO_RECEIVED,
+}
+
+# Восстановление таблицы shifts по журналу operations (для всех пользователей
+# или для одного, если передан user_id; только смены, начатые между started_from
+# и started_to включительно, если они переданы). Смена — start_shift и ближайший
+# после него end_shift; перерывы и фото учитываются внутри этого интервала так же,
+# как в calculate_break_duration.
+SHIFTS_REBUILD = """
+    INSERT INTO shifts (user_id, started_at, ended_at, break_seconds, break_started_at, has_photo)
+    SELECT s.user_id, s.created_at, e.created_at,
+        COALESCE(br.break_seconds, 0),
+        CASE WHEN e.created_at IS NULL AND lb.operation = %(start_break)s THEN lb.created_at END,
+        EXISTS (
+            SELECT 1
+            FROM operations
+            WHERE user_id = s.user_id
+                AND operation = %(photo_received)s
+                AND created_at BETWEEN s.created_at AND COALESCE(e.created_at, 'infinity')
+        )
+    FROM operations s
+    LEFT JOIN LATERAL (
+        SELECT created_at
+        FROM operations
+        WHERE user_id = s.user_id
+            AND operation = %(end_shift)s
+            AND created_at > s.created_at
+        ORDER BY created_at
+        LIMIT 1
+    ) e ON TRUE
+    LEFT JOIN LATERAL (
+        SELECT SUM(EXTRACT(EPOCH FROM b.created_at - b.prev_at)) AS break_seconds
+        FROM (
+            SELECT operation, created_at,
+                LAG(operation) OVER (ORDER BY created_at) AS prev_operation,
+                LAG(created_at) OVER (ORDER BY created_at) AS prev_at
+            FROM operations
+            WHERE user_id = s.user_id
+                AND operation IN (%(start_break)s, %(end_break)s)
+                AND created_at BETWEEN s.created_at AND COALESCE(e.created_at, 'infinity')
+        ) b
+        WHERE b.operation = %(end_break)s AND b.prev_operation = %(start_break)s
+    ) br ON TRUE
+    LEFT JOIN LATERAL (
+        SELECT operation, created_at
+        FROM operations
+        WHERE user_id = s.user_id
+            AND operation IN (%(start_break)s, %(end_break)s)
+            AND created_at >= s.created_at
+        ORDER BY created_at DESC
+        LIMIT 1
+    ) lb ON e.created_at IS NULL
+    WHERE s.operation = %(start_shift)s
+        AND (%(user_id)s::integer IS NULL OR s.user_id = %(user_id)s::integer)
+        AND s.created_at BETWEEN COALESCE(%(started_from)s::timestamp, '-infinity')
+            AND COALESCE(%(started_to)s::timestamp, 'infinity')
+"""
+
+# Параметры SHIFTS_REBUILD для всех смен всех пользователей
+SHIFTS_REBUILD_ALL = {**OPERATION_PARAMS, "user_id": None, "started_from": None, "started_to": None}
+
+# Смены пользователя, которые может изменить правка его операции со временем
+# created_at (operation_edits): начатые не раньше последнего end_shift до неё
+# (NULL — такого нет) и не позже неё. Более ранние смены закончились до правки,
+# а более поздние начались после неё и от неё не зависят. Последний столбец —
+# первая операция начала или конца смены после правки (NULL — такой нет): после
+# неё нарушения последовательности (pairing.py) от правки тоже не зависят.
+OPERATION_EDIT_WINDOWS = """
+    SELECT t.user_id, e.created_at, t.created_at, n.created_at
+    FROM unnest(%(user_ids)s::integer[], %(created_at)s::timestamp[]) AS t(user_id, created_at)
+    LEFT JOIN LATERAL (
+        SELECT created_at
+        FROM operations
+        WHERE user_id = t.user_id
+            AND operation = %(end_shift)s
+            AND created_at < t.created_at
+        ORDER BY created_at DESC
+        LIMIT 1
+    ) e ON TRUE
+    LEFT JOIN LATERAL (
+        SELECT created_at
+        FROM operations
+        WHERE user_id = t.user_id
+            AND operation IN (%(start_shift)s, %(end_shift)s)
+            AND created_at > t.created_at
+        ORDER BY created_at
+        LIMIT 1
+    ) n ON TRUE
+"""
+
+# Дневная сводка сотрудника (daily_attendance) по таблице shifts: начало первой
+# и конец последней смены дня (NULL, пока последняя смена открыта), отработанное
+# время завершённых смен, перерывы и число смен. Смена относится к дню своего
+# начала. Пересчитываются все дни пользователя user_id или, если его нет, всех.
+DAILY_ATTENDANCE_ROLLUP = """
+    INSERT INTO daily_attendance
+        (user_id, day, first_start, last_end, worked_seconds, break_seconds, shift_count)
+    SELECT user_id, started_at::date, MIN(started_at),
+        CASE WHEN bool_and(ended_at IS NOT NULL) THEN MAX(ended_at) END,
+        COALESCE(SUM(EXTRACT(EPOCH FROM ended_at - started_at) - break_seconds)
+            FILTER (WHERE ended_at IS NOT NULL), 0),
+        SUM(break_seconds), COUNT(*)
+    FROM shifts
+    WHERE %(user_id)s::integer IS NULL OR user_id = %(user_id)s::integer
+    GROUP BY user_id, started_at::date
+"""
+
+# Пересчёт дней сводки (user_id, day) из списков user_ids и days: сначала
+# DAILY_ATTENDANCE_DAYS_DELETE, затем DAILY_ATTENDANCE_DAYS_ROLLUP
+DAILY_ATTENDANCE_DAYS_DELETE = """
+    DELETE FROM daily_attendance d
+    USING unnest(%(user_ids)s::integer[], %(days)s::date[]) AS t(user_id, day)
+    WHERE d.user_id = t.user_id AND d.day = t.day
+"""
+
+DAILY_ATTENDANCE_DAYS_ROLLUP = """
+    INSERT INTO daily_attendance
+        (user_id, day, first_start, last_end, worked_seconds, break_seconds, shift_count)
+    SELECT s.user_id, t.day, MIN(s.started_at),
+        CASE WHEN bool_and(s.ended_at IS NOT NULL) THEN MAX(s.ended_at) END,
+        COALESCE(SUM(EXTRACT(EPOCH FROM s.ended_at - s.started_at) - s.break_seconds)
+            FILTER (WHERE s.ended_at IS NOT NULL), 0),
+        SUM(s.break_seconds), COUNT(*)
+    FROM unnest(%(user_ids)s::integer[], %(days)s::date[]) AS t(user_id, day)
+    JOIN shifts s ON s.user_id = t.user_id AND s.started_at >= t.day AND s.started_at < t.day + 1
+    GROUP BY s.user_id, t.day
+"""
+
+# Создание месячной секции operations (operations_ГГГГ_ММ) для месяца,
+# в который попадает month. Строки этого месяца, успевшие попасть
+# в operations_default, переносятся в новую секцию. Возвращает FALSE,
+# если такая таблица уже есть (в том числе отсоединённая для архивации).
+CREATE_OPERATIONS_PARTITION_FUNCTION = """
+    CREATE OR REPLACE FUNCTION create_operations_partition(month DATE) RETURNS BOOLEAN AS $$
+    DECLARE
+        range_from TIMESTAMP := date_trunc('month', month);
+        range_to TIMESTAMP := date_trunc('month', month) + INTERVAL '1 month';
+        partition_name TEXT := 'operations_' || to_char(month, 'YYYY_MM');
+    BEGIN
+        IF to_regclass(partition_name) IS NOT NULL THEN
+            RETURN FALSE;
+        END IF;
+        EXECUTE format('CREATE TABLE %I (LIKE operations INCLUDING DEFAULTS)', partition_name);
+        EXECUTE format(
+            'WITH moved AS (
+                DELETE FROM operations_default WHERE created_at >= %L AND created_at < %L RETURNING *
+            )
+            INSERT INTO %I SELECT * FROM moved',
+            range_from, range_to, partition_name);
+        EXECUTE format('ALTER TABLE operations ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+            partition_name, range_from, range_to);
+        RETURN TRUE;
+    END;
+    $$ LANGUAGE plpgsql;
+"""
+
+# Приводит тип shifts.user_id к типу users.id (его задаёт тот, кто создал users)
+SHIFTS_USER_ID_TYPE = """
+    DO $$
+    DECLARE
+        users_id_type TEXT := (
+            SELECT format_type(atttypid, atttypmod) FROM pg_attribute
+            WHERE attrelid = 'users'::regclass AND attname = 'id'
+        );
+    BEGIN
+        IF users_id_type <> (
+            SELECT format_type(atttypid, atttypmod) FROM pg_attribute
+            WHERE attrelid = 'shifts'::regclass AND attname = 'user_id'
+        ) THEN
+            EXECUTE format('ALTER TABLE shifts ALTER COLUMN user_id TYPE %s', users_id_type);
+        END IF;
+    END
+    $$;
+"""
+
+# Секционирование журнала operations по месяцам created_at: запросы за
+# период и последние операции пользователя читают только нужные секции,
+# а старые месяцы архивируются целиком (partitions.py). Существующие
+# данные переносятся в новую таблицу; если её создала админка, сохраняется
+# и колонка id. Первичный ключ секционированной таблицы обязан включать
+# ключ секционирования, поэтому он составной (id, created_at), а тип
+# user_id — как у users.id (его задаёт тот, кто создал users).
+# Те же операторы выполняет админка (botpanel/migrations/0006_operations_partitioned),
+# поэтому обычная таблица переименовывается, только если operations ещё не
+# секционирована, а перенос данных — только если есть что переносить.
+OPERATIONS_PARTITIONED = [
+    """
+    DO $$
+    BEGIN
+        IF (SELECT relkind FROM pg_class WHERE oid = to_regclass('operations')) = 'r' THEN
+            ALTER TABLE operations RENAME TO operations_unpartitioned;
+            ALTER INDEX IF EXISTS operations_user_op_created_idx
+                RENAME TO operations_unpartitioned_user_op_created_idx;
+            ALTER INDEX IF EXISTS operations_op_created_idx RENAME TO operations_unpartitioned_op_created_idx;
+            ALTER INDEX IF EXISTS operations_created_idx RENAME TO operations_unpartitioned_created_idx;
+            ALTER INDEX IF EXISTS operations_pkey RENAME TO operations_unpartitioned_pkey;
+            ALTER SEQUENCE IF EXISTS operations_id_seq RENAME TO operations_unpartitioned_id_seq;
+        END IF;
+    END
+    $$;
+    """,
+    """
+    DO $$
+    DECLARE
+        users_id_type TEXT := (
+            SELECT format_type(atttypid, atttypmod) FROM pg_attribute
+            WHERE attrelid = 'users'::regclass AND attname = 'id'
+        );
+    BEGIN
+        EXECUTE format('
+            CREATE TABLE IF NOT EXISTS operations (
+                id BIGSERIAL,
+                user_id %s NOT NULL,
+                operation VARCHAR NOT NULL,
+                created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                CONSTRAINT operations_pkey PRIMARY KEY (id, created_at),
+                CONSTRAINT fk_operations_user
+                    FOREIGN KEY (user_id)
+                    REFERENCES users (id)
+                    ON DELETE CASCADE
+            ) PARTITION BY RANGE (created_at)', users_id_type);
+    END
+    $$;
+    """,
+    # Строки вне созданных месяцев (например, время из далёкого будущего)
+    "CREATE TABLE IF NOT EXISTS operations_default PARTITION OF operations DEFAULT;",
+    """
+    CREATE INDEX IF NOT EXISTS operations_user_op_created_idx
+        ON operations (user_id, operation, created_at DESC);
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS operations_op_created_idx
+        ON operations (operation, created_at);
+    """,
+    CREATE_OPERATIONS_PARTITION_FUNCTION,
+    # Секции для всех месяцев с данными и на три месяца вперёд, затем перенос
+    # строк. У таблицы, созданной ботом, колонки id нет: номера выдаются заново
+    # в порядке времени
+    """
+    DO $$
+    DECLARE
+        first_at TIMESTAMP;
+    BEGIN
+        IF to_regclass('operations_unpartitioned') IS NOT NULL THEN
+            SELECT MIN(created_at) INTO first_at FROM operations_unpartitioned;
+        END IF;
+        PERFORM create_operations_partition(month::date)
+        FROM generate_series(
+            date_trunc('month', LEAST(first_at, LOCALTIMESTAMP)),
+            date_trunc('month', LOCALTIMESTAMP) + INTERVAL '3 months',
+            INTERVAL '1 month'
+        ) AS month;
+
+        IF to_regclass('operations_unpartitioned') IS NULL THEN
+            RETURN;
+        END IF;
+        IF EXISTS (
+            SELECT 1
+            FROM information_schema.columns
+            WHERE table_schema = current_schema()
+                AND table_name = 'operations_unpartitioned'
+                AND column_name = 'id'
+        ) THEN
+            INSERT INTO operations (id, user_id, operation, created_at)
+            SELECT id, user_id, operation, created_at FROM operations_unpartitioned;
+            PERFORM setval(pg_get_serial_sequence('operations', 'id'),
+                COALESCE((SELECT MAX(id) FROM operations), 0) + 1, FALSE);
+        ELSE
+            INSERT INTO operations (user_id, operation, created_at)
+            SELECT user_id, operation, created_at FROM operations_unpartitioned ORDER BY created_at;
+        END IF;
+        DROP TABLE operations_unpartitioned;
+    END
+    $$;
+    """,
+    # Архивированные секции: месяц, число строк и файл выгрузки
+    """
+    CREATE TABLE IF NOT EXISTS operations_archives (
+        partition_name VARCHAR PRIMARY KEY,
+        range_from TIMESTAMP NOT NULL,
+        range_to TIMESTAMP NOT NULL,
+        rows BIGINT NOT NULL,
+        file VARCHAR NOT NULL,
+        archived_at TIMESTAMP NOT NULL DEFAULT LOCALTIMESTAMP
+    );
+    """,
+]
+
+# Номер advisory-блокировки, под которой применяются миграции, чтобы несколько
+# запущенных экземпляров бота не применяли одну и ту же миграцию одновременно.
+MIGRATIONS_LOCK_ID = 7_310_001
+
+# Advisory-блокировка пересчёта daily_attendance: периодический пересчёт
+# (aggregates.py) и пересборка смен пользователя не пишут сводки одновременно
+DAILY_ATTENDANCE_LOCK_ID = 7_310_004
+
+# Отметка в aggregate_checkpoints: время последней операции, учтённой в daily_attendance
+CHECKPOINT_DAILY_ATTENDANCE = "daily_attendance"
+
+# Отметки report_watermarks и время операций ставятся внутри транзакции и
+# становятся видны при её фиксации, то есть могут появиться "в прошлом"
+# относительно уже обработанных. Поэтому они перечитываются с таким запасом
+# (отметки, уже обработанные в прошлый раз, пропускаются).
+WATERMARK_OVERLAP = timedelta(minutes=5)
+
+# Версионированные миграции схемы: (версия, название, [SQL, ...]).
+# Оператор — строка SQL или пара (SQL, параметры).
+# Новые миграции только добавляются в конец списка. Индексы и таблицы,
+# которые видит админка, повторяются в botpanel/migrations с теми же именами,
+# а все операторы написаны с IF NOT EXISTS, поэтому порядок запуска бота
+# и "manage.py migrate" не важен.
+MIGRATIONS = [
+    (1, "initial", [
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            id SERIAL PRIMARY KEY,
+            full_name VARCHAR,
+            telegram_id VARCHAR UNIQUE,
+            department VARCHAR,
+            position VARCHAR,
+            is_admin BOOLEAN DEFAULT FALSE,
+            reminder VARCHAR
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS weekends (
+            user_id INTEGER NOT NULL,
+            date DATE NOT NULL,
+            CONSTRAINT fk_weekends_user
+                FOREIGN KEY (user_id)
+                REFERENCES users (id)
+                ON DELETE CASCADE
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS operations (
+            user_id INTEGER NOT NULL,
+            operation VARCHAR NOT NULL,
+            created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            CONSTRAINT fk_operations_user
+                FOREIGN KEY (user_id)
+                REFERENCES users (id)
+                ON DELETE CASCADE
+        );
+        """,
+    ]),
+    (2, "operations_and_weekends_indexes", [
+        # Состояние пользователя, последние смены и поиск конца смены
+        """
+        CREATE INDEX IF NOT EXISTS operations_user_op_created_idx
+            ON operations (user_id, operation, created_at DESC);
+        """,
+        # Отчёты: все начала смен и перерывы за период
+        """
+        CREATE INDEX IF NOT EXISTS operations_op_created_idx
+            ON operations (operation, created_at);
+        """,
+        # Календарь выходных: занятость по датам. Индекс уникальный: один
+        # выходной на дату, и из двух одновременных записей на одну дату
+        # вставится только одна. Уже занятые дважды даты оставляются за первой записью
+        """
+        DELETE FROM weekends a
+        USING weekends b
+        WHERE a.date = b.date AND a.ctid > b.ctid;
+        """,
+        """
+        CREATE UNIQUE INDEX IF NOT EXISTS weekends_date_key
+            ON weekends (date);
+        """,
+    ]),
+    (3, "shifts", [
+        """
+        CREATE TABLE IF NOT EXISTS shifts (
+            id BIGSERIAL PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            started_at TIMESTAMP NOT NULL,
+            ended_at TIMESTAMP,
+            break_seconds DOUBLE PRECISION NOT NULL DEFAULT 0,
+            break_started_at TIMESTAMP,
+            has_photo BOOLEAN NOT NULL DEFAULT FALSE,
+            CONSTRAINT fk_shifts_user
+                FOREIGN KEY (user_id)
+                REFERENCES users (id)
+                ON DELETE CASCADE
+        );
+        """,
+        # users могла создать админка (BIGINT), а shifts — бот, или наоборот
+        SHIFTS_USER_ID_TYPE,
+        """
+        CREATE INDEX IF NOT EXISTS shifts_user_started_idx
+            ON shifts (user_id, started_at DESC);
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS shifts_started_idx
+            ON shifts (started_at);
+        """,
+        # Открытые смены: "идёт ли смена" и обновления при каждой операции
+        """
+        CREATE INDEX IF NOT EXISTS shifts_open_idx
+            ON shifts (user_id) WHERE ended_at IS NULL;
+        """,
+        "DELETE FROM shifts;",
+        (SHIFTS_REBUILD, SHIFTS_REBUILD_ALL),
+    ]),
+    # Дни, данные которых изменились после их окончания: по ним кэш отчётов
+    # понимает, что сохранённый отчёт за прошлый период устарел
+    (4, "report_watermarks", [
+        """
+        CREATE TABLE IF NOT EXISTS report_watermarks (
+            day DATE PRIMARY KEY,
+            changed_at TIMESTAMP NOT NULL
+        );
+        """,
+    ]),
+    # Состояния FSM (диалог отчёта, страница календаря выходных), общие
+    # для всех экземпляров бота
+    (5, "fsm_states", [
+        """
+        CREATE TABLE IF NOT EXISTS fsm_states (
+            key VARCHAR PRIMARY KEY,
+            state VARCHAR,
+            data JSONB NOT NULL DEFAULT '{}',
+            updated_at TIMESTAMP NOT NULL DEFAULT LOCALTIMESTAMP
+        );
+        """,
+        # Удаление заброшенных состояний
+        """
+        CREATE INDEX IF NOT EXISTS fsm_states_updated_idx
+            ON fsm_states (updated_at);
+        """,
+    ]),
+    # Фото рабочих мест (photos.py): задания на загрузку и сохранённые файлы.
+    # Фото относится к операции photo_received: operation_id и время операции
+    # вместе — первичный ключ секционированной operations (миграция 7), по
+    # времени же фото показываются в админке. Файл лежит в PHOTO_DIR под
+    # именем sha256 содержимого
+    (6, "photos", [
+        """
+        CREATE TABLE IF NOT EXISTS photos (
+            id BIGSERIAL PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            operation_id BIGINT NOT NULL,
+            operation_created_at TIMESTAMP NOT NULL,
+            file_id VARCHAR NOT NULL,
+            file_unique_id VARCHAR NOT NULL,
+            status VARCHAR NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            claimed_at TIMESTAMP,
+            sha256 VARCHAR(64),
+            size INTEGER,
+            has_thumbnail BOOLEAN NOT NULL DEFAULT FALSE,
+            stored_at TIMESTAMP,
+            CONSTRAINT fk_photos_user
+                FOREIGN KEY (user_id)
+                REFERENCES users (id)
+                ON DELETE CASCADE
+        );
+        """,
+        # Фото операции и фото сотрудника за период
+        """
+        CREATE INDEX IF NOT EXISTS photos_user_operation_idx
+            ON photos (user_id, operation_created_at);
+        """,
+        # Повторно присланный файл не скачивается заново
+        """
+        CREATE INDEX IF NOT EXISTS photos_file_unique_idx
+            ON photos (file_unique_id) WHERE status = 'stored';
+        """,
+        # Незавершённые задания: после перезапуска и при переполнении очереди
+        """
+        CREATE INDEX IF NOT EXISTS photos_pending_idx
+            ON photos (id) WHERE status = 'pending';
+        """,
+    ]),
+    # Журнал operations секционируется по месяцам created_at (OPERATIONS_PARTITIONED)
+    (7, "operations_partitioned", OPERATIONS_PARTITIONED),
+    # Список операций в админке сортируется по created_at DESC, id DESC:
+    # с индексом первая страница читается без сортировки всего журнала
+    (8, "operations_created_idx", [
+        """
+        CREATE INDEX IF NOT EXISTS operations_created_idx
+            ON operations (created_at DESC, id DESC);
+        """,
+    ]),
+    # Сводные показатели отделов по дням (aggregates.py) и отметки, до какого
+    # изменения report_watermarks пересчитаны сводные таблицы
+    (9, "department_daily_stats", [
+        """
+        CREATE TABLE IF NOT EXISTS department_daily_stats (
+            id BIGSERIAL PRIMARY KEY,
+            day DATE NOT NULL,
+            department VARCHAR NOT NULL,
+            employees INTEGER NOT NULL,
+            shifts INTEGER NOT NULL,
+            worked_seconds DOUBLE PRECISION NOT NULL,
+            break_seconds DOUBLE PRECISION NOT NULL,
+            late_starts INTEGER NOT NULL,
+            UNIQUE (day, department)
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS aggregate_checkpoints (
+            name VARCHAR PRIMARY KEY,
+            checkpoint TIMESTAMP,
+            refreshed_at TIMESTAMP NOT NULL
+        );
+        """,
+    ]),
+    # Дневные сводки сотрудников для отчётов, админки и "Время работы"
+    # (aggregates.py) с замечаниями отчёта (нарушения последовательности
+    # операций, pairing.py). День только с замечаниями — строка без смен
+    # (shift_count = 0, first_start NULL). Сводки и замечания заполняет
+    # первый roll_up: отметки в aggregate_checkpoints ещё нет, и он считает
+    # всё заново. Отметка ALL_DAYS устаревает кэш отчётов: отчёты теперь
+    # по дням, а не по сменам.
+    (10, "daily_attendance", [
+        """
+        CREATE TABLE IF NOT EXISTS daily_attendance (
+            id BIGSERIAL PRIMARY KEY,
+            user_id INTEGER NOT NULL REFERENCES users (id) ON DELETE CASCADE,
+            day DATE NOT NULL,
+            first_start TIMESTAMP,
+            last_end TIMESTAMP,
+            worked_seconds DOUBLE PRECISION NOT NULL,
+            break_seconds DOUBLE PRECISION NOT NULL,
+            shift_count INTEGER NOT NULL,
+            notes TEXT,
+            UNIQUE (user_id, day)
+        );
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS daily_attendance_day_idx
+            ON daily_attendance (day);
+        """,
+        """
+        INSERT INTO report_watermarks (day, changed_at)
+        VALUES ('0001-01-01', clock_timestamp()::timestamp)
+        ON CONFLICT (day) DO UPDATE SET changed_at = EXCLUDED.changed_at;
+        """,
+        # Правки операций в админке (botpanel/signals.py): пользователь и время
+        # изменённой операции (старое и новое при переносе). Бот разбирает их
+        # (db.apply_operation_edits) по уведомлению и при каждом подключении
+        # LISTEN, поэтому правки, сделанные пока бот не работал, тоже учитываются.
+        """
+        CREATE TABLE IF NOT EXISTS operation_edits (
+            id BIGSERIAL PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            created_at TIMESTAMP NOT NULL
+        );
+        """,
+    ]),
+    # Задания на отчёты (report_jobs.py): очередь переживает перезапуск бота.
+    # Одинаковый запрос администратора, пока он в очереди или выполняется,
+    # повторно не ставится (частичный уникальный индекс). Неудачное задание
+    # снова берётся не раньше not_before
+    (11, "report_jobs", [
+        """
+        CREATE TABLE IF NOT EXISTS report_jobs (
+            id BIGSERIAL PRIMARY KEY,
+            user_id INTEGER NOT NULL REFERENCES users (id) ON DELETE CASCADE,
+            chat_id BIGINT NOT NULL,
+            format VARCHAR NOT NULL,
+            date_from DATE NOT NULL,
+            date_to DATE NOT NULL,
+            status VARCHAR NOT NULL DEFAULT 'queued',
+            message_id BIGINT,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            not_before TIMESTAMP,
+            created_at TIMESTAMP NOT NULL DEFAULT LOCALTIMESTAMP,
+            claimed_at TIMESTAMP,
+            finished_at TIMESTAMP
+        );
+        """,
+        """
+        CREATE UNIQUE INDEX IF NOT EXISTS report_jobs_active_idx
+            ON report_jobs (user_id, format, date_from, date_to)
+            WHERE status IN ('queued', 'running');
+        """,
+    ]),
+]
+
+
+async def apply_migrations(conn):
+    """Применяет ещё не применённые миграции в одной транзакции соединения conn."""
+    await conn.execute("SELECT pg_advisory_xact_lock(%s)", (MIGRATIONS_LOCK_ID,))
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name VARCHAR NOT NULL,
+            applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        );
+    """)
+    cur = await conn.execute("SELECT version FROM schema_migrations")
+    applied = {row[0] for row in await cur.fetchall()}
+
+    for version, name, statements in MIGRATIONS:
+        if version in applied:
+            continue
+        for statement in statements:
+            if isinstance(statement, tuple):
+                await conn.execute(*statement)
+            else:
+                await conn.execute(statement)
+        await conn.execute("INSERT INTO schema_migrations (version, name) VALUES (%s, %s)", (version, name))
+        logger.info("Применена миграция %s_%s", version, name)
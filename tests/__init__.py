@@ -0,0 +1,102 @@
+"""
+Тесты бота. Нужен PostgreSQL с параметрами подключения из .env; запуск из
+корня репозитория:
+    python -m unittest discover -s tests -t .
+
+Тесты работают в отдельной базе test_<DB_NAME>: она создаётся заново при
+первом тесте с БД, и к ней применяются миграции schema.py.
+"""
+import asyncio
+import atexit
+import os
+import unittest
+from contextlib import contextmanager
+from unittest import mock
+
+from dotenv import load_dotenv
+
+# До импорта config: все модули бота должны подключаться к тестовой базе
+load_dotenv()
+os.environ["DB_NAME"] = "test_" + os.getenv("DB_NAME", "bot")
+
+import psycopg  # noqa: E402
+from psycopg import AsyncCursor, AsyncServerCursor  # noqa: E402
+from psycopg.conninfo import make_conninfo  # noqa: E402
+
+import db  # noqa: E402
+from schema import apply_migrations  # noqa: E402
+
+# Все таблицы бота; очищаются перед каждым тестом
+TABLES = ("users, operations, weekends, shifts, report_watermarks, fsm_states, photos, daily_attendance,"
+          " department_daily_stats, aggregate_checkpoints, report_jobs, operations_archives, operation_edits")
+
+# Пул соединений привязан к циклу событий и не открывается повторно,
+# поэтому все тесты выполняют корутины в одном цикле (run)
+_runner = None
+
+
+def run(coro):
+    """Выполняет корутину в общем для тестов цикле событий."""
+    return _runner.run(coro)
+
+
+def _create_database():
+    dbname = os.environ["DB_NAME"]
+    with psycopg.connect(make_conninfo(db.CONNINFO, dbname="postgres"), autocommit=True) as conn:
+        conn.execute(f'DROP DATABASE IF EXISTS "{dbname}" WITH (FORCE)')
+        conn.execute(f'CREATE DATABASE "{dbname}"')
+
+
+async def _open_pool():
+    await db.pool.open(wait=True)
+    async with db.pool.connection() as conn:
+        await apply_migrations(conn)
+
+
+def _close():
+    _runner.run(db.pool.close())
+    _runner.close()
+
+
+def clear_caches():
+    for cache in (db.user_cache, db.state_cache, db.booked_dates_cache, db.fsm_cache):
+        cache.clear()
+
+
+@contextmanager
+def count_queries():
+    """Список запросов (текстов SQL), выполненных курсорами внутри блока, включая COPY."""
+    queries = []
+
+    def counted(cls, name):
+        original = getattr(cls, name)
+
+        def wrapper(self, query, *args, **kwargs):
+            queries.append(str(query))
+            return original(self, query, *args, **kwargs)
+        return mock.patch.object(cls, name, wrapper)
+
+    with counted(AsyncCursor, "execute"), counted(AsyncServerCursor, "execute"), counted(AsyncCursor, "copy"):
+        yield queries
+
+
+class DatabaseTestCase(unittest.TestCase):
+    """Тест с базой бота: перед каждым тестом таблицы очищаются, кэши сбрасываются."""
+
+    @classmethod
+    def setUpClass(cls):
+        global _runner
+        if _runner is None:
+            _create_database()
+            _runner = asyncio.Runner()
+            _runner.run(_open_pool())
+            atexit.register(_close)
+
+    def setUp(self):
+        run(self.execute(f"TRUNCATE {TABLES} RESTART IDENTITY"))
+        clear_caches()
+
+    @staticmethod
+    async def execute(query, params=None):
+        async with db.pool.connection() as conn:
+            await conn.execute(query, params)
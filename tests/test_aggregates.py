@@ -0,0 +1,43 @@
+from datetime import datetime, timedelta
+
+from tests import DatabaseTestCase, run
+
+import db
+from aggregates import attendance_aggregates
+from config import OPERATION_START_SHIFT, OPERATION_END_SHIFT
+from schema import SHIFTS_REBUILD, SHIFTS_REBUILD_ALL
+from tests.test_operation_edits import fetch
+
+
+async def start_shift(started_at: datetime):
+    async with db.pool.connection() as conn:
+        await conn.execute("INSERT INTO users (telegram_id) VALUES ('1')")
+        await conn.execute("INSERT INTO operations (user_id, operation, created_at) VALUES (1, %s, %s)",
+                           (OPERATION_START_SHIFT, started_at))
+        await conn.execute(SHIFTS_REBUILD, SHIFTS_REBUILD_ALL)
+
+
+class AggregatesTests(DatabaseTestCase):
+    def test_month_worked_time_includes_shifts_after_roll_up(self):
+        now = run(db.get_db_time())
+        if now.day == 1:
+            self.skipTest("вчера — прошлый месяц")
+        # Ночная смена со вчерашнего дня завершена после пересчёта: сводка её ещё не учла
+        started_at = datetime.combine(now.date(), datetime.min.time()) - timedelta(hours=1)
+        run(start_shift(started_at))
+        run(attendance_aggregates.roll_up())
+        run(db.write_operations([(1, OPERATION_END_SHIFT)]))
+        (ended_at,), = run(fetch("SELECT ended_at FROM shifts"))
+        self.assertEqual(run(db.get_month_worked_time(1)),
+                         timedelta(seconds=int((ended_at - started_at).total_seconds())))
+
+    def test_department_stats_count_open_shift(self):
+        started_at = run(db.get_db_time()) - timedelta(minutes=1)
+        run(start_shift(started_at))
+        run(attendance_aggregates.roll_up())
+        run(attendance_aggregates.refresh())
+        (employees, shifts, worked_seconds), = run(fetch(
+            "SELECT employees, shifts, worked_seconds FROM department_daily_stats WHERE day = %s",
+            (started_at.date(),)))
+        self.assertEqual((employees, shifts), (1, 1))
+        self.assertGreater(worked_seconds, 0)
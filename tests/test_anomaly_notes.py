@@ -0,0 +1,53 @@
+from datetime import timedelta
+
+from tests import DatabaseTestCase, run
+
+import db
+from aggregates import attendance_aggregates, CHECKPOINT_DAILY_ATTENDANCE
+from config import OPERATION_START_SHIFT, OPERATION_END_SHIFT, OPERATION_START_BREAK
+from pairing import refresh_notes
+from schema import SHIFTS_REBUILD, SHIFTS_REBUILD_ALL
+from tests.test_operation_edits import fetch
+
+
+async def start_shift_days_ago(days: int):
+    async with db.pool.connection() as conn:
+        await conn.execute("INSERT INTO users (telegram_id) VALUES ('1')")
+        await conn.execute("INSERT INTO operations (user_id, operation, created_at) VALUES (1, %s, %s)",
+                           (OPERATION_START_SHIFT, await db.get_db_time() - timedelta(days=days)))
+        await conn.execute(SHIFTS_REBUILD, SHIFTS_REBUILD_ALL)
+
+
+async def refresh_today_notes(today):
+    async with db.pool.connection() as conn:
+        await refresh_notes(conn, {1: (today, None)})
+
+
+async def notes():
+    return await fetch("SELECT day, shift_count, notes FROM daily_attendance WHERE notes IS NOT NULL ORDER BY day")
+
+
+class AnomalyNotesTests(DatabaseTestCase):
+    def test_long_shift_end_is_not_an_anomaly(self):
+        run(start_shift_days_ago(3))
+        run(attendance_aggregates.roll_up())
+        # Смена длиннее суток завершается и после неё начинается перерыв
+        run(db.write_operations([(1, OPERATION_END_SHIFT)]))
+        run(db.write_operations([(1, OPERATION_START_BREAK)]))
+        run(attendance_aggregates.roll_up())
+        today = run(db.get_db_time()).date()
+        self.assertEqual(run(notes()), [(today, 0, "перерыв вне смены")])
+
+        # Полный пересчёт даёт те же замечания
+        run(self.execute("DELETE FROM aggregate_checkpoints WHERE name = %s", (CHECKPOINT_DAILY_ATTENDANCE,)))
+        run(attendance_aggregates.roll_up())
+        self.assertEqual(run(notes()), [(today, 0, "перерыв вне смены")])
+
+    def test_notes_inside_open_shift_read_from_its_start(self):
+        run(start_shift_days_ago(3))
+        run(self.execute("INSERT INTO operations (user_id, operation, created_at) VALUES (1, %s, LOCALTIMESTAMP)",
+                         (OPERATION_START_BREAK,)))
+        # Замечания только за сегодня, но смена открыта третий день: перерыв в ней
+        today = run(db.get_db_time()).date()
+        run(refresh_today_notes(today))
+        self.assertEqual(run(notes()), [])
@@ -0,0 +1,76 @@
+import unittest
+from datetime import datetime
+
+from aiogram import Bot, Dispatcher, types
+
+from button_router import ButtonRouter
+
+CHAT = types.Chat(id=1, type="private")
+USER = types.User(id=1, is_bot=False, first_name="Тест")
+
+
+def message_update(**fields) -> types.Update:
+    return types.Update(update_id=1, message=types.Message(message_id=1, date=datetime.now(), chat=CHAT,
+                                                           from_user=USER, **fields))
+
+
+def callback_update(data: str) -> types.Update:
+    return types.Update(update_id=1, callback_query=types.CallbackQuery(id="1", from_user=USER, chat_instance="1",
+                                                                        data=data))
+
+
+class ButtonRouterTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.bot = Bot("42:TEST")
+        self.addAsyncCleanup(self.bot.session.close)
+        self.dp = Dispatcher()
+        self.router = ButtonRouter()
+        self.router.attach(self.dp)
+        self.handled = []
+
+        @self.router.message("Начать смену", "Закончить смену")
+        async def shift(message: types.Message):
+            self.handled.append(("shift", message.text))
+
+        @self.router.message(content_type="photo")
+        async def photo(message: types.Message):
+            self.handled.append(("photo", message.content_type))
+
+        @self.router.callback("today")
+        async def today(callback_query: types.CallbackQuery):
+            self.handled.append(("today", callback_query.data))
+
+        @self.router.callback(prefix="day")
+        async def day(callback_query: types.CallbackQuery):
+            self.handled.append(("day", callback_query.data))
+
+        # Остальные обработчики проверяются, только если кнопка не подошла
+        @self.dp.message()
+        async def other_message(message: types.Message):
+            self.handled.append(("other", message.text))
+
+        @self.dp.callback_query()
+        async def other_callback(callback_query: types.CallbackQuery):
+            self.handled.append(("other", callback_query.data))
+
+    async def feed(self, update: types.Update):
+        await self.dp.feed_update(self.bot, update)
+        return self.handled.pop()
+
+    async def test_message_routes(self):
+        self.assertEqual(await self.feed(message_update(text="Закончить смену")), ("shift", "Закончить смену"))
+        self.assertEqual(await self.feed(message_update(photo=[types.PhotoSize(
+            file_id="1", file_unique_id="1", width=1, height=1)])), ("photo", "photo"))
+        # Текст должен совпадать с кнопкой целиком
+        self.assertEqual(await self.feed(message_update(text="Начать смену!")), ("other", "Начать смену!"))
+
+    async def test_callback_routes(self):
+        self.assertEqual(await self.feed(callback_update("today")), ("today", "today"))
+        self.assertEqual(await self.feed(callback_update("day:2024-01-01")), ("day", "day:2024-01-01"))
+        # Префикс — только часть до ":"
+        self.assertEqual(await self.feed(callback_update("day")), ("other", "day"))
+        self.assertEqual(await self.feed(callback_update("today:1")), ("other", "today:1"))
+
+    def test_button_is_assigned_once(self):
+        with self.assertRaises(ValueError):
+            self.router.message("Начать смену")(lambda message: None)
@@ -0,0 +1,30 @@
+import unittest
+from datetime import date, datetime
+
+from fsm_storage import dumps_data, loads_data
+
+
+class FSMDataTests(unittest.TestCase):
+    def test_round_trip_keeps_types(self):
+        data = {
+            "date_from": date(2024, 1, 1),
+            "shown_at": datetime(2024, 1, 31, 18, 30, 15, 250),
+            "calendar": {"month": date(2024, 2, 1), "pages": [date(2024, 3, 1), 2]},
+            "format": "Excel",
+            "comment": "перерыв",
+            "count": 3,
+            "empty": None,
+        }
+        restored = loads_data(dumps_data(data))
+        self.assertEqual(restored, data)
+        self.assertIs(type(restored["date_from"]), date)
+        self.assertIs(type(restored["shown_at"]), datetime)
+
+    def test_plain_dicts_are_not_decoded(self):
+        # Словарь с другими ключами рядом с "$date" — обычные данные
+        data = {"value": {"$date": "2024-01-01", "note": "x"}}
+        self.assertEqual(loads_data(dumps_data(data)), data)
+
+    def test_unsupported_type_is_rejected(self):
+        with self.assertRaises(TypeError):
+            dumps_data({"days": {date(2024, 1, 1)}})
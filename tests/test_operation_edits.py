@@ -0,0 +1,72 @@
+from datetime import date, datetime, timedelta
+
+from tests import DatabaseTestCase, run
+from tests.test_reports import PERIOD_TO, seed
+
+import db
+from config import OPERATION_END_BREAK, OPERATION_END_SHIFT
+from pairing import refresh_notes
+from schema import SHIFTS_REBUILD, SHIFTS_REBUILD_ALL, DAILY_ATTENDANCE_ROLLUP
+
+DAY_2 = PERIOD_TO - timedelta(days=3)
+DAY_3 = PERIOD_TO - timedelta(days=2)
+
+
+async def fetch(query, params=None):
+    async with db.pool.connection() as conn:
+        cur = await conn.execute(query, params)
+        return await cur.fetchall()
+
+
+async def delete_operation(operation: str, created_at: datetime):
+    """Удаляет операцию первого сотрудника, как админка: с записью в operation_edits."""
+    async with db.pool.connection() as conn:
+        await conn.execute("DELETE FROM operations WHERE user_id = 1 AND operation = %s AND created_at = %s",
+                           (operation, created_at))
+        await conn.execute("INSERT INTO operation_edits (user_id, created_at) VALUES (1, %s)", (created_at,))
+
+
+async def snapshot():
+    return (
+        await fetch("SELECT user_id, started_at, ended_at, break_seconds FROM shifts ORDER BY user_id, started_at"),
+        await fetch("SELECT user_id, day, first_start, last_end, worked_seconds, break_seconds, shift_count, notes"
+                    " FROM daily_attendance ORDER BY user_id, day"),
+    )
+
+
+async def rebuild_all():
+    async with db.pool.connection() as conn:
+        await conn.execute("DELETE FROM shifts")
+        await conn.execute(SHIFTS_REBUILD, SHIFTS_REBUILD_ALL)
+        await conn.execute("DELETE FROM daily_attendance")
+        await conn.execute(DAILY_ATTENDANCE_ROLLUP, {"user_id": None})
+        await refresh_notes(conn, {1: (date.min, None), 2: (date.min, None)})
+
+
+class OperationEditsTests(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        run(seed(users=2, days=5))
+
+    def apply_edits(self):
+        run(db.apply_operation_edits())
+        applied = run(snapshot())
+        run(rebuild_all())
+        self.assertEqual(applied, run(snapshot()))
+        self.assertEqual(run(fetch("SELECT * FROM operation_edits")), [])
+        return [day for day, in run(fetch("SELECT day FROM report_watermarks ORDER BY day"))]
+
+    def test_deleted_break_rebuilds_its_day_only(self):
+        run(delete_operation(OPERATION_END_BREAK, datetime.combine(DAY_3, datetime.min.time())
+                             + timedelta(hours=13, minutes=45)))
+        self.assertEqual(self.apply_edits(), [DAY_3])
+
+    def test_deleted_shift_end_joins_next_shift(self):
+        run(delete_operation(OPERATION_END_SHIFT, datetime.combine(DAY_2, datetime.min.time()) + timedelta(hours=18)))
+        # Следующее начало смены стало повторным: у дня 3 появилось замечание
+        self.assertEqual(self.apply_edits(), [DAY_2, DAY_3])
+        (notes,), = run(fetch("SELECT notes FROM daily_attendance WHERE user_id = 1 AND day = %s", (DAY_3,)))
+        self.assertEqual(notes, "повторное начало смены")
+        (ended_at,), = run(fetch("SELECT ended_at FROM shifts WHERE user_id = 1 AND started_at::date = %s",
+                                 (DAY_2,)))
+        self.assertEqual(ended_at, datetime.combine(DAY_3, datetime.min.time()) + timedelta(hours=18))
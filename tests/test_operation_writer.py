@@ -0,0 +1,51 @@
+import asyncio
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+
+import db
+from config import OPERATION_START_SHIFT, OPERATION_END_SHIFT
+from db import OperationWriter, WrittenOperation
+
+CREATED_AT = datetime(2024, 1, 1, 9)
+
+
+class OperationWriterTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.batches = []
+        self.error = None
+        patch = mock.patch.object(db, "write_operations", self.write_operations)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    async def write_operations(self, operations):
+        self.batches.append(operations)
+        if self.error:
+            raise self.error
+        return [WrittenOperation(i + 1, CREATED_AT + timedelta(seconds=i)) for i in range(len(operations))]
+
+    async def test_concurrent_inserts_share_one_write(self):
+        writer = OperationWriter(flush_interval=0.01, max_batch=10)
+        created = await asyncio.gather(writer.insert(1, OPERATION_START_SHIFT), writer.insert(2, OPERATION_END_SHIFT))
+        self.assertEqual(self.batches, [[(1, OPERATION_START_SHIFT), (2, OPERATION_END_SHIFT)]])
+        self.assertEqual(created, [(1, CREATED_AT), (2, CREATED_AT + timedelta(seconds=1))])
+
+    async def test_full_batch_is_written_without_waiting(self):
+        writer = OperationWriter(flush_interval=3600, max_batch=2)
+        inserts = [asyncio.create_task(writer.insert(user_id, OPERATION_START_SHIFT)) for user_id in (1, 2, 3)]
+        done, pending = await asyncio.wait(inserts, timeout=0.1)
+        self.assertEqual((len(done), len(pending)), (2, 1))
+        self.assertEqual(self.batches, [[(1, OPERATION_START_SHIFT), (2, OPERATION_START_SHIFT)]])
+
+        # Остаток дописывается при закрытии
+        await writer.close()
+        self.assertEqual(await inserts[2], (1, CREATED_AT))
+        self.assertEqual(len(self.batches), 2)
+
+    async def test_write_error_reaches_every_caller(self):
+        self.error = RuntimeError("connection lost")
+        writer = OperationWriter(flush_interval=0.01, max_batch=10)
+        results = await asyncio.gather(writer.insert(1, OPERATION_START_SHIFT),
+                                       writer.insert(2, OPERATION_START_SHIFT), return_exceptions=True)
+        self.assertEqual(results, [self.error, self.error])
+        self.assertEqual(len(self.batches), 1)
@@ -0,0 +1,178 @@
+import asyncio
+import unittest
+from unittest import mock
+
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import GetUpdates, SendMessage
+
+import outbound
+from outbound import OutboundScheduler, PriorityLimiter, TokenBucket, PRIORITY_BULK, PRIORITY_REPLY, bulk_sends
+
+
+class FakeClock:
+    """Время для outbound (вместо модуля time) и таймеры цикла событий, которые срабатывают в advance."""
+
+    class Timer:
+        def __init__(self, when, callback):
+            self.when = when
+            self.callback = callback
+            self.cancelled = False
+
+        def cancel(self):
+            self.cancelled = True
+
+    def __init__(self):
+        self.now = 0.0
+        self.timers = []
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def call_later(self, delay, callback):
+        timer = self.Timer(self.now + delay, callback)
+        self.timers.append(timer)
+        return timer
+
+    async def advance(self, seconds: float):
+        target = self.now + seconds
+        while due := [timer for timer in self.timers if not timer.cancelled and timer.when <= target]:
+            timer = min(due, key=lambda t: t.when)
+            self.timers.remove(timer)
+            self.now = timer.when
+            timer.callback()
+            await settle()
+        self.now = target
+        await settle()
+
+
+async def settle():
+    """Даёт ожидающим задачам выполниться до следующего await."""
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+
+class FakeClockTestCase(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.clock = FakeClock()
+        for patch in (mock.patch.object(outbound, "time", self.clock),
+                      mock.patch.object(asyncio.get_running_loop(), "call_later", self.clock.call_later)):
+            patch.start()
+            self.addCleanup(patch.stop)
+
+
+class TokenBucketTests(FakeClockTestCase):
+    async def test_refills_at_rate(self):
+        bucket = TokenBucket(rate=1, capacity=2)
+        self.assertTrue(bucket.try_take())
+        self.assertTrue(bucket.try_take())
+        self.assertFalse(bucket.try_take())
+        self.assertEqual(bucket.time_until_token(), 1)
+
+        await self.clock.advance(0.5)
+        self.assertFalse(bucket.try_take())
+        await self.clock.advance(0.5)
+        self.assertTrue(bucket.try_take())
+
+    async def test_block_holds_tokens(self):
+        bucket = TokenBucket(rate=1, capacity=2)
+        bucket.block(5)
+        await self.clock.advance(4)
+        self.assertFalse(bucket.try_take())
+        self.assertEqual(bucket.time_until_token(), 1)
+        await self.clock.advance(1)
+        self.assertTrue(bucket.try_take())
+
+
+class PriorityLimiterTests(FakeClockTestCase):
+    async def wait(self, limiter: PriorityLimiter, priority: int, order: list):
+        await limiter.acquire(priority)
+        order.append(priority)
+
+    async def test_replies_overtake_bulk(self):
+        limiter = PriorityLimiter(rate=1, capacity=1)
+        await limiter.acquire(PRIORITY_BULK)
+        order = []
+        tasks = [asyncio.create_task(self.wait(limiter, priority, order))
+                 for priority in (PRIORITY_BULK, PRIORITY_BULK, PRIORITY_REPLY)]
+        await settle()
+        self.assertEqual(order, [])
+
+        await self.clock.advance(1)
+        self.assertEqual(order, [PRIORITY_REPLY])
+        await self.clock.advance(2)
+        self.assertEqual(order, [PRIORITY_REPLY, PRIORITY_BULK, PRIORITY_BULK])
+        await asyncio.gather(*tasks)
+
+    async def test_cancelled_waiter_is_skipped(self):
+        limiter = PriorityLimiter(rate=1, capacity=1)
+        await limiter.acquire(PRIORITY_REPLY)
+        order = []
+        cancelled = asyncio.create_task(self.wait(limiter, PRIORITY_REPLY, order))
+        waiting = asyncio.create_task(self.wait(limiter, PRIORITY_BULK, order))
+        await settle()
+        cancelled.cancel()
+        await self.clock.advance(1)
+        self.assertEqual(order, [PRIORITY_BULK])
+        await waiting
+
+    async def test_pause_delays_waiters(self):
+        limiter = PriorityLimiter(rate=1, capacity=1)
+        await limiter.acquire(PRIORITY_REPLY)
+        order = []
+        task = asyncio.create_task(self.wait(limiter, PRIORITY_REPLY, order))
+        await settle()
+        limiter.pause(10)
+        await self.clock.advance(9)
+        self.assertEqual(order, [])
+        await self.clock.advance(1)
+        self.assertEqual(order, [PRIORITY_REPLY])
+        await task
+
+
+class OutboundSchedulerTests(FakeClockTestCase):
+    def scheduler(self, max_retries=2) -> OutboundScheduler:
+        return OutboundScheduler(global_rate=30, global_burst=30, chat_rate=1, chat_burst=1, max_retries=max_retries)
+
+    def flood_then(self, floods: int, retry_after: int = 5):
+        """make_request: первые floods вызовов отвечают 429, затем "ok"; вызовы — в calls."""
+        calls = []
+
+        async def make_request(bot, method):
+            calls.append((self.clock.now, outbound.send_priority.get()))
+            if len(calls) <= floods:
+                raise TelegramRetryAfter(method, "Too Many Requests", retry_after)
+            return "ok"
+        return make_request, calls
+
+    async def test_retries_after_chat_pause(self):
+        scheduler = self.scheduler()
+        make_request, calls = self.flood_then(1)
+        task = asyncio.create_task(scheduler(make_request, None, SendMessage(chat_id=1, text="x")))
+        await settle()
+        await self.clock.advance(4)
+        self.assertEqual(len(calls), 1)
+        await self.clock.advance(1)
+        self.assertEqual(await task, "ok")
+        self.assertEqual(calls, [(0, PRIORITY_REPLY), (5, PRIORITY_REPLY)])
+
+    async def test_gives_up_after_max_retries(self):
+        scheduler = self.scheduler(max_retries=1)
+        make_request, calls = self.flood_then(2)
+        task = asyncio.create_task(scheduler(make_request, None, SendMessage(chat_id=1, text="x")))
+        await settle()
+        await self.clock.advance(10)
+        with self.assertRaises(TelegramRetryAfter):
+            await task
+        self.assertEqual(len(calls), 2)
+
+    async def test_flood_without_chat_pauses_all_chats(self):
+        scheduler = self.scheduler()
+        make_request, calls = self.flood_then(1)
+        with self.assertRaises(TelegramRetryAfter):
+            await scheduler(make_request, None, GetUpdates())
+        with bulk_sends():
+            task = asyncio.create_task(scheduler(make_request, None, SendMessage(chat_id=1, text="x")))
+        await settle()
+        await self.clock.advance(5)
+        self.assertEqual(await task, "ok")
+        self.assertEqual(calls, [(0, PRIORITY_REPLY), (5, PRIORITY_BULK)])
@@ -0,0 +1,76 @@
+import asyncio
+import hashlib
+import os
+import tempfile
+import threading
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from photos import PhotoJob, PhotoPipeline, photo_path, _HashingFile
+
+
+def jobs(*ids) -> list:
+    return [PhotoJob(photo_id, f"file{photo_id}", f"unique{photo_id}") for photo_id in ids]
+
+
+class PhotoQueueTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.pipeline = PhotoPipeline("photos", workers=1, queue_size=2, thumbnail_size=100,
+                                      thumbnail_processes=1, max_attempts=3, rescan_interval=60)
+        # Без start(): задания только ставятся в очередь, воркеры их не забирают
+        self.pipeline._queue = asyncio.Queue(self.pipeline.queue_size)
+        self.pipeline._release = mock.AsyncMock()
+
+    async def test_overflow_is_released_to_database(self):
+        await self.pipeline._enqueue(jobs(1, 2, 3, 4))
+        self.assertEqual([self.pipeline._queue.get_nowait().id for _ in range(2)], [1, 2])
+        # Не поместившиеся задания остаются в БД без отметки и достанутся следующей проверке
+        self.pipeline._release.assert_awaited_once_with([3, 4])
+
+    async def test_nothing_released_when_queue_has_room(self):
+        await self.pipeline._enqueue(jobs(1))
+        self.pipeline._release.assert_not_awaited()
+
+    async def test_close_releases_queued_and_active_jobs(self):
+        await self.pipeline._enqueue(jobs(2, 3))
+        self.pipeline._active.add(1)
+        await self.pipeline.close()
+        self.pipeline._release.assert_awaited_once_with([1, 2, 3])
+
+
+class PhotoIngestTests(unittest.IsolatedAsyncioTestCase):
+    async def test_download_is_written_off_the_event_loop(self):
+        chunks = [b"jpeg" * 1000, b"data" * 10]
+        writers = set()
+
+        async def stream_content(url, chunk_size, raise_for_status):
+            for chunk in chunks:
+                yield chunk
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        pipeline = PhotoPipeline(directory.name, workers=1, queue_size=1, thumbnail_size=100,
+                                 thumbnail_processes=1, max_attempts=3, rescan_interval=60)
+        os.makedirs(os.path.join(directory.name, "tmp"))
+        bot = mock.AsyncMock(token="42:TEST")
+        bot.get_file.return_value = SimpleNamespace(file_path="photos/1.jpg")
+        bot.session = SimpleNamespace(stream_content=stream_content,
+                                      api=SimpleNamespace(file_url=lambda token, path: f"/{token}/{path}"))
+        pipeline._bot = bot
+
+        write = _HashingFile.write
+
+        def recording_write(destination, chunk):
+            writers.add(threading.get_ident())
+            return write(destination, chunk)
+
+        with mock.patch.object(_HashingFile, "write", recording_write):
+            stored = await pipeline._ingest(PhotoJob(1, "file1", "unique1"))
+
+        sha256 = hashlib.sha256(b"".join(chunks)).hexdigest()
+        self.assertEqual((stored.sha256, stored.size, stored.has_thumbnail), (sha256, 4040, False))
+        with open(photo_path(directory.name, sha256), "rb") as f:
+            self.assertEqual(f.read(), b"".join(chunks))
+        self.assertNotIn(threading.get_ident(), writers)
+        self.assertEqual(os.listdir(os.path.join(directory.name, "tmp")), [])
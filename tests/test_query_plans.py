@@ -0,0 +1,71 @@
+from datetime import date, datetime, timedelta
+
+from tests import DatabaseTestCase, run
+
+import db
+from config import OPERATION_START_BREAK, OPERATION_END_BREAK
+from reports import REPORT_QUERY
+from schema import OPERATION_PARAMS
+
+NOW = datetime.now()
+TODAY = date.today()
+
+# Запросы, которые бот выполняет на каждое действие пользователя и при
+# построении отчёта, с параметрами как при вызове
+HOT_QUERIES = {
+    "get_user_state": (db.USER_STATE_QUERY, {"operations": list(OPERATION_PARAMS.values()), "user_id": 1}),
+    "calculate_break_duration": (db.BREAK_OPERATIONS_QUERY, (
+        1, OPERATION_START_BREAK, OPERATION_END_BREAK, NOW - timedelta(days=1), NOW,
+    )),
+    "get_last_shift_times": (db.LAST_SHIFT_QUERY, (1,)),
+    "get_month_worked_time": (db.MONTH_WORKED_TIME_QUERY, {
+        "user_id": 1, "checkpoint": db.CHECKPOINT_DAILY_ATTENDANCE, "overlap": db.WATERMARK_OVERLAP,
+    }),
+    "get_booked_dates": (db.BOOKED_DATES_QUERY, (TODAY, TODAY + timedelta(days=30))),
+    "book_day_off": (db.BOOK_DAY_OFF_QUERY, (1, TODAY)),
+    **{
+        f"shift_update_{operation}": (query, {"user_id": 1, "created_at": NOW})
+        for operation, query in db.SHIFT_UPDATES.items()
+    },
+    "report": (REPORT_QUERY, {"date_from": TODAY - timedelta(days=30), "date_to": TODAY}),
+}
+
+# Таблицы, которые растут с числом сотрудников и дней
+CHECKED_TABLES = {"operations", "weekends", "shifts", "daily_attendance"}
+
+
+def table_name(relation: str) -> str:
+    # Секции operations (operations_2024_01, operations_default) считаются самой таблицей
+    return "operations" if relation.startswith("operations_") else relation
+
+
+def scans(plan):
+    """(таблица, тип узла) для каждого чтения таблицы в плане."""
+    if "Relation Name" in plan:
+        yield table_name(plan["Relation Name"]), plan["Node Type"]
+    for child in plan.get("Plans", []):
+        yield from scans(child)
+
+
+async def explain(query, params) -> dict:
+    async with db.pool.connection() as conn:
+        # Последовательное сканирование запрещается: если план всё равно его
+        # выбирает, подходящего индекса нет
+        await conn.execute("SET LOCAL enable_seqscan = off")
+        cur = await conn.execute("EXPLAIN (FORMAT JSON) " + query, params)
+        (plan,), = await cur.fetchall()
+        await conn.rollback()
+    return plan[0]["Plan"]
+
+
+class HotQueryPlanTests(DatabaseTestCase):
+    def test_hot_queries_do_not_seq_scan(self):
+        for name, (query, params) in HOT_QUERIES.items():
+            with self.subTest(name):
+                nodes = list(scans(run(explain(query, params))))
+                seq_scans = sorted({table for table, node in nodes if node == "Seq Scan" and table in CHECKED_TABLES})
+                self.assertEqual(seq_scans, [], f"{name}: Seq Scan по {', '.join(seq_scans)}")
+
+    def test_detects_seq_scan(self):
+        plan = run(explain("SELECT * FROM shifts WHERE break_seconds > 0", None))
+        self.assertIn(("shifts", "Seq Scan"), list(scans(plan)))
@@ -0,0 +1,79 @@
+import io
+import os
+import tempfile
+from datetime import date, timedelta
+
+from tests import DatabaseTestCase, run
+
+import db
+from report_cache import ReportCache
+
+DATE_FROM = date(2026, 3, 1)
+DATE_TO = date(2026, 3, 31)
+
+
+async def mark_changed(*days):
+    async with db.pool.connection() as conn:
+        await db.mark_report_days_changed(conn, days)
+
+
+class ReportCacheTests(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.cache = self.new_cache(max_size=1024)
+
+    def new_cache(self, max_size):
+        cache = ReportCache(self.directory, max_size)
+        cache.load()
+        return cache
+
+    def put(self, content: bytes, date_from=DATE_FROM, date_to=DATE_TO, cache=None):
+        built_at = run(db.get_db_time())
+        run((cache or self.cache).put("csv", date_from, date_to, built_at, io.BytesIO(content)))
+
+    def get(self, date_from=DATE_FROM, date_to=DATE_TO, cache=None):
+        cached = run((cache or self.cache).get("csv", date_from, date_to))
+        if cached is None:
+            return None
+        with cached:
+            return cached.read()
+
+    def test_returns_report_until_a_day_of_its_period_changes(self):
+        self.put(b"report")
+        self.assertEqual(self.get(), b"report")
+
+        run(mark_changed(DATE_TO + timedelta(days=1), DATE_FROM - timedelta(days=1)))
+        self.assertEqual(self.get(), b"report")
+
+        run(mark_changed(DATE_FROM + timedelta(days=10)))
+        self.assertIsNone(self.get())
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_all_days_mark_invalidates_every_period(self):
+        self.put(b"march")
+        self.put(b"april", date(2026, 4, 1), date(2026, 4, 30))
+        run(mark_changed(db.ALL_DAYS))
+        self.assertIsNone(self.get())
+        self.assertIsNone(self.get(date(2026, 4, 1), date(2026, 4, 30)))
+
+    def test_report_built_after_change_is_fresh(self):
+        run(mark_changed(DATE_FROM))
+        self.put(b"rebuilt")
+        self.assertEqual(self.get(), b"rebuilt")
+
+    def test_opened_report_survives_eviction(self):
+        self.put(b"a" * 600)
+        cached = run(self.cache.get("csv", DATE_FROM, DATE_TO))
+        with cached:
+            # Другое задание кладёт отчёт, и первый вытесняется по размеру
+            self.put(b"b" * 600, date(2026, 4, 1), date(2026, 4, 30))
+            self.assertEqual(len(os.listdir(self.directory)), 1)
+            self.assertEqual(cached.read(), b"a" * 600)
+        self.assertIsNone(self.get())
+
+    def test_restored_after_restart(self):
+        self.put(b"report")
+        self.assertEqual(self.get(cache=self.new_cache(max_size=1024)), b"report")
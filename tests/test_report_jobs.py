@@ -0,0 +1,115 @@
+import asyncio
+import unittest
+from contextlib import asynccontextmanager
+from datetime import date
+from unittest import mock
+
+from tests import DatabaseTestCase, run
+
+import db
+import report_jobs
+from report_jobs import ReportJob, ReportProgress, ReportQueue, STATUS_CANCELLED, STATUS_QUEUED
+
+
+def queue(workers=2, admin_workers=2) -> ReportQueue:
+    return ReportQueue(workers, admin_workers, max_pending=5, max_attempts=3, progress_interval=1, poll_interval=1)
+
+
+async def job_state(job_id: int):
+    async with db.pool.connection() as conn:
+        cur = await conn.execute("SELECT status, attempts, not_before > LOCALTIMESTAMP FROM report_jobs WHERE id = %s",
+                                 (job_id,))
+        return await cur.fetchone()
+
+
+class ReportJobsTests(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        run(db.get_or_create_user("1"))
+        run(db.get_or_create_user("2"))
+
+    def submit(self, reports: ReportQueue, user_id: int, day: int = 1) -> int:
+        result = run(reports.submit(user_id, user_id, "xlsx", date(2024, 1, day), date(2024, 1, 31)))
+        self.assertTrue(result.created)
+        return result.job_id
+
+    def test_same_request_is_queued_once(self):
+        reports = queue()
+        job_id = self.submit(reports, 1)
+        result = run(reports.submit(1, 1, "xlsx", date(2024, 1, 1), date(2024, 1, 31)))
+        self.assertEqual((result.job_id, result.created), (job_id, False))
+        # Тот же период другим администратором — отдельное задание
+        self.assertNotEqual(self.submit(reports, 2), job_id)
+
+    def test_max_pending_per_admin(self):
+        reports = queue()
+        for day in range(1, reports.max_pending + 1):
+            self.submit(reports, 1, day)
+        result = run(reports.submit(1, 1, "xlsx", date(2024, 1, 20), date(2024, 1, 31)))
+        self.assertEqual((result.job_id, result.created), (None, False))
+        # Выполненное задание место освобождает
+        run(reports._finish(run(reports._claim()).id))
+        self.assertIsNotNone(run(reports.submit(1, 1, "xlsx", date(2024, 1, 20), date(2024, 1, 31))).job_id)
+        self.submit(reports, 2)
+
+    def test_cancelled_job_is_not_finished(self):
+        reports = queue()
+        job_id = self.submit(reports, 1)
+        self.assertEqual(run(reports._claim()).id, job_id)
+        self.assertTrue(run(reports.cancel(job_id, 1)))
+        self.assertIsNone(run(reports._finish(job_id)))
+        self.assertEqual(run(job_state(job_id))[0], STATUS_CANCELLED)
+
+    def test_failed_job_waits_before_retry(self):
+        reports = queue()
+        self.submit(reports, 1)
+        job = run(reports._claim())
+        run(reports._fail(job))
+        self.assertEqual(run(job_state(job.id)), (STATUS_QUEUED, 1, True))
+        self.assertIsNone(run(reports._claim()))
+
+        run(self.execute("UPDATE report_jobs SET not_before = LOCALTIMESTAMP"))
+        self.assertEqual(run(reports._claim()).id, job.id)
+
+    def test_workers_limit_is_shared_between_instances(self):
+        first, second = queue(workers=1), queue(workers=1)
+        self.submit(first, 1)
+        self.submit(second, 2)
+        self.assertIsNotNone(run(first._claim()))
+        self.assertIsNone(run(second._claim()))
+
+
+class SameReportTests(unittest.IsolatedAsyncioTestCase):
+    """Одинаковые отчёты разных администраторов в одном экземпляре строятся по очереди (без БД)."""
+
+    async def asyncSetUp(self):
+        self.events = []
+        self.reports = queue()
+        self.reports._bot = mock.AsyncMock()
+        self.reports._count_users = mock.AsyncMock(return_value=1)
+        patch = mock.patch.object(report_jobs, "report_document", self.report_document)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    @asynccontextmanager
+    async def report_document(self, format_choice, date_from, date_to, progress):
+        self.events.append(("start", date_from))
+        await asyncio.sleep(0.01)
+        yield f"{format_choice}_{date_from}"
+        self.events.append(("end", date_from))
+
+    def job(self, job_id: int, day: int) -> ReportJob:
+        return ReportJob(job_id, job_id, job_id, "xlsx", date(2024, 1, day), date(2024, 1, 31), None)
+
+    async def build(self, *jobs):
+        await asyncio.gather(*(self.reports._build(job, ReportProgress(None)) for job in jobs))
+
+    async def test_same_report_waits_for_first(self):
+        await self.build(self.job(1, 1), self.job(2, 1))
+        self.assertEqual(self.events, [("start", date(2024, 1, 1)), ("end", date(2024, 1, 1))] * 2)
+        self.assertEqual(self.reports._bot.send_document.await_count, 2)
+        self.assertEqual(self.reports._inflight, {})
+
+    async def test_different_reports_run_together(self):
+        await self.build(self.job(1, 1), self.job(2, 2))
+        self.assertEqual([event for event, _ in self.events], ["start", "start", "end", "end"])
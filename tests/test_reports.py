@@ -0,0 +1,64 @@
+from datetime import date, timedelta
+
+from tests import DatabaseTestCase, run, count_queries
+
+import db
+from reports import generate_report_csv
+from schema import OPERATION_PARAMS, SHIFTS_REBUILD, SHIFTS_REBUILD_ALL, DAILY_ATTENDANCE_ROLLUP
+
+PERIOD_TO = date.today() - timedelta(days=1)
+PERIOD_FROM = PERIOD_TO - timedelta(days=29)
+
+# Смена 9:00–18:00 с перерывом 13:00–13:45 в каждый из days дней до date_to
+# у сотрудников с id больше after_user
+SEED_OPERATIONS = """
+    INSERT INTO operations (user_id, operation, created_at)
+    SELECT u.id, o.operation, d.day + o.at
+    FROM users u
+    CROSS JOIN generate_series(%(date_to)s::date - %(days)s + 1, %(date_to)s::date, INTERVAL '1 day') AS d(day)
+    CROSS JOIN (VALUES
+        (%(start_shift)s, INTERVAL '9 hours'),
+        (%(start_break)s, INTERVAL '13 hours'),
+        (%(end_break)s, INTERVAL '13 hours 45 minutes'),
+        (%(end_shift)s, INTERVAL '18 hours')
+    ) AS o(operation, at)
+    WHERE u.id > %(after_user)s
+"""
+
+
+async def seed(users: int, days: int):
+    """Добавляет users сотрудников со сменами за days дней и пересобирает смены и дневные сводки."""
+    async with db.pool.connection() as conn:
+        cur = await conn.execute("SELECT COALESCE(MAX(id), 0) FROM users")
+        after_user = (await cur.fetchone())[0]
+        await conn.execute("""
+            INSERT INTO users (full_name, telegram_id)
+            SELECT 'Сотрудник ' || g, 'test_' || g FROM generate_series(%s::integer + 1, %s::integer + %s) AS g
+        """, (after_user, after_user, users))
+        await conn.execute(SEED_OPERATIONS, {**OPERATION_PARAMS, "date_to": PERIOD_TO, "days": days,
+                                             "after_user": after_user})
+        await conn.execute("DELETE FROM shifts")
+        await conn.execute(SHIFTS_REBUILD, SHIFTS_REBUILD_ALL)
+        await conn.execute("DELETE FROM daily_attendance")
+        await conn.execute(DAILY_ATTENDANCE_ROLLUP, {"user_id": None})
+
+
+class ReportQueriesTests(DatabaseTestCase):
+    def build_report(self):
+        with count_queries() as queries:
+            report_file = run(generate_report_csv(PERIOD_FROM, PERIOD_TO))
+        with report_file:
+            lines = report_file.read().decode().splitlines()
+        return len(queries), lines
+
+    def test_query_count_does_not_depend_on_users_and_shifts(self):
+        run(seed(users=1, days=1))
+        few, lines = self.build_report()
+        self.assertIn("Сотрудник 1", lines)
+
+        run(seed(users=20, days=30))
+        many, lines = self.build_report()
+        self.assertEqual(many, few)
+        # Шапки и строки смен всех сотрудников
+        self.assertEqual(sum(line.startswith("Сотрудник") for line in lines), 21)
+        self.assertEqual(sum(line.endswith(";09:00;18:00;45:00;8:15;") for line in lines), 1 + 20 * 30)
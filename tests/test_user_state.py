@@ -0,0 +1,44 @@
+from tests import DatabaseTestCase, clear_caches, run
+
+import db
+from config import OPERATION_START_SHIFT, OPERATION_END_SHIFT, OPERATION_START_BREAK
+
+
+async def state():
+    return await db.is_shift_active(1), await db.is_break_active(1)
+
+
+async def watermarks():
+    async with db.pool.connection() as conn:
+        cur = await conn.execute("SELECT count(*) FROM report_watermarks")
+        return (await cur.fetchone())[0]
+
+
+class UserStateTests(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        run(db.get_or_create_user("1"))
+
+    def write(self, *operations):
+        for operation in operations:
+            run(db.insert_operation(1, operation))
+
+    def test_break_left_open_does_not_carry_into_next_shift(self):
+        self.write(OPERATION_START_SHIFT, OPERATION_START_BREAK)
+        self.assertEqual(run(state()), (True, True))
+
+        # Кэш прогрет: ответ должен совпасть с прочитанным из БД
+        self.write(OPERATION_END_SHIFT, OPERATION_START_SHIFT)
+        cached = run(state())
+        clear_caches()
+        self.assertEqual(cached, run(state()))
+        self.assertEqual(cached, (True, False))
+
+    def test_existing_user_is_read_not_inserted(self):
+        clear_caches()
+        run(self.execute("DELETE FROM report_watermarks"))
+        self.assertEqual(run(db.get_or_create_user("1")), 1)
+        self.assertEqual(run(watermarks()), 0)
+        # Новый сотрудник отмечает все отчёты изменёнными
+        self.assertNotEqual(run(db.get_or_create_user("2")), 1)
+        self.assertEqual(run(watermarks()), 1)
@@ -127,6 +127,19 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Каталог фото рабочих мест, которые сохраняет бот (PHOTO_DIR в config.py бота)
+PHOTO_DIR = os.getenv('PHOTO_DIR', str(BASE_DIR.parent.parent / 'photos'))
+
+# Кэш фрагментов панели посещаемости (в памяти процесса). Текущее состояние
+# смен кэшируется и отдаётся браузеру с max-age на DASHBOARD_CACHE_SECONDS секунд
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'botpanel',
+    }
+}
+DASHBOARD_CACHE_SECONDS = int(os.getenv('DASHBOARD_CACHE_SECONDS', 30))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
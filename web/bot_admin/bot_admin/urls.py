@@ -15,8 +15,13 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
-from django.urls import path
+from django.urls import path, re_path
+
+from botpanel import views
 
 urlpatterns = [
+    path('admin/dashboard/', views.dashboard, name='dashboard'),
+    re_path(r'^admin/photos/(?P<kind>original|thumb)/(?P<sha256>[0-9a-f]{64})\.jpg$', views.photo_file,
+            name='photo_file'),
     path('admin/', admin.site.urls),
 ]
@@ -1,14 +1,117 @@
+import json
+
 from django.contrib import admin
-from .models import BotUser, Operation, Weekend
+from django.contrib.admin.options import ShowFacets
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Exists, OuterRef
+from django.forms.models import BaseInlineFormSet
+from django.urls import reverse
+from django.utils.functional import cached_property
+from django.utils.html import format_html
+
+from .models import BotUser, Operation, Weekend, Photo, Shift, DailyAttendance
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Пагинатор для больших таблиц: вместо точного COUNT(*) берёт оценку
+    планировщика PostgreSQL — по статистике таблицы и её секций, а при
+    фильтрах по EXPLAIN запроса. Точно считаются только небольшие выборки,
+    поэтому у последних страниц большой выборки число строк приблизительное.
+    """
+    exact_count_limit = 10000
+
+    @cached_property
+    def count(self):
+        estimate = self.estimate()
+        if estimate < self.exact_count_limit:
+            return self.object_list.count()
+        return estimate
+
+    def estimate(self):
+        queryset = self.object_list
+        with connections[queryset.db].cursor() as cursor:
+            if not queryset.query.where:
+                # Таблица и её секции (у несекционированной таблицы дерево пустое);
+                # reltuples = -1 у ещё не проанализированных таблиц
+                cursor.execute("""
+                    SELECT COALESCE(SUM(reltuples), 0)
+                    FROM pg_class
+                    WHERE (oid = %s::regclass OR oid IN (SELECT relid FROM pg_partition_tree(%s::regclass)))
+                        AND reltuples > 0
+                """, [queryset.model._meta.db_table] * 2)
+                return int(cursor.fetchone()[0])
+            sql, params = queryset.query.sql_with_params()
+            cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]["Plan"]["Plan Rows"])
+
+
+class TelegramIdFilter(admin.SimpleListFilter):
+    """
+    Фильтр по пользователю через поле ввода Telegram ID (уникальный индекс)
+    вместо списка всех пользователей в боковой панели.
+    """
+    title = "Telegram ID"
+    parameter_name = 'telegram_id'
+    template = 'admin/botpanel/telegram_id_filter.html'
+
+    def lookups(self, request, model_admin):
+        return ()
+
+    def has_output(self):
+        return True
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(user__telegram_id=self.value().strip())
+        return queryset
+
+    def choices(self, changelist):
+        yield {
+            'value': self.value() or '',
+            'params': [(name, value) for name, value in changelist.params.items() if name != self.parameter_name],
+            'reset_query_string': changelist.get_query_string(remove=[self.parameter_name]),
+        }
+
+
+class UserInlineFormSet(BaseInlineFormSet):
+    """
+    Строки пользователя на его странице. Пользователь строк — редактируемый
+    объект, он подставляется сразу, без запроса на каждую строку (для __str__).
+    Если задан max_rows, показываются только первые max_rows строк.
+    """
+    max_rows = None
+
+    def get_queryset(self):
+        if not hasattr(self, '_queryset'):
+            queryset = super().get_queryset()
+            if self.max_rows is not None:
+                queryset = self._queryset = queryset[:self.max_rows]
+            for obj in queryset:
+                setattr(obj, self.fk.name, self.instance)
+        return self._queryset
+
+
+class RecentOperationsFormSet(UserInlineFormSet):
+    # Последние операции пользователя; полный журнал — в списке операций с фильтром
+    max_rows = 50
+
 
 class OperationInline(admin.TabularInline):
     model = Operation
+    formset = RecentOperationsFormSet
+    verbose_name_plural = f"Последние операции (до {RecentOperationsFormSet.max_rows})"
     extra = 0
     readonly_fields = ('operation', 'created_at')
     can_delete = False
 
 class WeekendInline(admin.TabularInline):
     model = Weekend
+    formset = UserInlineFormSet
     extra = 0
     readonly_fields = ('date',)
     can_delete = False
@@ -20,16 +123,93 @@ class BotUserAdmin(admin.ModelAdmin):
     list_filter = ('department', 'is_admin')
     inlines = [OperationInline, WeekendInline]
 
+    def get_queryset(self, request):
+        # Состояние смены для всего списка — одним подзапросом (частичный индекс shifts_open_idx)
+        return super().get_queryset(request).annotate(
+            shift_active=Exists(Shift.objects.filter(user=OuterRef('pk'), ended_at__isnull=True)),
+        )
+
+    @admin.display(description="Смена активна", boolean=True, ordering='shift_active')
+    def current_shift_active(self, obj):
+        return obj.shift_active
+
 
 @admin.register(Operation)
 class OperationAdmin(admin.ModelAdmin):
     list_display = ('user', 'operation', 'created_at')
-    list_filter = ('operation', 'created_at', 'user')
+    list_filter = ('operation', 'created_at', TelegramIdFilter)
+    list_select_related = ('user',)
     search_fields = ('user__telegram_id', 'user__full_name', 'operation')
+    autocomplete_fields = ('user',)
+    # Журнал содержит миллионы строк: количество оценивается, а не считается
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    show_facets = ShowFacets.NEVER
 
 
 @admin.register(Weekend)
 class WeekendAdmin(admin.ModelAdmin):
     list_display = ('user', 'date')
-    list_filter = ('date', 'user')
+    list_filter = ('date', TelegramIdFilter)
+    list_select_related = ('user',)
     search_fields = ('user__telegram_id', 'user__full_name')
+    autocomplete_fields = ('user',)
+    show_facets = ShowFacets.NEVER
+
+
+def format_seconds(seconds):
+    minutes = int(seconds) // 60
+    return f"{minutes // 60}:{minutes % 60:02d}"
+
+
+@admin.register(DailyAttendance)
+class DailyAttendanceAdmin(admin.ModelAdmin):
+    # Сводки ведёт бот по сменам (aggregates.py), правки делаются в журнале операций
+    list_display = ('user', 'day', 'first_start', 'last_end', 'worked', 'breaks', 'shift_count', 'notes')
+    list_filter = ('day', TelegramIdFilter)
+    list_select_related = ('user',)
+    search_fields = ('user__telegram_id', 'user__full_name')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    show_facets = ShowFacets.NEVER
+
+    @admin.display(description="Отработано", ordering='worked_seconds')
+    def worked(self, obj):
+        return format_seconds(obj.worked_seconds)
+
+    @admin.display(description="Перерывы", ordering='break_seconds')
+    def breaks(self, obj):
+        return format_seconds(obj.break_seconds)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(Photo)
+class PhotoAdmin(admin.ModelAdmin):
+    # Записи создаёт и обновляет бот, в админке фото только просматриваются
+    list_display = ('user', 'operation_created_at', 'status', 'preview')
+    list_filter = ('status', 'operation_created_at')
+    list_select_related = ('user',)
+    search_fields = ('user__telegram_id', 'user__full_name')
+    readonly_fields = ('user', 'operation', 'operation_created_at', 'status', 'attempts', 'stored_at', 'size', 'sha256',
+                       'file_unique_id', 'preview')
+    exclude = ('file_id', 'claimed_at', 'has_thumbnail')
+
+    @admin.display(description="Фото")
+    def preview(self, obj):
+        if obj.status != "stored":
+            return "—"
+        original = reverse('photo_file', args=('original', obj.sha256))
+        shown = reverse('photo_file', args=('thumb', obj.sha256)) if obj.has_thumbnail else original
+        return format_html('<a href="{}" target="_blank"><img src="{}" style="max-height: 120px"></a>',
+                           original, shown)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,48 @@
+from django.db import migrations, models
+
+
+# Те же индексы создаёт бот при запуске (schema.py, миграция 2), поэтому
+# в базе они создаются с IF NOT EXISTS, а в состояние Django добавляются как обычно.
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('botpanel', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(
+                    sql='CREATE INDEX IF NOT EXISTS operations_user_op_created_idx ON operations (user_id, operation, created_at DESC);',
+                    reverse_sql='DROP INDEX IF EXISTS operations_user_op_created_idx;',
+                ),
+                migrations.RunSQL(
+                    sql='CREATE INDEX IF NOT EXISTS operations_op_created_idx ON operations (operation, created_at);',
+                    reverse_sql='DROP INDEX IF EXISTS operations_op_created_idx;',
+                ),
+                # Один выходной на дату; уже занятые дважды даты оставляются за первой записью
+                migrations.RunSQL(
+                    sql='''
+                        DELETE FROM weekends a USING weekends b WHERE a.date = b.date AND a.ctid > b.ctid;
+                        CREATE UNIQUE INDEX IF NOT EXISTS weekends_date_key ON weekends (date);
+                    ''',
+                    reverse_sql='DROP INDEX IF EXISTS weekends_date_key;',
+                ),
+            ],
+            state_operations=[
+                migrations.AddIndex(
+                    model_name='operation',
+                    index=models.Index(fields=['user', 'operation', '-created_at'], name='operations_user_op_created_idx'),
+                ),
+                migrations.AddIndex(
+                    model_name='operation',
+                    index=models.Index(fields=['operation', 'created_at'], name='operations_op_created_idx'),
+                ),
+                migrations.AddConstraint(
+                    model_name='weekend',
+                    constraint=models.UniqueConstraint(fields=('date',), name='weekends_date_key',
+                                                       violation_error_message='Этот день уже занят.'),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,76 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# Таблицу shifts создаёт и заполняет бот (schema.py, миграция 3), здесь та же схема
+# создаётся с IF NOT EXISTS, а модель добавляется в состояние Django. Тип
+# shifts.user_id приводится к типу users.id: users могла создать админка
+# (BIGINT), а shifts — бот (INTEGER), или наоборот.
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('botpanel', '0002_operations_and_weekends_indexes'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(
+                    sql='''
+                        CREATE TABLE IF NOT EXISTS shifts (
+                            id BIGSERIAL PRIMARY KEY,
+                            user_id INTEGER NOT NULL REFERENCES users (id) ON DELETE CASCADE,
+                            started_at TIMESTAMP NOT NULL,
+                            ended_at TIMESTAMP,
+                            break_seconds DOUBLE PRECISION NOT NULL DEFAULT 0,
+                            break_started_at TIMESTAMP,
+                            has_photo BOOLEAN NOT NULL DEFAULT FALSE
+                        );
+                        CREATE INDEX IF NOT EXISTS shifts_user_started_idx ON shifts (user_id, started_at DESC);
+                        CREATE INDEX IF NOT EXISTS shifts_started_idx ON shifts (started_at);
+                        CREATE INDEX IF NOT EXISTS shifts_open_idx ON shifts (user_id) WHERE ended_at IS NULL;
+
+                        DO $$
+                        DECLARE
+                            users_id_type TEXT := (
+                                SELECT format_type(atttypid, atttypmod) FROM pg_attribute
+                                WHERE attrelid = 'users'::regclass AND attname = 'id'
+                            );
+                        BEGIN
+                            IF users_id_type <> (
+                                SELECT format_type(atttypid, atttypmod) FROM pg_attribute
+                                WHERE attrelid = 'shifts'::regclass AND attname = 'user_id'
+                            ) THEN
+                                EXECUTE format('ALTER TABLE shifts ALTER COLUMN user_id TYPE %s', users_id_type);
+                            END IF;
+                        END
+                        $$;
+                    ''',
+                    reverse_sql='DROP TABLE IF EXISTS shifts;',
+                ),
+            ],
+            state_operations=[
+                migrations.CreateModel(
+                    name='Shift',
+                    fields=[
+                        ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('started_at', models.DateTimeField(verbose_name='Начало смены')),
+                        ('ended_at', models.DateTimeField(blank=True, null=True, verbose_name='Конец смены')),
+                        ('break_seconds', models.FloatField(default=0, verbose_name='Перерывы, сек.')),
+                        ('break_started_at', models.DateTimeField(blank=True, null=True, verbose_name='Начало текущего перерыва')),
+                        ('has_photo', models.BooleanField(default=False, verbose_name='Фото получено')),
+                        ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shifts', to='botpanel.botuser')),
+                    ],
+                    options={
+                        'db_table': 'shifts',
+                        'ordering': ['-started_at'],
+                        'indexes': [
+                            models.Index(fields=['user', '-started_at'], name='shifts_user_started_idx'),
+                            models.Index(fields=['started_at'], name='shifts_started_idx'),
+                            models.Index(condition=models.Q(('ended_at__isnull', True)), fields=['user'], name='shifts_open_idx'),
+                        ],
+                    },
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,22 @@
+from django.db import migrations
+
+
+# Таблицу report_watermarks создаёт бот (schema.py, миграция 4); админка пишет
+# в неё при изменении пользователей, поэтому таблица нужна и без запуска бота.
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('botpanel', '0003_shift'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql='''
+                CREATE TABLE IF NOT EXISTS report_watermarks (
+                    day DATE PRIMARY KEY,
+                    changed_at TIMESTAMP NOT NULL
+                );
+            ''',
+            reverse_sql='DROP TABLE IF EXISTS report_watermarks;',
+        ),
+    ]
@@ -0,0 +1,70 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# Таблицу photos создаёт и заполняет бот (schema.py, миграция 6), здесь та же схема
+# создаётся с IF NOT EXISTS, а модель добавляется в состояние Django.
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('botpanel', '0004_report_watermarks'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(
+                    sql='''
+                        CREATE TABLE IF NOT EXISTS photos (
+                            id BIGSERIAL PRIMARY KEY,
+                            user_id INTEGER NOT NULL REFERENCES users (id) ON DELETE CASCADE,
+                            operation_id BIGINT NOT NULL,
+                            operation_created_at TIMESTAMP NOT NULL,
+                            file_id VARCHAR NOT NULL,
+                            file_unique_id VARCHAR NOT NULL,
+                            status VARCHAR NOT NULL DEFAULT 'pending',
+                            attempts INTEGER NOT NULL DEFAULT 0,
+                            claimed_at TIMESTAMP,
+                            sha256 VARCHAR(64),
+                            size INTEGER,
+                            has_thumbnail BOOLEAN NOT NULL DEFAULT FALSE,
+                            stored_at TIMESTAMP
+                        );
+                        CREATE INDEX IF NOT EXISTS photos_user_operation_idx ON photos (user_id, operation_created_at);
+                        CREATE INDEX IF NOT EXISTS photos_file_unique_idx ON photos (file_unique_id) WHERE status = 'stored';
+                        CREATE INDEX IF NOT EXISTS photos_pending_idx ON photos (id) WHERE status = 'pending';
+                    ''',
+                    reverse_sql='DROP TABLE IF EXISTS photos;',
+                ),
+            ],
+            state_operations=[
+                migrations.CreateModel(
+                    name='Photo',
+                    fields=[
+                        ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('operation_created_at', models.DateTimeField(verbose_name='Время операции')),
+                        ('file_id', models.CharField(max_length=255, verbose_name='File ID')),
+                        ('file_unique_id', models.CharField(max_length=255, verbose_name='File unique ID')),
+                        ('status', models.CharField(choices=[('pending', 'Ожидает загрузки'), ('stored', 'Сохранено'), ('failed', 'Ошибка загрузки')], default='pending', max_length=20, verbose_name='Статус')),
+                        ('attempts', models.IntegerField(default=0, verbose_name='Неудачных загрузок')),
+                        ('claimed_at', models.DateTimeField(blank=True, null=True, verbose_name='Взято в работу')),
+                        ('sha256', models.CharField(blank=True, max_length=64, null=True, verbose_name='SHA-256')),
+                        ('size', models.IntegerField(blank=True, null=True, verbose_name='Размер, байт')),
+                        ('has_thumbnail', models.BooleanField(default=False, verbose_name='Есть уменьшенная копия')),
+                        ('stored_at', models.DateTimeField(blank=True, null=True, verbose_name='Сохранено')),
+                        ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='photos', to='botpanel.botuser')),
+                        ('operation', models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='photos', to='botpanel.operation', verbose_name='Операция')),
+                    ],
+                    options={
+                        'db_table': 'photos',
+                        'ordering': ['-operation_created_at'],
+                        'indexes': [
+                            models.Index(fields=['user', 'operation_created_at'], name='photos_user_operation_idx'),
+                            models.Index(condition=models.Q(('status', 'stored')), fields=['file_unique_id'], name='photos_file_unique_idx'),
+                            models.Index(condition=models.Q(('status', 'pending')), fields=['id'], name='photos_pending_idx'),
+                        ],
+                    },
+                ),
+            ],
+        ),
+    ]
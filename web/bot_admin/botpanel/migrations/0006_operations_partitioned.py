@@ -0,0 +1,30 @@
+import sys
+from pathlib import Path
+
+from django.db import migrations
+
+# Секционирование operations — те же операторы, что в миграции 7 бота
+# (schema.OPERATIONS_PARTITIONED), они берутся из кода бота в корне репозитория.
+# Операторы проверяют, секционирована ли уже таблица и есть ли в ней id,
+# поэтому порядок запуска бота и "manage.py migrate" не важен.
+sys.path.append(str(Path(__file__).resolve().parents[4]))
+from schema import OPERATIONS_PARTITIONED  # noqa: E402
+
+
+# Первичный ключ в базе составной (id, created_at), но в состоянии Django
+# остаётся id: админка не работает с составными ключами, а id уникален
+# благодаря последовательности.
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('botpanel', '0005_photo'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(sql=OPERATIONS_PARTITIONED, reverse_sql=migrations.RunSQL.noop),
+            ],
+            state_operations=[],
+        ),
+    ]
@@ -0,0 +1,27 @@
+from django.db import migrations, models
+
+
+# Тот же индекс создаёт бот (schema.py, миграция 8): по нему список операций
+# в админке читает первую страницу без сортировки всей таблицы.
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('botpanel', '0006_operations_partitioned'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(
+                    sql='CREATE INDEX IF NOT EXISTS operations_created_idx ON operations (created_at DESC, id DESC);',
+                    reverse_sql='DROP INDEX IF EXISTS operations_created_idx;',
+                ),
+            ],
+            state_operations=[
+                migrations.AddIndex(
+                    model_name='operation',
+                    index=models.Index(fields=['-created_at', '-id'], name='operations_created_idx'),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,71 @@
+from django.db import migrations, models
+
+
+# Таблицы сводных показателей создаёт и заполняет бот (schema.py, миграция 9),
+# здесь та же схема создаётся с IF NOT EXISTS, а модели добавляются в состояние Django.
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('botpanel', '0007_operations_created_idx'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(
+                    sql='''
+                        CREATE TABLE IF NOT EXISTS department_daily_stats (
+                            id BIGSERIAL PRIMARY KEY,
+                            day DATE NOT NULL,
+                            department VARCHAR NOT NULL,
+                            employees INTEGER NOT NULL,
+                            shifts INTEGER NOT NULL,
+                            worked_seconds DOUBLE PRECISION NOT NULL,
+                            break_seconds DOUBLE PRECISION NOT NULL,
+                            late_starts INTEGER NOT NULL,
+                            UNIQUE (day, department)
+                        );
+                        CREATE TABLE IF NOT EXISTS aggregate_checkpoints (
+                            name VARCHAR PRIMARY KEY,
+                            checkpoint TIMESTAMP,
+                            refreshed_at TIMESTAMP NOT NULL
+                        );
+                    ''',
+                    reverse_sql='DROP TABLE IF EXISTS department_daily_stats; DROP TABLE IF EXISTS aggregate_checkpoints;',
+                ),
+            ],
+            state_operations=[
+                migrations.CreateModel(
+                    name='DepartmentDailyStats',
+                    fields=[
+                        ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('day', models.DateField(verbose_name='День')),
+                        ('department', models.CharField(max_length=255, verbose_name='Отдел')),
+                        ('employees', models.IntegerField(verbose_name='Сотрудников')),
+                        ('shifts', models.IntegerField(verbose_name='Смен')),
+                        ('worked_seconds', models.FloatField(verbose_name='Отработано, сек.')),
+                        ('break_seconds', models.FloatField(verbose_name='Перерывы, сек.')),
+                        ('late_starts', models.IntegerField(verbose_name='Опозданий')),
+                    ],
+                    options={
+                        'db_table': 'department_daily_stats',
+                        'ordering': ['-day', 'department'],
+                        'constraints': [
+                            models.UniqueConstraint(fields=('day', 'department'), name='department_daily_stats_day_department_key'),
+                        ],
+                    },
+                ),
+                migrations.CreateModel(
+                    name='AggregateCheckpoint',
+                    fields=[
+                        ('name', models.CharField(max_length=255, primary_key=True, serialize=False, verbose_name='Таблица')),
+                        ('checkpoint', models.DateTimeField(blank=True, null=True, verbose_name='Обработаны изменения до')),
+                        ('refreshed_at', models.DateTimeField(verbose_name='Пересчитано')),
+                    ],
+                    options={
+                        'db_table': 'aggregate_checkpoints',
+                    },
+                ),
+            ],
+        ),
+    ]
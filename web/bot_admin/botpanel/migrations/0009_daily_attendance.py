@@ -0,0 +1,67 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# Дневные сводки создаёт и ведёт бот (schema.py, миграция 10), здесь та же
+# схема создаётся с IF NOT EXISTS, а модель добавляется в состояние Django.
+# В operation_edits админка записывает правки операций (signals.py), поэтому
+# таблица нужна и без запуска бота; модели у неё нет.
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('botpanel', '0008_department_daily_stats'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(
+                    sql='''
+                        CREATE TABLE IF NOT EXISTS daily_attendance (
+                            id BIGSERIAL PRIMARY KEY,
+                            user_id INTEGER NOT NULL REFERENCES users (id) ON DELETE CASCADE,
+                            day DATE NOT NULL,
+                            first_start TIMESTAMP,
+                            last_end TIMESTAMP,
+                            worked_seconds DOUBLE PRECISION NOT NULL,
+                            break_seconds DOUBLE PRECISION NOT NULL,
+                            shift_count INTEGER NOT NULL,
+                            notes TEXT,
+                            UNIQUE (user_id, day)
+                        );
+                        CREATE INDEX IF NOT EXISTS daily_attendance_day_idx ON daily_attendance (day);
+                        CREATE TABLE IF NOT EXISTS operation_edits (
+                            id BIGSERIAL PRIMARY KEY,
+                            user_id INTEGER NOT NULL,
+                            created_at TIMESTAMP NOT NULL
+                        );
+                    ''',
+                    reverse_sql='DROP TABLE IF EXISTS daily_attendance, operation_edits;',
+                ),
+            ],
+            state_operations=[
+                migrations.CreateModel(
+                    name='DailyAttendance',
+                    fields=[
+                        ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('day', models.DateField(verbose_name='День')),
+                        ('first_start', models.DateTimeField(blank=True, null=True, verbose_name='Начало первой смены')),
+                        ('last_end', models.DateTimeField(blank=True, null=True, verbose_name='Конец последней смены')),
+                        ('worked_seconds', models.FloatField(verbose_name='Отработано, сек.')),
+                        ('break_seconds', models.FloatField(verbose_name='Перерывы, сек.')),
+                        ('shift_count', models.IntegerField(verbose_name='Смен')),
+                        ('notes', models.TextField(blank=True, null=True, verbose_name='Замечания')),
+                        ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_attendance', to='botpanel.botuser')),
+                    ],
+                    options={
+                        'db_table': 'daily_attendance',
+                        'ordering': ['-day', 'user'],
+                        'indexes': [models.Index(fields=['day'], name='daily_attendance_day_idx')],
+                        'constraints': [
+                            models.UniqueConstraint(fields=('user', 'day'), name='daily_attendance_user_id_day_key'),
+                        ],
+                    },
+                ),
+            ],
+        ),
+    ]
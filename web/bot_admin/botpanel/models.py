@@ -1,3 +1,6 @@
+import os
+
+from django.conf import settings
 from django.db import models
 import datetime
 
@@ -15,14 +18,9 @@ class BotUser(models.Model):
     def current_shift_active(self):
         """
         Определяет, активна ли смена у пользователя.
-        Логика: если зафиксирована операция "start_shift", а следующей операции "end_shift"
-        после неё нет – считаем, что смена активна.
+        Смены ведёт бот в таблице shifts: незавершённая смена — запись без ended_at.
         """
-        start_op = self.operations.filter(operation="start_shift").order_by('-created_at').first()
-        if not start_op:
-            return False
-        end_op = self.operations.filter(operation="end_shift", created_at__gt=start_op.created_at).first()
-        return end_op is None
+        return self.shifts.filter(ended_at__isnull=True).exists()
 
     current_shift_active.boolean = True  # для красивого отображения галочкой в админке
 
@@ -48,6 +46,11 @@ class Operation(models.Model):
     class Meta:
         db_table = "operations"
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', 'operation', '-created_at'], name='operations_user_op_created_idx'),
+            models.Index(fields=['operation', 'created_at'], name='operations_op_created_idx'),
+            models.Index(fields=['-created_at', '-id'], name='operations_created_idx'),
+        ]
 
 
 class Weekend(models.Model):
@@ -60,3 +63,139 @@ class Weekend(models.Model):
     class Meta:
         db_table = "weekends"
         ordering = ['date']
+        # Один выходной на дату; бот занимает дату вставкой с ON CONFLICT по этому индексу
+        constraints = [
+            models.UniqueConstraint(fields=['date'], name='weekends_date_key',
+                                    violation_error_message='Этот день уже занят.'),
+        ]
+
+
+class Shift(models.Model):
+    """
+    Смена, собранная ботом из журнала operations (start_shift и ближайший end_shift).
+    Заполняется ботом, журнал operations остаётся первичным источником данных.
+    """
+    user = models.ForeignKey(BotUser, on_delete=models.CASCADE, related_name='shifts')
+    started_at = models.DateTimeField("Начало смены")
+    ended_at = models.DateTimeField("Конец смены", blank=True, null=True)
+    break_seconds = models.FloatField("Перерывы, сек.", default=0)
+    break_started_at = models.DateTimeField("Начало текущего перерыва", blank=True, null=True)
+    has_photo = models.BooleanField("Фото получено", default=False)
+
+    def __str__(self):
+        return f"{self.user} — {self.started_at.strftime('%d.%m.%Y %H:%M')}"
+
+    class Meta:
+        db_table = "shifts"
+        ordering = ['-started_at']
+        indexes = [
+            models.Index(fields=['user', '-started_at'], name='shifts_user_started_idx'),
+            models.Index(fields=['started_at'], name='shifts_started_idx'),
+            models.Index(fields=['user'], name='shifts_open_idx', condition=models.Q(ended_at__isnull=True)),
+        ]
+
+
+class Photo(models.Model):
+    """
+    Фото рабочего места к операции photo_received. Внешнего ключа на operations
+    в БД нет: её первичный ключ — (id, created_at), поэтому рядом хранится
+    и время операции. Задания на загрузку и файлы ведёт бот (photos.py): файл
+    лежит в PHOTO_DIR под именем sha256 содержимого, уменьшенная копия —
+    в PHOTO_DIR/thumbs.
+    """
+    STATUS_CHOICES = (
+        ("pending", "Ожидает загрузки"),
+        ("stored", "Сохранено"),
+        ("failed", "Ошибка загрузки"),
+    )
+    user = models.ForeignKey(BotUser, on_delete=models.CASCADE, related_name='photos')
+    operation = models.ForeignKey(Operation, verbose_name="Операция", on_delete=models.DO_NOTHING,
+                                  related_name='photos', db_constraint=False, db_index=False)
+    operation_created_at = models.DateTimeField("Время операции")
+    file_id = models.CharField("File ID", max_length=255)
+    file_unique_id = models.CharField("File unique ID", max_length=255)
+    status = models.CharField("Статус", max_length=20, choices=STATUS_CHOICES, default="pending")
+    attempts = models.IntegerField("Неудачных загрузок", default=0)
+    claimed_at = models.DateTimeField("Взято в работу", blank=True, null=True)
+    sha256 = models.CharField("SHA-256", max_length=64, blank=True, null=True)
+    size = models.IntegerField("Размер, байт", blank=True, null=True)
+    has_thumbnail = models.BooleanField("Есть уменьшенная копия", default=False)
+    stored_at = models.DateTimeField("Сохранено", blank=True, null=True)
+
+    def __str__(self):
+        return f"{self.user} — фото ({self.operation_created_at.strftime('%d.%m.%Y %H:%M:%S')})"
+
+    def file_path(self, thumbnail=False):
+        if thumbnail:
+            return os.path.join(settings.PHOTO_DIR, "thumbs", self.sha256[:2], f"{self.sha256}.jpg")
+        return os.path.join(settings.PHOTO_DIR, self.sha256[:2], f"{self.sha256}.jpg")
+
+    class Meta:
+        db_table = "photos"
+        ordering = ['-operation_created_at']
+        indexes = [
+            models.Index(fields=['user', 'operation_created_at'], name='photos_user_operation_idx'),
+            models.Index(fields=['file_unique_id'], name='photos_file_unique_idx', condition=models.Q(status='stored')),
+            models.Index(fields=['id'], name='photos_pending_idx', condition=models.Q(status='pending')),
+        ]
+
+
+class DepartmentDailyStats(models.Model):
+    """
+    Показатели отдела за день для панели посещаемости. Таблицу пересчитывает
+    бот (aggregates.py) по сменам за последние AGGREGATES_DAYS дней.
+    """
+    day = models.DateField("День")
+    department = models.CharField("Отдел", max_length=255)
+    employees = models.IntegerField("Сотрудников")
+    shifts = models.IntegerField("Смен")
+    worked_seconds = models.FloatField("Отработано, сек.")
+    break_seconds = models.FloatField("Перерывы, сек.")
+    late_starts = models.IntegerField("Опозданий")
+
+    class Meta:
+        db_table = "department_daily_stats"
+        ordering = ['-day', 'department']
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'department'], name='department_daily_stats_day_department_key'),
+        ]
+
+
+class DailyAttendance(models.Model):
+    """
+    Сводка сотрудника за день (по сменам, начатым в этот день), по ней бот
+    строит отчёты. Таблицу ведёт бот (aggregates.py), в админке она только
+    просматривается.
+    """
+    user = models.ForeignKey(BotUser, on_delete=models.CASCADE, related_name='daily_attendance')
+    day = models.DateField("День")
+    # Нет у дня только с замечаниями (shift_count = 0)
+    first_start = models.DateTimeField("Начало первой смены", blank=True, null=True)
+    last_end = models.DateTimeField("Конец последней смены", blank=True, null=True)
+    worked_seconds = models.FloatField("Отработано, сек.")
+    break_seconds = models.FloatField("Перерывы, сек.")
+    shift_count = models.IntegerField("Смен")
+    notes = models.TextField("Замечания", blank=True, null=True)
+
+    def __str__(self):
+        return f"{self.user} — {self.day.strftime('%d.%m.%Y')}"
+
+    class Meta:
+        db_table = "daily_attendance"
+        ordering = ['-day', 'user']
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'day'], name='daily_attendance_user_id_day_key'),
+        ]
+        indexes = [
+            models.Index(fields=['day'], name='daily_attendance_day_idx'),
+        ]
+
+
+class AggregateCheckpoint(models.Model):
+    """Когда бот в последний раз пересчитал сводную таблицу name."""
+    name = models.CharField("Таблица", max_length=255, primary_key=True)
+    checkpoint = models.DateTimeField("Обработаны изменения до", blank=True, null=True)
+    refreshed_at = models.DateTimeField("Пересчитано")
+
+    class Meta:
+        db_table = "aggregate_checkpoints"
@@ -0,0 +1,71 @@
+from django.db import connection
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from .models import BotUser, Operation, Weekend
+
+# Канал LISTEN/NOTIFY, который слушает бот (см. INVALIDATION_CHANNEL в db.py).
+# Уведомление уходит при фиксации транзакции, и бот сбрасывает свой кэш.
+BOT_CACHE_CHANNEL = "bot_cache"
+
+
+def notify_bot(table, key):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_notify(%s, %s)", [BOT_CACHE_CHANNEL, f"{table}:{key}"])
+
+
+def mark_all_report_days_changed():
+    # ФИО и состав пользователей есть в отчётах за любой период, поэтому
+    # отмечается особый день 0001-01-01 (ALL_DAYS в db.py) — он устаревает
+    # все сохранённые ботом отчёты.
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            INSERT INTO report_watermarks (day, changed_at)
+            VALUES ('0001-01-01', clock_timestamp()::timestamp)
+            ON CONFLICT (day) DO UPDATE SET changed_at = EXCLUDED.changed_at
+        """)
+
+
+@receiver([post_save, post_delete], sender=BotUser)
+def user_changed(sender, instance, **kwargs):
+    mark_all_report_days_changed()
+    notify_bot("users", instance.telegram_id)
+
+
+def record_operation_edits(edits):
+    # Бот пересобирает только смены вокруг этих моментов (db.apply_operation_edits);
+    # записи ждут в таблице, даже если бот сейчас не работает.
+    with connection.cursor() as cursor:
+        for user_id, created_at in edits:
+            cursor.execute("INSERT INTO operation_edits (user_id, created_at) VALUES (%s, %s)",
+                           [user_id, created_at])
+
+
+@receiver(pre_save, sender=Operation)
+def operation_saving(sender, instance, **kwargs):
+    # Прежние пользователь и время: при переносе операции меняются и старые смены
+    instance._previous = None
+    if instance.pk is not None:
+        instance._previous = Operation.objects.filter(pk=instance.pk).values_list('user_id', 'created_at').first()
+
+
+@receiver(post_save, sender=Operation)
+def operation_saved(sender, instance, **kwargs):
+    edits = {(instance.user_id, instance.created_at)}
+    previous = getattr(instance, '_previous', None)
+    if previous:
+        edits.add(previous)
+    record_operation_edits(edits)
+    for user_id in {user_id for user_id, _ in edits}:
+        notify_bot("operations", user_id)
+
+
+@receiver(post_delete, sender=Operation)
+def operation_deleted(sender, instance, **kwargs):
+    record_operation_edits([(instance.user_id, instance.created_at)])
+    notify_bot("operations", instance.user_id)
+
+
+@receiver([post_save, post_delete], sender=Weekend)
+def weekend_changed(sender, instance, **kwargs):
+    notify_bot("weekends", instance.date.isoformat())
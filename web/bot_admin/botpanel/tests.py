@@ -1,3 +1,167 @@
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import IntegrityError, connection, transaction
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .admin import EstimatedCountPaginator
+from .models import BotUser, Operation, Shift, DepartmentDailyStats, AggregateCheckpoint, DailyAttendance, Weekend
+
+
+class AdminChangelistTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+
+    def add_users(self, count):
+        now = timezone.now()
+        for _ in range(count):
+            user = BotUser.objects.create(telegram_id=str(BotUser.objects.count() + 1),
+                                          full_name=f'Сотрудник {BotUser.objects.count() + 1}')
+            Operation.objects.create(user=user, operation='start_shift')
+            Shift.objects.create(user=user, started_at=now)
+
+    def add_attendance(self, count):
+        self.add_users(count)
+        now = timezone.now()
+        DailyAttendance.objects.bulk_create(
+            DailyAttendance(user=user, day=now.date(), first_start=now, worked_seconds=27000, break_seconds=1800,
+                            shift_count=1)
+            for user in BotUser.objects.filter(daily_attendance__isnull=True)
+        )
+
+    def page_queries(self, url):
+        # Первый запрос страницы заполняет кэши (типы содержимого и т.п.)
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_user_changelist_queries_do_not_grow_with_rows(self):
+        url = reverse('admin:botpanel_botuser_changelist')
+        self.add_users(2)
+        few = self.page_queries(url)
+        self.add_users(20)
+        self.assertEqual(self.page_queries(url), few)
+
+    def test_operation_changelist_queries_do_not_grow_with_rows(self):
+        url = reverse('admin:botpanel_operation_changelist')
+        self.add_users(2)
+        few = self.page_queries(url)
+        self.add_users(20)
+        self.assertEqual(self.page_queries(url), few)
+
+    def test_operation_changelist_filters_by_telegram_id(self):
+        self.add_users(3)
+        response = self.client.get(reverse('admin:botpanel_operation_changelist'), {'telegram_id': '2'})
+        self.assertEqual(response.context['cl'].result_count, 1)
+        self.assertEqual(response.context['cl'].result_list[0].user.telegram_id, '2')
+
+    def test_daily_attendance_changelist_queries_do_not_grow_with_rows(self):
+        url = reverse('admin:botpanel_dailyattendance_changelist')
+        self.add_attendance(2)
+        few = self.page_queries(url)
+        self.add_attendance(20)
+        response = self.client.get(url, {'telegram_id': '1'})
+        self.assertContains(response, '7:30')
+        self.assertEqual(self.page_queries(url), few)
+
+    def test_user_page_shows_recent_operations_only(self):
+        self.add_users(1)
+        user = BotUser.objects.get()
+        Operation.objects.bulk_create(Operation(user=user, operation='photo_received') for _ in range(80))
+        response = self.client.get(reverse('admin:botpanel_botuser_change', args=(user.pk,)))
+        formset = response.context['inline_admin_formsets'][0].formset
+        self.assertEqual(formset.initial_form_count(), formset.max_rows)
+
+    def test_user_page_queries_do_not_grow_with_operations(self):
+        self.add_users(1)
+        user = BotUser.objects.get()
+        url = reverse('admin:botpanel_botuser_change', args=(user.pk,))
+        few = self.page_queries(url)
+        Operation.objects.bulk_create(Operation(user=user, operation='photo_received') for _ in range(20))
+        self.assertEqual(self.page_queries(url), few)
+
+
+class EstimatedCountPaginatorTests(TestCase):
+    def test_estimates_large_tables(self):
+        user = BotUser.objects.create(telegram_id='1')
+        Operation.objects.bulk_create(Operation(user=user, operation='start_shift') for _ in range(200))
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE operations')
+
+        paginator = EstimatedCountPaginator(Operation.objects.all(), 100)
+        paginator.exact_count_limit = 0
+        self.assertGreater(paginator.count, 0)
+
+        filtered = EstimatedCountPaginator(Operation.objects.filter(user=user), 100)
+        filtered.exact_count_limit = 0
+        self.assertGreater(filtered.count, 0)
+
+    def test_counts_small_tables_exactly(self):
+        user = BotUser.objects.create(telegram_id='1')
+        Operation.objects.bulk_create(Operation(user=user, operation='start_shift') for _ in range(3))
+        self.assertEqual(EstimatedCountPaginator(Operation.objects.all(), 100).count, 3)
+
+
+class DashboardTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        now = timezone.now()
+        user = BotUser.objects.create(telegram_id='1', full_name='Иванов', department='Склад')
+        Shift.objects.create(user=user, started_at=now - timedelta(hours=2), break_started_at=now)
+        AggregateCheckpoint.objects.create(name='department_daily_stats', refreshed_at=now)
+        DepartmentDailyStats.objects.create(day=now.date(), department='Склад', employees=1, shifts=1,
+                                            worked_seconds=7200, break_seconds=1800, late_starts=1)
+
+    def test_shows_live_state_and_aggregates(self):
+        response = self.client.get(reverse('dashboard'))
+        self.assertContains(response, 'Иванов')
+        self.assertContains(response, '2.0 / 0.5 / 1')
+        self.assertIn('max-age', response['Cache-Control'])
+
+    def test_cached_fragments_skip_queries(self):
+        url = reverse('dashboard')
+        with CaptureQueriesContext(connection) as cold:
+            self.client.get(url)
+        with CaptureQueriesContext(connection) as warm:
+            response = self.client.get(url)
+        self.assertContains(response, 'Иванов')
+        self.assertLess(len(warm), len(cold))
+        self.assertFalse(any('FROM "department_daily_stats"' in query['sql'] for query in warm.captured_queries))
+
+
+class WeekendTests(TestCase):
+    def test_date_is_booked_once(self):
+        first = BotUser.objects.create(telegram_id='1')
+        second = BotUser.objects.create(telegram_id='2')
+        day = timezone.now().date()
+        Weekend.objects.create(user=first, date=day)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Weekend.objects.create(user=second, date=day)
+        Weekend.objects.create(user=second, date=day + timedelta(days=1))
+        self.assertEqual(Weekend.objects.count(), 2)
+
+
+class OperationEditTests(TestCase):
+    def edits(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT user_id, created_at FROM operation_edits ORDER BY created_at")
+            return cursor.fetchall()
 
-# Create your tests here.
+    def test_moved_operation_records_old_and_new_time(self):
+        user = BotUser.objects.create(telegram_id='1')
+        operation = Operation.objects.create(user=user, operation='end_shift')
+        created_at = Operation.objects.get(pk=operation.pk).created_at
+        operation.created_at = created_at - timedelta(hours=2)
+        operation.save()
+        operation.delete()
+        # Создание, перенос (старое и новое время) и удаление
+        moved = created_at - timedelta(hours=2)
+        self.assertEqual(self.edits(), [(user.id, moved), (user.id, moved), (user.id, created_at),
+                                        (user.id, created_at)])
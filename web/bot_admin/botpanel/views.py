@@ -1,3 +1,93 @@
+from datetime import timedelta
+from functools import partial
+
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.admin.views.decorators import staff_member_required
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncWeek
+from django.http import FileResponse, Http404
 from django.shortcuts import render
+from django.utils import timezone
+from django.views.decorators.cache import cache_control
+
+from .models import Photo, Shift, DepartmentDailyStats, AggregateCheckpoint
+
+# Дни и недели в таблицах панели (в пределах AGGREGATES_DAYS бота)
+DASHBOARD_DAYS = 7
+DASHBOARD_WEEKS = 8
+
+# Незавершённые смены старше этого считаются забытыми и в "сейчас на смене" не попадают
+LIVE_SHIFT_MAX_AGE = timedelta(days=1)
+
+
+@staff_member_required
+def photo_file(request, kind, sha256):
+    """Фото рабочего места (или уменьшенная копия) из каталога бота, только для сотрудников."""
+    photo = Photo(sha256=sha256)
+    try:
+        return FileResponse(open(photo.file_path(thumbnail=kind == 'thumb'), 'rb'), content_type='image/jpeg')
+    except FileNotFoundError:
+        raise Http404
+
+
+def live_status():
+    """Кто сейчас на смене и на перерыве: по отделам и список перерывов."""
+    open_shifts = Shift.objects.filter(ended_at__isnull=True, started_at__gte=timezone.now() - LIVE_SHIFT_MAX_AGE)
+    departments = (
+        open_shifts.values('user__department')
+        .annotate(on_shift=Count('id'), on_break=Count('id', filter=Q(break_started_at__isnull=False)))
+        .order_by('user__department')
+    )
+    on_break = open_shifts.filter(break_started_at__isnull=False).select_related('user').order_by('break_started_at')
+    return {'departments': list(departments), 'on_break': list(on_break)}
+
+
+def pivot(rows, column):
+    """Строки по отделу и column -> (столбцы, [(отдел, [ячейка или None, ...]), ...])."""
+    columns = sorted({row[column] for row in rows})
+    cells = {}
+    for row in rows:
+        cells.setdefault(row['department'], {})[row[column]] = {
+            'worked_hours': row['worked'] / 3600,
+            'break_hours': row['breaks'] / 3600,
+            'late_starts': row['late'],
+        }
+    return columns, [(department or "—", [by_column.get(c) for c in columns])
+                     for department, by_column in sorted(cells.items())]
+
+
+def aggregate_table(stats, column):
+    rows = stats.values('department', column).annotate(
+        worked=Sum('worked_seconds'), breaks=Sum('break_seconds'), late=Sum('late_starts'),
+    ).order_by()
+    columns, departments = pivot(rows, column)
+    return {'columns': columns, 'departments': departments}
+
 
-# Create your views here.
+@staff_member_required
+@cache_control(private=True, max_age=settings.DASHBOARD_CACHE_SECONDS)
+def dashboard(request):
+    """
+    Панель посещаемости. Показатели по дням и неделям читаются из сводной
+    таблицы, которую пересчитывает бот, а не из журнала operations. Фрагменты
+    страницы кэшируются: сводные — до следующего пересчёта (время пересчёта
+    входит в ключ), текущее состояние — на DASHBOARD_CACHE_SECONDS; таблицы
+    передаются в шаблон функциями и вычисляются только при промахе кэша.
+    """
+    refreshed_at = (AggregateCheckpoint.objects.filter(name='department_daily_stats')
+                    .values_list('refreshed_at', flat=True).first())
+    # Даты сводной таблицы — даты сервера БД на момент пересчёта
+    today = refreshed_at.date() if refreshed_at else timezone.localdate()
+    first_week = today - timedelta(days=today.weekday(), weeks=DASHBOARD_WEEKS - 1)
+    stats = DepartmentDailyStats.objects.all()
+    context = {
+        **admin.site.each_context(request),
+        'title': "Панель посещаемости",
+        'refreshed_at': refreshed_at,
+        'cache_seconds': settings.DASHBOARD_CACHE_SECONDS,
+        'live': live_status,
+        'daily': partial(aggregate_table, stats.filter(day__gt=today - timedelta(days=DASHBOARD_DAYS)), 'day'),
+        'weekly': partial(aggregate_table, stats.filter(day__gte=first_week).annotate(week=TruncWeek('day')), 'week'),
+    }
+    return render(request, 'botpanel/dashboard.html', context)